@@ -1,97 +1,94 @@
 from docx import Document
-from docx.oxml import OxmlElement
-from .merge_fields import (
-    create_merge_field,
-    create_if_field,
-    create_merge_field_with_formatting,
-    create_if_field_with_formatting,
-)
+from docx.text.paragraph import Paragraph
+from .merge_fields import create_if_field_with_formatting, if_field
+from components.fields import MergeField, append_runs, field_run
+from components.mapping_index import get_mapping_index
+from components.matcher import compile_matcher, mapping_fingerprint
+from components.paragraph_cache import get_paragraph_cache
+from components.runs import ParagraphText
+from components.stories import Stories
+from docx.oxml.ns import qn
+import logging
 import re
 
+logger = logging.getLogger(__name__)
 
-def _get_if_field_code(condition_title, mappings):
-    condition_key = mappings.get(condition_title)
-    special_html_mappings = {
-        "ab-ubegraenset-fuldmagt": "Html:x-fuldmagtsbetingelse",
-    }
-    true_result_key = None
-    if condition_key and condition_key in special_html_mappings:
-        true_result_key = special_html_mappings[condition_key]
-    elif condition_key:
-        if f"Html:{condition_key}" in mappings.values():
-            for k, v in mappings.items():
-                if v == f"Html:{condition_key}":
-                    true_result_key = v
-                    break
-        if not true_result_key:
-            suffix = None
-            if "-" in condition_key:
-                suffix = condition_key.split("-", 1)[1]
-            elif ":" in condition_key:
-                suffix = condition_key.split(":", 1)[1]
-            if suffix:
-                for k, v in mappings.items():
-                    if v.startswith("Html:") and suffix in v:
-                        true_result_key = v
-                        break
-    if (
-        not true_result_key
-        and condition_key
-        and condition_title == "Ubegrænset fuldmagt"
-    ):
-        true_result_key = "Html:x-fuldmagtsbetingelse"
+
+def _get_if_field_code(condition_title, index):
+    # Key and Html companion lookups are precomputed in the mapping's
+    # MappingIndex; titles that differ slightly from the key list are matched
+    # approximately and logged with their confidence
+    condition_key, true_result_key, confidence = index.resolve(condition_title)
+    if condition_key and confidence < 1.0:
+        logger.info(
+            "Condition %r matched %s approximately (confidence %.2f)",
+            condition_title,
+            condition_key,
+            confidence,
+        )
     return condition_key, true_result_key
 
 
-def process_paragraph(paragraph, text, mappings):
+def process_paragraph(paragraph, text, mappings, matcher=None, index=None):
     # Replace all 'If betingelse <condition>' with IF fields, rest with merge fields
-    sorted_mappings = sorted(mappings.items(), key=lambda x: len(x[0]), reverse=True)
+    # matcher/index: the mapping's compiled matcher and MappingIndex, if the
+    # caller already has them
+    matcher = matcher or compile_matcher(mappings)
+    index = index or get_mapping_index(mappings)
     p = paragraph._p
     for child in list(p):
         p.remove(child)
 
     # Regex to find all 'If betingelse <condition>' (case-insensitive)
     pattern = re.compile(r"[Ii]f betingelse ([^\”\"]+)")
+    # Text and fields of the paragraph, appended in one go
+    items = []
     pos = 0
     for match in pattern.finditer(text):
         start, end = match.span()
         # Add text before the match
         if start > pos:
-            _add_mergefields_to_text(paragraph, text[pos:start], sorted_mappings)
+            items.extend(_mergefield_items(text[pos:start], matcher))
         condition_title = match.group(1).strip()
-        condition_key, true_result_key = _get_if_field_code(condition_title, mappings)
-        run = paragraph.add_run()
-        r = run._r
+        condition_key, true_result_key = _get_if_field_code(condition_title, index)
         if condition_key and true_result_key:
-            create_if_field(r, condition_key, true_result_key)
+            items.append(if_field(condition_key, true_result_key))
         else:
-            run.add_text(match.group(0))
+            items.append(match.group(0))
         pos = end
     # Add any remaining text after last match
     if pos < len(text):
-        _add_mergefields_to_text(paragraph, text[pos:], sorted_mappings)
+        items.extend(_mergefield_items(text[pos:], matcher))
+    append_runs(p, items)
     return paragraph
 
 
-def _add_mergefields_to_text(paragraph, text, sorted_mappings):
-    # Replace all mapped titles with merge fields, rest as text
-    remaining_text = text
-    while remaining_text:
-        match_found = False
-        for titel, nogle in sorted_mappings:
-            idx = remaining_text.find(titel)
-            if idx != -1:
-                if idx > 0:
-                    paragraph.add_run(remaining_text[:idx])
-                run = paragraph.add_run()
-                r = run._r
-                create_merge_field(r, nogle)
-                remaining_text = remaining_text[idx + len(titel) :]
-                match_found = True
-                break
-        if not match_found:
-            paragraph.add_run(remaining_text)
-            break
+def _mergefield_items(text, matcher):
+    # Replace all mapped titles with merge fields in one scan, rest as text
+    items = []
+    pos = 0
+    for start, end, titel, nogle in matcher.finditer(text):
+        if start > pos:
+            items.append(text[pos:start])
+        items.append(MergeField(nogle))
+        pos = end
+    if pos < len(text):
+        items.append(text[pos:])
+    return items
+
+
+def _formatted_merge_field(nogle):
+    # Field run keeping the matched text's formatting, minus color/highlight
+    def build(rPr):
+        r = field_run(MergeField(nogle), rPr)
+        if rPr is not None:
+            rPr = r[0]
+            for tag in ("w:color", "w:highlight"):
+                for child in rPr.findall(qn(tag)):
+                    rPr.remove(child)
+        return [r]
+
+    return build
 
 
 def create_document_with_merge_fields(template_text, mappings):
@@ -100,6 +97,10 @@ def create_document_with_merge_fields(template_text, mappings):
     doc = Document()
     paragraphs = template_text.split("\n")
     debug_output = []
+    # Look the mapping's structures up once, not per paragraph
+    fingerprint = mapping_fingerprint(mappings)
+    matcher = compile_matcher(mappings, fingerprint)
+    index = get_mapping_index(mappings, fingerprint)
     pattern = re.compile(r"[Ii]f betingelse ([^\”\"]+)")
     for para_text in paragraphs:
         if para_text.strip():
@@ -110,11 +111,11 @@ def create_document_with_merge_fields(template_text, mappings):
                 # Add text before the match, replacing mapped titles
                 if start > pos:
                     debug_line += _replace_titles_with_mergefields(
-                        para_text[pos:start], mappings
+                        para_text[pos:start], matcher
                     )
                 condition_title = match.group(1).strip()
                 condition_key, true_result_key = _get_if_field_code(
-                    condition_title, mappings
+                    condition_title, index
                 )
                 if condition_key and true_result_key:
                     debug_line += f'{{ IF "{{ MERGEFIELD {condition_key} }}" = "J" "din" "jeres" }}'
@@ -123,25 +124,24 @@ def create_document_with_merge_fields(template_text, mappings):
                 pos = end
             # Add any remaining text after last match
             if pos < len(para_text):
-                debug_line += _replace_titles_with_mergefields(
-                    para_text[pos:], mappings
-                )
+                debug_line += _replace_titles_with_mergefields(para_text[pos:], matcher)
             debug_output.append(debug_line)
             p = doc.add_paragraph()
-            process_paragraph(p, para_text, mappings)
+            process_paragraph(p, para_text, mappings, matcher, index)
     return doc, "\n".join(debug_output)
 
 
-def _replace_titles_with_mergefields(text, mappings):
+def _replace_titles_with_mergefields(text, matcher):
     # Replace all mapped titles with merge field code strings
-    sorted_mappings = sorted(mappings.items(), key=lambda x: len(x[0]), reverse=True)
-    result = text
-    for titel, nogle in sorted_mappings:
-        result = result.replace(titel, f"{{ MERGEFIELD {nogle} }}")
-    return result
+    return matcher.sub(lambda titel, nogle: f"{{ MERGEFIELD {nogle} }}", text)
 
 
-def process_docx_template(doc, mappings):
+def process_docx_template(doc, mappings, paragraph_cache=None):
+    # paragraph_cache: a ParagraphCache, None for the process-wide one, False to
+    # convert every paragraph
+    # Every story part of the package: body (tables, text boxes included),
+    # headers, footers, footnotes and endnotes
+    stories = Stories(doc)
     # Remove all comments from the document
     if hasattr(doc, "part") and hasattr(doc.part, "package"):
         # Remove comments part if it exists
@@ -155,16 +155,13 @@ def process_docx_template(doc, mappings):
                 break
         if comments_part:
             # Remove all comment references in the document
-            for para in doc.paragraphs:
-                p = para._p
-                comment_refs = p.findall(".//w:commentRangeStart", namespaces=p.nsmap)
-                for ref in comment_refs:
-                    ref.getparent().remove(ref)
-                comment_refs = p.findall(".//w:commentRangeEnd", namespaces=p.nsmap)
-                for ref in comment_refs:
-                    ref.getparent().remove(ref)
-                comment_refs = p.findall(".//w:commentReference", namespaces=p.nsmap)
-                for ref in comment_refs:
+            comment_tags = [
+                qn("w:commentRangeStart"),
+                qn("w:commentRangeEnd"),
+                qn("w:commentReference"),
+            ]
+            for _, root in stories.parts:
+                for ref in list(root.iter(*comment_tags)):
                     ref.getparent().remove(ref)
             # Remove the comments part from the package
             if comments_part.partname in doc.part.package.parts:
@@ -173,49 +170,22 @@ def process_docx_template(doc, mappings):
             for rel_id, rel in list(doc.part.rels.items()):
                 if rel.target_part == comments_part:
                     doc.part.rels.pop(rel_id)
-    sorted_mappings = sorted(mappings.items(), key=lambda x: len(x[0]), reverse=True)
-    debug_output = []
-    for para in doc.paragraphs:
-        para_text = para.text
-        if not para_text.strip():
-            continue
+    # Hash the mapping once: the fingerprint finds the compiled matcher and the
+    # MappingIndex and is the paragraph cache version
+    fingerprint = mapping_fingerprint(mappings)
+    matcher = compile_matcher(mappings, fingerprint)
+    index = get_mapping_index(mappings, fingerprint)
+    cache = get_paragraph_cache() if paragraph_cache is None else paragraph_cache
+
+    def convert_paragraph(para, para_text, debug_lines):
         if para_text.strip().startswith("IF Betingelse "):
             condition_title = para_text.strip()[len("IF Betingelse ") :]
-            condition_key = mappings.get(condition_title)
-            special_html_mappings = {
-                "ab-ubegraenset-fuldmagt": "Html:x-fuldmagtsbetingelse"
-            }
-            true_result_key = None
-            if condition_key and condition_key in special_html_mappings:
-                true_result_key = special_html_mappings[condition_key]
-            elif condition_key:
-                if f"Html:{condition_key}" in mappings.values():
-                    for k, v in mappings.items():
-                        if v == f"Html:{condition_key}":
-                            true_result_key = v
-                            break
-                if not true_result_key:
-                    suffix = None
-                    if "-" in condition_key:
-                        suffix = condition_key.split("-", 1)[1]
-                    elif ":" in condition_key:
-                        suffix = condition_key.split(":", 1)[1]
-                    if suffix:
-                        for k, v in mappings.items():
-                            if v.startswith("Html:") and suffix in v:
-                                true_result_key = v
-                                break
-            if (
-                not true_result_key
-                and condition_key
-                and condition_title == "Ubegrænset fuldmagt"
-            ):
-                true_result_key = "Html:x-fuldmagtsbetingelse"
+            condition_key, true_result_key = _get_if_field_code(condition_title, index)
             if condition_key and true_result_key:
                 debug_para = f'{{ IF "J" = "{{ MERGEFIELD {condition_key} }}" "{{ MERGEFIELD {true_result_key} }}" }}'
             else:
                 debug_para = para_text
-            debug_output.append(debug_para)
+            debug_lines.append(debug_para)
             if len(para.runs) > 0:
                 original_run = para.runs[0]
                 for run in list(para.runs):
@@ -245,46 +215,49 @@ def process_docx_template(doc, mappings):
                 else:
                     run.text = para_text
         else:
-            run_data = [(run, run.text) for run in para.runs]
-            debug_para = para_text
-            for titel, nogle in sorted_mappings:
-                if titel in debug_para:
-                    debug_para = debug_para.replace(titel, f"{{ MERGEFIELD {nogle} }}")
-            debug_output.append(debug_para)
-            for i, (run, run_text) in enumerate(run_data):
-                if not run_text.strip():
-                    continue
-                replaced = False
-                for titel, nogle in sorted_mappings:
-                    if titel in run_text:
-                        original_format = run._element
-                        parts = run_text.split(titel)
-                        run._element.clear_content()
-                        if parts[0]:
-                            run.text = parts[0]
-                        # Insert merge field and remove color/highlight from this run
-                        create_merge_field_with_formatting(run._element, nogle, run)
-                        run.font.color.rgb = None
-                        if hasattr(run.font, "highlight_color"):
-                            run.font.highlight_color = None
-                        if len(parts) > 1 and parts[1]:
-                            new_run = para.add_run(parts[1])
-                            new_run.bold = run.bold
-                            new_run.italic = run.italic
-                            new_run.underline = run.underline
-                            if run.font.name:
-                                new_run.font.name = run.font.name
-                            if run.font.size:
-                                new_run.font.size = run.font.size
-                            if run.font.color.rgb:
-                                new_run.font.color.rgb = run.font.color.rgb
-                            if (
-                                hasattr(new_run.font, "highlight_color")
-                                and run.font.highlight_color
-                            ):
-                                new_run.font.highlight_color = run.font.highlight_color
-                        replaced = True
-                        break
-                if not replaced:
-                    pass
+            # Match titles once over the whole paragraph text, so titles split
+            # across runs are found, then rebuild only the runs they touch
+            text = ParagraphText(para._p)
+            spans = [
+                (start, end, _formatted_merge_field(nogle))
+                for start, end, titel, nogle in matcher.finditer(text.text)
+            ]
+            debug_lines.append(
+                matcher.sub(lambda titel, nogle: f"{{ MERGEFIELD {nogle} }}", para_text)
+            )
+            text.rewrite(spans)
+
+    debug_output = []
+    for _, p in stories.paragraphs():
+        para = Paragraph(p, None)
+        para_text = para.text
+        if not para_text.strip():
+            continue
+        if cache is False:
+            convert_paragraph(para, para_text, debug_output)
+            continue
+        if not para_text.strip().startswith("IF Betingelse ") and not any(
+            True for _ in matcher.finditer(para_text)
+        ):
+            # No title to convert: one scan is cheaper than serializing and
+            # hashing the paragraph for the cache
+            debug_output.append(para_text)
+            continue
+        # Paragraphs converted before with this key list come from the cache,
+        # together with their debug line
+        source = cache.source(para._p)
+        if not cache.cacheable(source):
+            convert_paragraph(para, para_text, debug_output)
+            continue
+        key = cache.key(source, "document_processing", fingerprint)
+        entry = cache.get(key)
+        if entry is not None:
+            cache.apply(para._p, entry)
+            debug_output.extend(entry.extra)
+            continue
+        debug_lines = []
+        convert_paragraph(para, para_text, debug_lines)
+        cache.record(key, source, para._p, extra=debug_lines)
+        debug_output.extend(debug_lines)
+    stories.flush()
     return doc, "\n".join(debug_output)
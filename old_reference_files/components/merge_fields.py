@@ -1,21 +1,9 @@
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
+from components.fields import Compare, IfField, MergeField, field_elements
 
 
 def create_merge_field(parent, key):
     """Create a MERGEFIELD in Word XML format"""
-    begin = OxmlElement("w:fldChar")
-    begin.set(qn("w:fldCharType"), "begin")
-    parent.append(begin)
-
-    instr = OxmlElement("w:instrText")
-    instr.set(qn("xml:space"), "preserve")
-    instr.text = f" MERGEFIELD {key} "
-    parent.append(instr)
-
-    end = OxmlElement("w:fldChar")
-    end.set(qn("w:fldCharType"), "end")
-    parent.append(end)
+    parent.extend(field_elements(MergeField(key)))
 
 
 def create_if_field(parent, condition_key, true_result_key):
@@ -23,73 +11,20 @@ def create_if_field(parent, condition_key, true_result_key):
     Create a nested IF field in Word XML:
     { IF "J" = "{ MERGEFIELD <condition_key> }" "{ MERGEFIELD <true_result_key> }" }
     """
-    begin = OxmlElement("w:fldChar")
-    begin.set(qn("w:fldCharType"), "begin")
-    parent.append(begin)
-
-    instr = OxmlElement("w:instrText")
-    instr.set(qn("xml:space"), "preserve")
-    instr.text = f' IF "J" = "'
-    parent.append(instr)
-
-    create_merge_field(parent, condition_key)
+    parent.extend(field_elements(if_field(condition_key, true_result_key)))
 
-    instr2 = OxmlElement("w:instrText")
-    instr2.set(qn("xml:space"), "preserve")
-    instr2.text = f'" "'
-    parent.append(instr2)
 
-    create_merge_field(parent, true_result_key)
-
-    instr3 = OxmlElement("w:instrText")
-    instr3.set(qn("xml:space"), "preserve")
-    instr3.text = '"'
-    parent.append(instr3)
-
-    end = OxmlElement("w:fldChar")
-    end.set(qn("w:fldCharType"), "end")
-    parent.append(end)
+def if_field(condition_key, true_result_key):
+    # Shows the Html block true_result_key when condition_key is "J"
+    return IfField(
+        Compare("J", "=", MergeField(condition_key)), MergeField(true_result_key)
+    )
 
 
 def create_merge_field_with_formatting(parent, key, run=None):
-    begin = OxmlElement("w:fldChar")
-    begin.set(qn("w:fldCharType"), "begin")
-    parent.append(begin)
-
-    instr = OxmlElement("w:instrText")
-    instr.set(qn("xml:space"), "preserve")
-    instr.text = f" MERGEFIELD {key} "
-    parent.append(instr)
-
-    end = OxmlElement("w:fldChar")
-    end.set(qn("w:fldCharType"), "end")
-    parent.append(end)
+    # The formatting is on the run the field is put into
+    create_merge_field(parent, key)
 
 
 def create_if_field_with_formatting(parent, condition_key, true_result_key, run=None):
-    begin = OxmlElement("w:fldChar")
-    begin.set(qn("w:fldCharType"), "begin")
-    parent.append(begin)
-
-    instr = OxmlElement("w:instrText")
-    instr.set(qn("xml:space"), "preserve")
-    instr.text = f' IF "J" = "'
-    parent.append(instr)
-
-    create_merge_field_with_formatting(parent, condition_key, run)
-
-    instr2 = OxmlElement("w:instrText")
-    instr2.set(qn("xml:space"), "preserve")
-    instr2.text = f'" "'
-    parent.append(instr2)
-
-    create_merge_field_with_formatting(parent, true_result_key, run)
-
-    instr3 = OxmlElement("w:instrText")
-    instr3.set(qn("xml:space"), "preserve")
-    instr3.text = '"'
-    parent.append(instr3)
-
-    end = OxmlElement("w:fldChar")
-    end.set(qn("w:fldCharType"), "end")
-    parent.append(end)
+    create_if_field(parent, condition_key, true_result_key)
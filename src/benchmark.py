@@ -0,0 +1,402 @@
+"""
+Benchmarks for the mapping, replacement and docx conversion hot paths.
+
+Generates synthetic key lists (Titel/Nøgle CSV files) and letters, times
+load_excel_mapping (cold and warm index), replace_titels_with_nogle,
+text_to_word_docx, convert_text_to_mergefields, the streaming converter and
+process_docx_template, and writes wall time, peak memory and throughput as JSON
+so runs on different commits can be compared. Peak memory is measured with
+tracemalloc in a separate untimed run; it covers Python allocations, not lxml's
+own C buffers. Input generation is seeded, so every run measures the same data.
+
+Usage (from the src directory):
+    python benchmark.py
+    python benchmark.py --quick
+    python benchmark.py --paragraphs 100 1000 --rows 1000 --output before.json
+    python benchmark.py --quick --output after.json --compare before.json
+"""
+
+import argparse
+import csv
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# process_docx_template lives with the reference implementation
+REFERENCE_DIR = os.path.join(os.path.dirname(SRC_DIR), "old_reference_files")
+
+DEFAULT_PARAGRAPHS = [10, 100, 1000, 10000]
+DEFAULT_ROWS = [1000, 10000, 100000]
+QUICK_PARAGRAPHS = [10, 100]
+QUICK_ROWS = [1000]
+
+_WORDS = (
+    "vi har modtaget din ansøgning om ældrecheck og lægger vægt på at du "
+    "opfylder betingelserne for ydelsen i perioden samt formue pension bolig "
+    "kommune afgørelse oplysninger skattestyrelsen borger samlever ægtefælle"
+).split()
+
+
+# --- Synthetic data ---
+
+
+def make_mapping(rows: int, seed: int = 0) -> dict:
+    """
+    Build a Titel -> Nøgle mapping with ``rows`` distinct entries.
+
+    Args:
+        rows (int): Number of rows.
+        seed (int, optional): Random seed.
+
+    Returns:
+        dict: The mapping.
+    """
+    rng = random.Random(seed)
+    mapping = {}
+    for i in range(rows):
+        first, second = rng.sample(_WORDS, 2)
+        mapping[f"{first.capitalize()} {second} {i}"] = f"ab-{first}-{second}-{i}"
+    return mapping
+
+
+def write_mapping_csv(mapping: dict, path: str):
+    # Same layout as the exported key list: ';'-separated with a BOM
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["Titel", "Nøgle"])
+        writer.writerows(mapping.items())
+
+
+def make_letter(paragraphs: int, mapping: dict, seed: int = 0) -> str:
+    """
+    Build a letter with one title per paragraph, a MERGEFIELD placeholder in
+    every fifth paragraph and an IF placeholder line in every twentieth.
+
+    Args:
+        paragraphs (int): Number of paragraphs (lines).
+        mapping (dict): Titles and keys to use.
+        seed (int, optional): Random seed.
+
+    Returns:
+        str: The letter, one paragraph per line.
+    """
+    rng = random.Random(seed)
+    titles = list(mapping)
+    lines = []
+    for i in range(paragraphs):
+        if i % 20 == 19:
+            key = mapping[rng.choice(titles)]
+            lines.append(f'{{ IF "J" "{{ MERGEFIELD {key} }}" "dine" "jeres" }}')
+            continue
+        words = [rng.choice(_WORDS) for _ in range(12)]
+        words.insert(rng.randrange(len(words)), rng.choice(titles))
+        if i % 5 == 4:
+            words.append(f"{{ MERGEFIELD {mapping[rng.choice(titles)]} }}")
+        line = " ".join(words)
+        lines.append(line[0].upper() + line[1:] + ".")
+    return "\n".join(lines)
+
+
+# --- Measurement ---
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """
+    Time ``func`` ``repeat`` times, then run it once more under tracemalloc.
+
+    Args:
+        func (callable): Called with the result of ``setup()`` (if given).
+        repeat (int): Number of timed runs.
+        setup (callable, optional): Untimed preparation before each run.
+
+    Returns:
+        dict: min_seconds, mean_seconds and peak_bytes.
+    """
+    times = []
+    for _ in range(repeat + 1):
+        args = (setup(),) if setup else ()
+        gc.collect()
+        started = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - started)
+    args = (setup(),) if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "first_seconds": times[0],
+        "min_seconds": min(times[1:]),
+        "mean_seconds": sum(times[1:]) / repeat,
+        "peak_bytes": peak,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Cases ---
+
+
+def run_benchmarks(paragraph_sizes, row_sizes, repeat=3, progress=None) -> dict:
+    """
+    Run every case over the given sizes.
+
+    Args:
+        paragraph_sizes (list): Letter sizes in paragraphs.
+        row_sizes (list): Key list sizes in rows.
+        repeat (int, optional): Timed runs per case.
+        progress (callable, optional): Called with each result dict.
+
+    Returns:
+        dict: {"meta": {...}, "results": [...]}.
+    """
+    for path in (SRC_DIR, REFERENCE_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from docx import Document
+
+    from components import tools
+    from components.docx_stream import convert_bytes
+    from components.document_processing import process_docx_template
+    from components.mapping_cache import load_compiled_mapping
+    from components.mapping_registry import MappingVersion, use_version
+    from components.paragraph_cache import ParagraphCache
+
+    results = []
+    saved_cache_dir = os.environ.get("BREVKODER_CACHE_DIR")
+
+    def record(case, paragraphs, rows, units, unit, stats):
+        result = {
+            "case": case,
+            "paragraphs": paragraphs,
+            "rows": rows,
+            **stats,
+            "throughput": (
+                units / stats["min_seconds"] if stats["min_seconds"] else None
+            ),
+            "unit": unit,
+        }
+        results.append(result)
+        if progress:
+            progress(result)
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="brevkoder-bench-") as work_dir:
+            # Letter-only cases use the smallest key list for their titles
+            letter_mapping = make_mapping(min(row_sizes))
+            for paragraphs in paragraph_sizes:
+                text = make_letter(paragraphs, letter_mapping)
+                docx = tools.text_to_word_docx(text)
+
+                stats = measure(lambda: tools.text_to_word_docx(text), repeat)
+                record(
+                    "text_to_word_docx",
+                    paragraphs,
+                    None,
+                    paragraphs,
+                    "paragraphs/s",
+                    stats,
+                )
+
+                # Without the paragraph cache, then with one the first (untimed)
+                # run fills
+                for case, cache in (
+                    ("convert_text_to_mergefields", False),
+                    ("convert_text_to_mergefields (warm cache)", ParagraphCache()),
+                ):
+                    stats = measure(
+                        lambda source: tools.convert_text_to_mergefields(
+                            source, io.BytesIO(), paragraph_cache=cache
+                        ),
+                        repeat,
+                        setup=lambda: io.BytesIO(docx),
+                    )
+                    record(case, paragraphs, None, paragraphs, "paragraphs/s", stats)
+
+                stats = measure(lambda: convert_bytes(docx), repeat)
+                record(
+                    "convert_docx_stream",
+                    paragraphs,
+                    None,
+                    paragraphs,
+                    "paragraphs/s",
+                    stats,
+                )
+
+            for rows in row_sizes:
+                mapping = make_mapping(rows)
+                csv_path = os.path.join(work_dir, f"mapping-{rows}.csv")
+                write_mapping_csv(mapping, csv_path)
+                cold_dirs = iter(range(repeat + 2))
+
+                stats = measure(
+                    lambda cache_dir: load_compiled_mapping(
+                        csv_path, cache_dir
+                    ).as_dict(),
+                    repeat,
+                    setup=lambda: os.path.join(
+                        work_dir, f"cold-{rows}-{next(cold_dirs)}"
+                    ),
+                )
+                record("load_excel_mapping (cold)", None, rows, rows, "rows/s", stats)
+
+                os.environ["BREVKODER_CACHE_DIR"] = os.path.join(work_dir, "warm")
+                tools.load_excel_mapping(csv_path)
+                stats = measure(lambda: tools.load_excel_mapping(csv_path), repeat)
+                record("load_excel_mapping (warm)", None, rows, rows, "rows/s", stats)
+
+                # The tools read the pinned version instead of the default key list
+                version = MappingVersion(csv_path, 1, load_compiled_mapping(csv_path))
+                mapping = version.mappings
+
+                with use_version(version):
+                    for paragraphs in paragraph_sizes:
+                        text = make_letter(paragraphs, mapping)
+                        docx = tools.text_to_word_docx(text)
+
+                        stats = measure(
+                            lambda: tools.replace_titels_with_nogle(
+                                text, "{ MERGEFIELD <NØGLE> }"
+                            ),
+                            repeat,
+                        )
+                        record(
+                            "replace_titels_with_nogle",
+                            paragraphs,
+                            rows,
+                            paragraphs,
+                            "paragraphs/s",
+                            stats,
+                        )
+
+                        for case, cache in (
+                            ("process_docx_template", False),
+                            ("process_docx_template (warm cache)", ParagraphCache()),
+                        ):
+                            stats = measure(
+                                lambda doc: process_docx_template(
+                                    doc, mapping, paragraph_cache=cache
+                                ),
+                                repeat,
+                                setup=lambda: Document(io.BytesIO(docx)),
+                            )
+                            record(
+                                case,
+                                paragraphs,
+                                rows,
+                                paragraphs,
+                                "paragraphs/s",
+                                stats,
+                            )
+    finally:
+        if saved_cache_dir is None:
+            os.environ.pop("BREVKODER_CACHE_DIR", None)
+        else:
+            os.environ["BREVKODER_CACHE_DIR"] = saved_cache_dir
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "paragraph_sizes": list(paragraph_sizes),
+            "row_sizes": list(row_sizes),
+        },
+        "results": results,
+    }
+
+
+def _case_key(result):
+    return (result["case"], result["paragraphs"], result["rows"])
+
+
+def _format_result(result) -> str:
+    size = ", ".join(
+        f"{n} {label}"
+        for n, label in ((result["paragraphs"], "paragraphs"), (result["rows"], "rows"))
+        if n is not None
+    )
+    return (
+        f"{result['case']:<40} {size:<28} "
+        f"{result['min_seconds'] * 1000:10.2f} ms "
+        f"{result['peak_bytes'] / 2**20:8.2f} MiB "
+        f"{result['throughput']:12.0f} {result['unit']}"
+    )
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """
+    Pair each result with the same case in ``baseline``.
+
+    Returns:
+        list: (result, speedup) where speedup = baseline time / new time.
+    """
+    before = {_case_key(r): r for r in baseline["results"]}
+    pairs = []
+    for result in results["results"]:
+        old = before.get(_case_key(result))
+        if old and result["min_seconds"]:
+            pairs.append((result, old["min_seconds"] / result["min_seconds"]))
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--paragraphs", type=int, nargs="+")
+    parser.add_argument("--rows", type=int, nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--quick", action="store_true", help="Small sizes only, for a fast check"
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    paragraph_sizes = args.paragraphs or (
+        QUICK_PARAGRAPHS if args.quick else DEFAULT_PARAGRAPHS
+    )
+    row_sizes = args.rows or (QUICK_ROWS if args.quick else DEFAULT_ROWS)
+    results = run_benchmarks(
+        paragraph_sizes,
+        row_sizes,
+        repeat=args.repeat,
+        progress=lambda result: print(_format_result(result)),
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline['meta'].get('commit')}):")
+        for result, speedup in compare(results, baseline):
+            print(f"  {_format_result(result)}  {speedup:6.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
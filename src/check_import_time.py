@@ -0,0 +1,93 @@
+"""
+Startup budget check for the app's modules.
+
+Imports the given modules in a fresh interpreter with ``python -X importtime``
+and fails if their cumulative import time exceeds the budget, or if any of the
+heavy libraries that must only load on first use were imported.
+
+Usage (from the src directory):
+    python check_import_time.py
+    python check_import_time.py --budget-ms 150 components.agent components.tools
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["components.agent", "components.tools"]
+DEFAULT_BUDGET_MS = 100.0
+
+# Libraries that are deferred until first use and must not appear at import
+DEFERRED_PACKAGES = [
+    "pandas",
+    "docx",
+    "lxml",
+    "langchain_core",
+    "langchain_openai",
+    "langgraph",
+    "azure",
+    "openai",
+]
+
+
+def measure_imports(modules):
+    """
+    Import ``modules`` in a subprocess with ``-X importtime``.
+
+    Args:
+        modules (list): Dotted module names to import.
+
+    Returns:
+        list: (self_us, cumulative_us, depth, name) for every imported module.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=src_dir,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    entries = measure_imports(args.modules)
+    top_level = {name: cum for _, cum, depth, name in entries if depth == 0}
+    total_ms = sum(top_level.get(m, 0) for m in args.modules) / 1000
+    deferred = sorted(
+        {
+            name
+            for *_, name in entries
+            if name.split(".")[0] in DEFERRED_PACKAGES and "." not in name
+        }
+    )
+
+    print(f"Cumulative import time: {total_ms:.1f} ms (budget {args.budget_ms:.1f} ms)")
+    print("Slowest modules (self time):")
+    for self_us, _, _, name in sorted(entries, reverse=True)[:10]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+    if deferred:
+        print(f"Deferred packages imported at startup: {', '.join(deferred)}")
+
+    ok = total_ms <= args.budget_ms and not deferred
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
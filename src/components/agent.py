@@ -1,30 +1,28 @@
+import functools
+import inspect
+import json
 import os
-import pandas as pd
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from langchain_openai import AzureChatOpenAI
-from langgraph.graph import StateGraph, START, END
-from langgraph.graph import MessagesState
-from langgraph.prebuilt import ToolNode, tools_condition
+
+from components.mapping_cache import load_compiled_mapping
+from components.mapping_registry import use_version
 
 # Import tool functions from tools.py
 from components.tools import (
+    get_mapping_version,
+    lookup_titles,
     search_and_replace,
     replace_titels_with_nogle,
 )
 
+# azure, langchain and langgraph are imported inside the factories below, so
+# importing this module is cheap and nothing is built before the first request.
+
 
 # --- Minimal Excel mapping loader ---
 def load_excel_mapping(path):
-    try:
-        df = pd.read_excel(path, sheet_name=None)
-        # Try to find the right sheet ("query" or first sheet)
-        sheet = df["query"] if "query" in df else next(iter(df.values()))
-        # Expect columns: "Titel" and "Nøgle"
-        if "Titel" in sheet.columns and "Nøgle" in sheet.columns:
-            return dict(zip(sheet["Titel"], sheet["Nøgle"]))
-    except Exception:
-        pass
-    return {}
+    # Served from the compiled on-disk index; pandas only runs when the file changed
+    compiled = load_compiled_mapping(path)
+    return compiled.as_dict() if compiled else {}
 
 
 # Path to default mapping Excel
@@ -33,54 +31,529 @@ DEFAULT_MAPPING_PATH = os.path.join(
     "documents",
     "Liste over alle nøgler.xlsx",
 )
-MAPPINGS_DICT = load_excel_mapping(DEFAULT_MAPPING_PATH)
-
-credential = DefaultAzureCredential(
-    exclude_environment_credential=True,
-    exclude_developer_cli_credential=True,
-    exclude_workload_identity_credential=True,
-    exclude_managed_identity_credential=True,
-    exclude_visual_studio_code_credential=True,
-    exclude_shared_token_cache_credential=True,
-    exclude_interactive_browser_credential=True,
-)
-token_provider = get_bearer_token_provider(
-    credential, "https://cognitiveservices.azure.com/.default"
-)
 
-llm = AzureChatOpenAI(
-    azure_endpoint="https://oai02-aiserv.openai.azure.com/",
-    api_version="2024-10-21",
-    azure_ad_token_provider=token_provider,
-    azure_deployment="gpt-4o-2024-08-06",
-)
-llm_with_tools = llm.bind_tools([search_and_replace, replace_titels_with_nogle])
+TOOLS = [search_and_replace, replace_titels_with_nogle, lookup_titles]
 
+# --- Azure OpenAI deployment ---
+AZURE_ENDPOINT = "https://oai02-aiserv.openai.azure.com/"
+AZURE_API_VERSION = "2024-10-21"
+AZURE_DEPLOYMENT = "gpt-4o-2024-08-06"
 
-def tool_calling_llm(state: MessagesState):
-    # LLM should output a dict: {"content": ...} or {"tool_call": {"tool": ..., "tool_input": {...}}}
-    return {"messages": [llm_with_tools.invoke(state["messages"])]}
+# Part of every result cache key: bump when the agent's tools or graph change
+# in a way that changes its answers, so results cached by the old agent miss
+AGENT_VERSION = "1"
 
 
-graph_builder = StateGraph(MessagesState)
-# *** NODES ***
-graph_builder.add_node(
-    "tool_calling_llm",
-    tool_calling_llm,
-)
-graph_builder.add_node(
-    "tools",
-    ToolNode([search_and_replace, replace_titels_with_nogle]),
-)
+def get_mappings() -> dict:
+    """Default Titel -> Nøgle mapping (``tools.get_mapping_version``)."""
+    return get_mapping_version().mappings
 
-# *** EDGES ***
 
-# ReAct-style recursive agent: tools node loops back to LLM node
-graph_builder.add_edge(START, "tool_calling_llm")
-graph_builder.add_conditional_edges(
-    "tool_calling_llm",
-    tools_condition,  # routes to tools or END
-)
-graph_builder.add_edge("tools", "tool_calling_llm")
+def _pin_mapping_version(func):
+    # The whole call (cache key, pre-pass, every tool call) uses the mapping
+    # version that was current when it started, even if the key list is
+    # reloaded meanwhile
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def pinned(*args, **kwargs):
+            with use_version(get_mapping_version()):
+                return await func(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(func)
+        def pinned(*args, **kwargs):
+            with use_version(get_mapping_version()):
+                return func(*args, **kwargs)
+
+    return pinned
+
+
+@functools.lru_cache(maxsize=None)
+def get_credential():
+    """Azure credential used for Azure OpenAI, built on first use."""
+    from azure.identity import DefaultAzureCredential
+
+    return DefaultAzureCredential(
+        exclude_environment_credential=True,
+        exclude_developer_cli_credential=True,
+        exclude_workload_identity_credential=True,
+        exclude_managed_identity_credential=True,
+        exclude_visual_studio_code_credential=True,
+        exclude_shared_token_cache_credential=True,
+        exclude_interactive_browser_credential=True,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_provider():
+    """Azure AD token provider for Azure OpenAI, built on first use."""
+    from azure.identity import get_bearer_token_provider
+
+    return get_bearer_token_provider(
+        get_credential(), "https://cognitiveservices.azure.com/.default"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    """The Azure OpenAI chat model, built on first use."""
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_endpoint=AZURE_ENDPOINT,
+        api_version=AZURE_API_VERSION,
+        azure_ad_token_provider=get_token_provider(),
+        azure_deployment=AZURE_DEPLOYMENT,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_stub_llm():
+    """
+    Offline stand-in for the chat model: calls no tools and answers with the text
+    it was asked to process, unchanged. Used to run the pipeline (e.g. the HTTP
+    service) locally and in tests without Azure.
+    """
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class EchoChatModel(BaseChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "echo"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            content = messages[-1].content if messages else ""
+            _, marker, text = content.partition("Text to process:\n")
+            message = AIMessage(text if marker else content)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+    return EchoChatModel()
+
+
+def model_identity(llm=None) -> str:
+    """
+    Name of a chat model for result cache keys: its type and deployment or
+    model name. ``None`` stands for ``get_llm()``, without building it.
+    """
+    if llm is None:
+        return f"azure-openai-chat:{AZURE_DEPLOYMENT}"
+    params = llm._identifying_params
+    name = params.get("azure_deployment") or params.get("model_name")
+    name = name or params.get("model")
+    if not name:
+        name = json.dumps(params, sort_keys=True, default=str)
+    return f"{llm._llm_type}:{name}"
+
+
+def agent_tag(llm=None, tools=None, state_schema=None) -> str:
+    """
+    Identity of an agent built by ``build_graph`` with these arguments: the
+    agent version, its state, its tools and its model. Part of the result
+    cache key, so a new deployment or agent never serves an old answer.
+    """
+    tools = TOOLS if tools is None else tools
+    names = ",".join(getattr(t, "name", None) or t.__name__ for t in tools)
+    schema = state_schema.__name__ if state_schema else "MessagesState"
+    return f"v{AGENT_VERSION}|{schema}|{names}|{model_identity(llm)}"
+
+
+def _graph_tag(graph, **defaults) -> str:
+    # The agent tag of a graph from build_graph; None is the default graph
+    # built from ``defaults``, any other graph is named by its type
+    if graph is None:
+        return agent_tag(**defaults)
+    metadata = (getattr(graph, "config", None) or {}).get("metadata") or {}
+    return metadata.get("agent_tag") or f"v{AGENT_VERSION}|{type(graph).__qualname__}"
+
+
+def build_graph(llm=None, tools=None, state_schema=None):
+    """
+    Build and compile the ReAct-style coding agent.
+
+    Args:
+        llm (BaseChatModel, optional): Chat model to use. Defaults to ``get_llm()``;
+            pass a fake chat model to run the graph without Azure.
+        tools (list, optional): Tools bound to the model. Defaults to ``TOOLS``.
+        state_schema (type, optional): Graph state. Defaults to ``MessagesState``.
+
+    Returns:
+        CompiledStateGraph: The compiled graph, with its ``agent_tag`` in the
+            config metadata.
+    """
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph, START, END
+    from langgraph.graph import MessagesState
+    from langgraph.prebuilt import ToolNode, tools_condition
+
+    tools = TOOLS if tools is None else tools
+    llm_with_tools = (llm or get_llm()).bind_tools(tools)
+
+    def tool_calling_llm(state: MessagesState):
+        # LLM should output a dict: {"content": ...} or {"tool_call": {"tool": ..., "tool_input": {...}}}
+        return {"messages": [llm_with_tools.invoke(state["messages"])]}
+
+    async def atool_calling_llm(state: MessagesState):
+        # Used by graph.ainvoke, so concurrent runs do not block each other
+        return {"messages": [await llm_with_tools.ainvoke(state["messages"])]}
+
+    graph_builder = StateGraph(state_schema or MessagesState)
+    # *** NODES ***
+    graph_builder.add_node(
+        "tool_calling_llm",
+        RunnableLambda(tool_calling_llm, afunc=atool_calling_llm),
+    )
+    graph_builder.add_node(
+        "tools",
+        ToolNode(tools),
+    )
+
+    # *** EDGES ***
+
+    # ReAct-style recursive agent: tools node loops back to LLM node
+    graph_builder.add_edge(START, "tool_calling_llm")
+    graph_builder.add_conditional_edges(
+        "tool_calling_llm",
+        tools_condition,  # routes to tools or END
+    )
+    graph_builder.add_edge("tools", "tool_calling_llm")
+
+    return graph_builder.compile().with_config(
+        metadata={"agent_tag": agent_tag(llm, tools, state_schema)}
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_graph():
+    """The compiled agent graph for the Azure model, built on first use."""
+    return build_graph()
+
+
+def build_document_graph(llm=None):
+    """
+    Build the coding agent whose tools edit a document held in the graph state
+    (``components.document_tools``) instead of passing the letter around.
+
+    Args:
+        llm (BaseChatModel, optional): Chat model to use. Defaults to ``get_llm()``.
+
+    Returns:
+        CompiledStateGraph: The compiled graph.
+    """
+    from components.document_tools import DOCUMENT_TOOLS, DocumentState
+
+    return build_graph(llm, DOCUMENT_TOOLS, DocumentState)
+
+
+@functools.lru_cache(maxsize=None)
+def get_document_graph():
+    """The document-state agent graph for the Azure model, built on first use."""
+    return build_document_graph()
+
+
+@functools.lru_cache(maxsize=None)
+def get_result_cache():
+    """The on-disk agent result cache, opened on first use."""
+    from components.result_cache import ResultCache
+
+    return ResultCache()
+
+
+@_pin_mapping_version
+def code_letter(prompt: str, text: str, graph=None, cache=None, on_message=None) -> str:
+    """
+    Run the coding agent on a letter, answering repeats from the result cache.
+
+    The cache key combines the normalized prompt, the text, the fingerprint
+    of the current mapping and the graph's ``agent_tag``, so editing either,
+    changing the key list or changing the model misses.
+
+    Args:
+        prompt (str): The instruction prompt.
+        text (str): The letter to code.
+        graph (CompiledStateGraph, optional): Agent graph. Defaults to ``get_graph()``.
+        cache (ResultCache, optional): Result cache. Defaults to
+            ``get_result_cache()``; pass False to bypass it.
+        on_message (callable, optional): Called with the latest message content
+            while the agent runs (once, with the result, on a cache hit).
+
+    Returns:
+        str: The coded letter (the agent's final message).
+    """
+    from components.result_cache import result_key
+
+    if cache is None:
+        cache = get_result_cache()
+    key = result_key(
+        prompt, text, get_mapping_version().fingerprint, agent=_graph_tag(graph)
+    )
+    if cache is not False:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_message:
+                on_message(cached)
+            return cached
+
+    combined_prompt = f"{prompt}\n\nText to process:\n{text}"
+    result = ""
+    for event in (graph or get_graph()).stream(
+        {"messages": [{"role": "user", "content": combined_prompt}]}
+    ):
+        for value in event.values():
+            if value["messages"] and value["messages"][-1].content:
+                result = value["messages"][-1].content
+                if on_message:
+                    on_message(result)
+
+    if cache is not False and result:
+        cache.put(key, result)
+    return result
+
+
+@_pin_mapping_version
+def code_document(
+    prompt: str, text: str, graph=None, cache=None, handle: str = None
+) -> str:
+    """
+    Run the document-state agent on a letter: the letter is stored in the graph
+    state under a handle, the tools edit it there, and the result is the final
+    document rather than the model's last message.
+
+    Args:
+        prompt (str): The instruction prompt.
+        text (str): The letter to code.
+        graph (CompiledStateGraph, optional): Defaults to ``get_document_graph()``.
+        cache (ResultCache, optional): Result cache. Defaults to
+            ``get_result_cache()``; pass False to bypass it.
+        handle (str, optional): Document handle. Defaults to
+            ``document_tools.DEFAULT_HANDLE``.
+
+    Returns:
+        str: The coded letter.
+    """
+    from components.document_tools import DEFAULT_HANDLE, DOCUMENT_TOOLS, DocumentState
+    from components.result_cache import result_key
+
+    handle = handle or DEFAULT_HANDLE
+    if cache is None:
+        cache = get_result_cache()
+    key = result_key(
+        prompt,
+        text,
+        get_mapping_version().fingerprint,
+        mode="document",
+        agent=_graph_tag(graph, tools=DOCUMENT_TOOLS, state_schema=DocumentState),
+    )
+    if cache is not False:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    content = (
+        f"{prompt}\n\nDokumentet har handle '{handle}'. Rediger det med "
+        "værktøjerne og svar ikke med hele teksten."
+        f"\n\nText to process:\n{text}"
+    )
+    state = (graph or get_document_graph()).invoke(
+        {
+            "messages": [{"role": "user", "content": content}],
+            "documents": {handle: text},
+        }
+    )
+    result = state["documents"][handle]
+    if cache is not False:
+        cache.put(key, result)
+    return result
+
+
+@_pin_mapping_version
+def annotate_letter(prompt: str, text: str, llm=None, cache=None):
+    """
+    Structured-output mode: ask the model for span annotations instead of the
+    rewritten letter. Apply them with ``components.annotations.apply_annotations``
+    (coded text) or ``annotations_to_docx`` (Word document with real fields).
+
+    Args:
+        prompt (str): The instruction prompt.
+        text (str): The letter to code.
+        llm (BaseChatModel, optional): Chat model. Defaults to ``get_llm()``.
+        cache (ResultCache, optional): Result cache. Defaults to
+            ``get_result_cache()``; pass False to bypass it.
+
+    Returns:
+        LetterAnnotations: The model's annotations.
+    """
+    from components.annotations import ANNOTATION_INSTRUCTIONS, LetterAnnotations
+    from components.result_cache import result_key
+
+    if cache is None:
+        cache = get_result_cache()
+    key = result_key(
+        prompt,
+        text,
+        get_mapping_version().fingerprint,
+        mode="annotations",
+        agent=f"v{AGENT_VERSION}|{model_identity(llm)}",
+    )
+    if cache is not False:
+        cached = cache.get(key)
+        if cached is not None:
+            return LetterAnnotations.model_validate_json(cached)
+
+    structured_llm = (llm or get_llm()).with_structured_output(LetterAnnotations)
+    annotations = structured_llm.invoke(
+        [
+            {
+                "role": "user",
+                "content": f"{prompt}\n\n{ANNOTATION_INSTRUCTIONS}"
+                f"\n\nText to process:\n{text}",
+            }
+        ]
+    )
+    if cache is not False:
+        cache.put(key, annotations.model_dump_json())
+    return annotations
+
+
+@_pin_mapping_version
+async def acode_letter_chunked(
+    prompt: str,
+    text: str,
+    graph=None,
+    cache=None,
+    max_concurrency: int = 4,
+    max_chars: int = None,
+    on_progress=None,
+) -> str:
+    """
+    Code a long letter chunk by chunk, running up to ``max_concurrency`` agent
+    requests at a time, and reassemble the chunks in order.
+
+    The letter is split with ``components.chunking.split_letter``, which never
+    breaks an "If betingelse ... Else ..." construct. Each chunk goes through
+    the result cache on its own, so editing one paragraph only recodes its chunk.
+
+    Args:
+        prompt (str): The instruction prompt, sent with every chunk.
+        text (str): The letter to code.
+        graph (CompiledStateGraph, optional): Agent graph. Defaults to ``get_graph()``.
+        cache (ResultCache, optional): Result cache. Defaults to
+            ``get_result_cache()``; pass False to bypass it.
+        max_concurrency (int, optional): Maximum number of concurrent requests.
+        max_chars (int, optional): Target chunk size in characters. Defaults to
+            ``chunking.DEFAULT_MAX_CHARS``.
+        on_progress (callable, optional): Called as ``on_progress(done, total)``
+            each time a chunk is finished.
+
+    Returns:
+        str: The coded letter.
+    """
+    import asyncio
+
+    from components.chunking import DEFAULT_MAX_CHARS, join_chunks, split_letter
+    from components.result_cache import result_key
+
+    if cache is None:
+        cache = get_result_cache()
+    fingerprint = get_mapping_version().fingerprint
+    tag = _graph_tag(graph)
+    graph = graph or get_graph()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    finished = 0
+
+    def chunk_done(result: str) -> str:
+        nonlocal finished
+        finished += 1
+        if on_progress is not None:
+            on_progress(finished, len(chunks))
+        return result
+
+    async def code_chunk(chunk: str) -> str:
+        if not chunk.strip():
+            return chunk_done(chunk)
+        key = result_key(prompt, chunk, fingerprint, agent=tag)
+        if cache is not False:
+            cached = cache.get(key)
+            if cached is not None:
+                return chunk_done(cached)
+        async with semaphore:
+            state = await graph.ainvoke(
+                {
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": f"{prompt}\n\nText to process:\n{chunk}",
+                        }
+                    ]
+                }
+            )
+        result = state["messages"][-1].content
+        if cache is not False and result:
+            cache.put(key, result)
+        return chunk_done(result)
+
+    chunks = split_letter(text, max_chars or DEFAULT_MAX_CHARS)
+    coded = await asyncio.gather(*(code_chunk(chunk) for chunk, _ in chunks))
+    return join_chunks(coded, chunks)
+
+
+def code_letter_chunked(prompt: str, text: str, **kwargs) -> str:
+    """Synchronous wrapper around ``acode_letter_chunked`` (same arguments)."""
+    import asyncio
+
+    return asyncio.run(acode_letter_chunked(prompt, text, **kwargs))
+
+
+@_pin_mapping_version
+def code_letter_prepass(
+    prompt: str, text: str, mappings: dict = None, chunked: bool = False, **kwargs
+) -> str:
+    """
+    Code a letter with the deterministic pre-pass: known titles are coded
+    locally and only the paragraphs that need judgement are sent to the agent.
+
+    Args:
+        prompt (str): The instruction prompt.
+        text (str): The letter to code.
+        mappings (dict, optional): Titel -> Nøgle mapping. Defaults to ``get_mappings()``.
+        chunked (bool, optional): Send the remaining paragraphs through
+            ``code_letter_chunked`` instead of ``code_letter``.
+        **kwargs: Passed on to ``code_letter`` / ``code_letter_chunked``
+            (graph, cache, ...).
+
+    Returns:
+        str: The coded letter.
+    """
+    from components.prepass import PROTECTED_NOTE, prepare_letter
+
+    prepared = prepare_letter(text, get_mappings() if mappings is None else mappings)
+    if not prepared.needs_model:
+        return prepared.merge()
+    code = code_letter_chunked if chunked else code_letter
+    coded = code(f"{prompt}\n\n{PROTECTED_NOTE}", prepared.model_text(), **kwargs)
+    return prepared.merge(coded)
+
+
+# Module attributes that used to be built at import time, now built on access
+_LAZY_ATTRIBUTES = {
+    "MAPPINGS_DICT": get_mappings,
+    "credential": get_credential,
+    "token_provider": get_token_provider,
+    "llm": get_llm,
+    "llm_with_tools": lambda: get_llm().bind_tools(TOOLS),
+    "graph": get_graph,
+    "document_graph": get_document_graph,
+}
+
 
-graph = graph_builder.compile()
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
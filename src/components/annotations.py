@@ -0,0 +1,201 @@
+"""
+Span annotations: the structured-output mode of the coding agent.
+
+Instead of rewriting the whole letter, the model returns a list of edits - the
+quoted text to replace, its character offsets, and the Nøgle (plus the
+condition branches for IF fields). ``resolve_annotations`` checks every edit
+against the letter, re-anchoring it on its quote when the offsets are off, and
+the appliers build the coded text or the Word document directly from the
+accepted edits. Text outside the edits can never be changed by the model.
+"""
+
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+# How far from the given offset a misplaced quote is looked for
+REANCHOR_WINDOW = 2000
+
+ANNOTATION_INSTRUCTIONS = (
+    "Returner ikke brevet. Returner kun en liste af annoteringer: for hvert sted "
+    "der skal kodes, den præcise tekst der erstattes (quote), dens start- og "
+    "slutposition i teksten, nøglen og for IF-felter teksten når betingelsen er "
+    "opfyldt og når den ikke er."
+)
+
+
+class FieldAnnotation(BaseModel):
+    """One text span to turn into a field."""
+
+    kind: Literal["mergefield", "if"] = Field(
+        description="'mergefield' for a Titel, 'if' for an If betingelse construct"
+    )
+    quote: str = Field(description="The exact text in the letter to replace")
+    start: int = Field(-1, description="Character offset where the quote starts")
+    end: int = Field(-1, description="Character offset where the quote ends")
+    key: str = Field(description="The Nøgle (for 'if': the condition's Nøgle)")
+    condition: str = Field("J", description="Value the condition is compared to")
+    true_text: Optional[str] = Field(None, description="Text when the condition holds")
+    false_text: Optional[str] = Field(None, description="Text otherwise")
+
+
+class LetterAnnotations(BaseModel):
+    """All edits for one letter."""
+
+    annotations: List[FieldAnnotation]
+
+
+def _anchor(text: str, annotation: FieldAnnotation, taken) -> Optional[int]:
+    quote = annotation.quote
+    if not quote:
+        return None
+    start = annotation.start
+
+    def free(pos):
+        return not any(s < pos + len(quote) and pos < e for s, e, _ in taken)
+
+    if 0 <= start and text.startswith(quote, start) and free(start):
+        return start
+    # Offsets are off: take the free occurrence nearest to the given offset
+    lo = 0 if start < 0 else max(0, start - REANCHOR_WINDOW)
+    hi = (
+        len(text) if start < 0 else min(len(text), start + len(quote) + REANCHOR_WINDOW)
+    )
+    best = None
+    pos = text.find(quote, lo, hi)
+    while pos != -1:
+        if free(pos):
+            if best is None or abs(pos - start) < abs(best - start):
+                best = pos
+            if start < 0:
+                break
+        pos = text.find(quote, pos + 1, hi)
+    return best
+
+
+def field_code(annotation: FieldAnnotation) -> str:
+    """The placeholder text for an annotation, as ``convert_text_to_mergefields`` reads it."""
+    if annotation.kind == "if":
+        return (
+            f'{{ IF "{annotation.condition}" "{{ MERGEFIELD {annotation.key} }}" '
+            f'"{annotation.true_text or ""}" "{annotation.false_text or ""}" }}'
+        )
+    return f"{{ MERGEFIELD {annotation.key} }}"
+
+
+def resolve_annotations(text: str, annotations) -> tuple:
+    """
+    Anchor annotations in the letter.
+
+    An annotation is accepted if its quote is at its offsets or, failing that,
+    within ``REANCHOR_WINDOW`` characters of them (anywhere if no offset was
+    given), and does not overlap an annotation accepted before it.
+
+    Args:
+        text (str): The letter.
+        annotations (LetterAnnotations or list): The model's annotations.
+
+    Returns:
+        tuple: (accepted, rejected) - accepted is a list of (start, end,
+            FieldAnnotation) sorted by start; rejected the annotations that
+            could not be placed.
+    """
+    if isinstance(annotations, LetterAnnotations):
+        annotations = annotations.annotations
+    taken = []
+    rejected = []
+    for annotation in annotations:
+        if not annotation.key or (
+            annotation.kind == "if" and annotation.true_text is None
+        ):
+            rejected.append(annotation)
+            continue
+        start = _anchor(text, annotation, taken)
+        if start is None:
+            rejected.append(annotation)
+            continue
+        taken.append((start, start + len(annotation.quote), annotation))
+    taken.sort(key=lambda span: span[0])
+    return taken, rejected
+
+
+def apply_annotations(text: str, annotations) -> tuple:
+    """
+    Build the coded letter text from annotations.
+
+    Args:
+        text (str): The letter.
+        annotations (LetterAnnotations or list): The model's annotations.
+
+    Returns:
+        tuple: (str, list) - The coded text and the rejected annotations.
+    """
+    accepted, rejected = resolve_annotations(text, annotations)
+    parts = []
+    pos = 0
+    for start, end, annotation in accepted:
+        parts.append(text[pos:start])
+        parts.append(field_code(annotation))
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts), rejected
+
+
+def annotations_to_docx(text: str, annotations) -> tuple:
+    """
+    Build a Word document with real fields straight from annotations, without
+    writing placeholder text and parsing it back. Each line becomes a paragraph;
+    an annotation spanning lines is rejected.
+
+    Args:
+        text (str): The letter.
+        annotations (LetterAnnotations or list): The model's annotations.
+
+    Returns:
+        tuple: (bytes, list) - The .docx file and the rejected annotations.
+    """
+    import io
+
+    from docx import Document
+
+    from components.fields import Instruction, MergeField, append_runs, if_instruction
+
+    accepted, rejected = resolve_annotations(text, annotations)
+    doc = Document()
+    i = 0
+    line_start = 0
+    for line in text.split("\n"):
+        line_end = line_start + len(line)
+        paragraph = doc.add_paragraph()
+        # Text and fields of the line, appended in one go
+        items = []
+        pos = line_start
+        while i < len(accepted) and accepted[i][0] < line_end:
+            start, end, annotation = accepted[i]
+            i += 1
+            if start < line_start or end > line_end:
+                rejected.append(annotation)
+                continue
+            if start > pos:
+                items.append(text[pos:start])
+            if annotation.kind == "if":
+                items.append(
+                    Instruction(
+                        if_instruction(
+                            annotation.condition,
+                            annotation.key,
+                            annotation.true_text,
+                            annotation.false_text or "",
+                        )
+                    )
+                )
+            else:
+                items.append(MergeField(annotation.key))
+            pos = end
+        if pos < line_end:
+            items.append(text[pos:line_end])
+        append_runs(paragraph._p, items)
+        line_start = line_end + 1
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue(), rejected
@@ -0,0 +1,260 @@
+"""
+Batch conversion of whole folders of letters.
+
+Converts every .docx/.docm file found in the given directories, glob patterns or
+files with the streaming converter, spread over a process pool. Each worker loads
+the compiled key list once, at start-up. A JSON summary with per-file timing and
+errors is written next to the outputs; a file that fails is recorded and the run
+continues.
+
+Usage (from the src directory):
+    python -m components.batch letters/ -o coded/
+    python -m components.batch "letters/**/*.docx" -o coded/ --mapping "../documents/liste over alle nøgler.xlsx" --workers 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+LETTER_EXTENSIONS = (".docx", ".docm")
+
+# Set in each worker process by _init_worker
+_WORKER_MATCHER = None
+
+
+def _is_letter(path: str) -> bool:
+    name = os.path.basename(path)
+    # Skip Word's "~$" lock files
+    return name.lower().endswith(LETTER_EXTENSIONS) and not name.startswith("~$")
+
+
+def collect_inputs(inputs) -> list:
+    """
+    Expand directories (recursively), glob patterns and plain file paths into
+    (source, relative_output_name) pairs, without duplicates.
+
+    Args:
+        inputs (list): Directories, glob patterns or files.
+
+    Returns:
+        list: (source path, output path relative to the output directory).
+    """
+    found = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [
+                (
+                    os.path.join(root, name),
+                    os.path.relpath(os.path.join(root, name), item),
+                )
+                for root, _, names in os.walk(item)
+                for name in sorted(names)
+            ]
+        else:
+            paths = glob.glob(item, recursive=True) or [item]
+            candidates = [(path, os.path.basename(path)) for path in sorted(paths)]
+        for source, relative in candidates:
+            key = os.path.abspath(source)
+            if key in seen or not _is_letter(source):
+                continue
+            seen.add(key)
+            found.append((source, relative))
+
+    # Different inputs can yield the same output name: number the duplicates
+    used = set()
+    result = []
+    for source, relative in found:
+        stem, ext = os.path.splitext(relative)
+        candidate, n = relative, 2
+        while candidate.lower() in used:
+            candidate, n = f"{stem}-{n}{ext}", n + 1
+        used.add(candidate.lower())
+        result.append((source, candidate))
+    return result
+
+
+def _init_worker(mapping_path, cache_dir):
+    global _WORKER_MATCHER
+    if mapping_path:
+        from components.mapping_cache import load_compiled_mapping
+
+        compiled = load_compiled_mapping(mapping_path, cache_dir)
+        if compiled is None:
+            raise RuntimeError(f"Could not load mapping: {mapping_path}")
+        _WORKER_MATCHER = compiled.matcher
+
+
+def convert_one(source: str, output: str) -> dict:
+    """
+    Convert one letter in a worker process. Never raises: failures are returned
+    in the result.
+
+    Args:
+        source (str): Input .docx/.docm file.
+        output (str): Output file.
+
+    Returns:
+        dict: source, output, ok, fields, seconds and error (None on success).
+    """
+    from components.docx_stream import convert_file
+
+    started = time.perf_counter()
+    result = {"source": source, "output": output, "ok": False, "fields": 0}
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        result["fields"] = convert_file(source, output, _WORKER_MATCHER)
+        result["ok"] = True
+        result["error"] = None
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def _run_pool(jobs, workers, mapping_path, cache_dir, report):
+    """Run jobs on a fresh pool; return the jobs lost to a crashed worker."""
+    lost = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(mapping_path, cache_dir),
+    ) as pool:
+        futures = {pool.submit(convert_one, *job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                report(future.result())
+            except BrokenProcessPool:
+                lost.append(futures[future])
+    return lost
+
+
+def run_batch(
+    inputs,
+    output_dir: str,
+    mapping_path: str = None,
+    workers: int = None,
+    cache_dir: str = None,
+    progress=None,
+) -> dict:
+    """
+    Convert all letters found in ``inputs`` into ``output_dir``.
+
+    Args:
+        inputs (list): Directories, glob patterns or files.
+        output_dir (str): Directory for the converted letters.
+        mapping_path (str, optional): Key list (.xlsx/.csv). If given, titles are
+            converted to MERGEFIELDs as well as the placeholders.
+        workers (int, optional): Number of worker processes. Defaults to the
+            number of CPUs.
+        cache_dir (str, optional): Directory for compiled mapping indexes.
+        progress (callable, optional): Called with each file's result dict.
+
+    Returns:
+        dict: The run summary (also what the CLI writes as JSON).
+    """
+    started = time.perf_counter()
+    jobs = [
+        (source, os.path.join(output_dir, relative))
+        for source, relative in collect_inputs(inputs)
+    ]
+    mapping_version = None
+    if mapping_path:
+        from components.mapping_cache import load_compiled_mapping
+        from components.mapping_registry import version_tag
+
+        # Build the compiled index once up front so workers only map it
+        compiled = load_compiled_mapping(mapping_path, cache_dir)
+        if compiled is None:
+            raise ValueError(f"Could not load mapping: {mapping_path}")
+        mapping_version = version_tag(compiled.fingerprint)
+
+    results = {}
+
+    def report(result):
+        results[result["source"]] = result
+        if progress:
+            progress(result)
+
+    lost = _run_pool(jobs, workers, mapping_path, cache_dir, report) if jobs else []
+    # A worker that died (not a Python error) takes the pool down with it. Retry
+    # the unfinished files one per pool so a single bad file cannot sink the rest.
+    for job in lost:
+        if _run_pool([job], 1, mapping_path, cache_dir, report):
+            report(
+                {
+                    "source": job[0],
+                    "output": job[1],
+                    "ok": False,
+                    "fields": 0,
+                    "error": "Worker process crashed",
+                    "seconds": None,
+                }
+            )
+
+    files = [results[source] for source, _ in jobs]
+    return {
+        "inputs": list(inputs),
+        "output_dir": output_dir,
+        "mapping": mapping_path,
+        "mapping_version": mapping_version,
+        "workers": workers or os.cpu_count(),
+        "total": len(files),
+        "converted": sum(1 for f in files if f["ok"]),
+        "failed": sum(1 for f in files if not f["ok"]),
+        "fields": sum(f["fields"] for f in files),
+        "seconds": round(time.perf_counter() - started, 4),
+        "files": files,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert folders of letters to Word merge fields."
+    )
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns or files")
+    parser.add_argument("-o", "--output-dir", required=True)
+    parser.add_argument(
+        "--mapping", help="Key list (.xlsx/.csv); also turn titles into MERGEFIELDs"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--summary", help="Summary JSON path (default: OUTPUT_DIR/summary.json)"
+    )
+    parser.add_argument("--cache-dir", help="Directory for compiled mapping indexes")
+    args = parser.parse_args(argv)
+
+    def progress(result):
+        status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+        print(
+            f"{result['source']}: {result['fields']} fields, {status}", file=sys.stderr
+        )
+
+    summary = run_batch(
+        args.inputs,
+        args.output_dir,
+        mapping_path=args.mapping,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        progress=progress,
+    )
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.json")
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(
+        f"Converted {summary['converted']}/{summary['total']} files "
+        f"({summary['fields']} fields) in {summary['seconds']:.2f} s. "
+        f"Summary: {summary_path}",
+        file=sys.stderr,
+    )
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Splitting letters into chunks that can be coded independently.
+
+Long letters are coded chunk by chunk so the requests run concurrently and stay
+within the model's context. Chunks end at paragraph boundaries, or at sentence
+boundaries inside a paragraph that is too long on its own, and never inside an
+"If betingelse ... Else ..." construct: the condition, its quoted branches and,
+for a condition on a line of its own, the paragraph it governs stay together.
+"""
+
+import re
+
+DEFAULT_MAX_CHARS = 4000
+
+_QUOTE = '”“"'
+# "[Else til] If betingelse <title> [”true”] [Else ”false”]"; a condition line
+# without quotes takes the quoted text that follows, even on the next line.
+CONSTRUCT_PATTERN = re.compile(
+    rf"(?:Else til )?[Ii][Ff] [Bb]etingelse[^{_QUOTE}\n]*"
+    rf"(?:\s*[{_QUOTE}][^{_QUOTE}]*[{_QUOTE}])?"
+    rf"(?:\s*Else\s*[{_QUOTE}][^{_QUOTE}]*[{_QUOTE}])?"
+)
+_PARAGRAPH_BREAK = re.compile(r"\n+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+def construct_spans(text: str) -> list:
+    """Return (start, end) of every "If betingelse" construct in ``text``."""
+    spans = []
+    for match in CONSTRUCT_PATTERN.finditer(text):
+        start, end = match.span()
+        if end < len(text) and "\n" not in match.group(0).rstrip():
+            # A bare condition line governs the following paragraph
+            if not any(q in match.group(0) for q in _QUOTE):
+                newline = text.find("\n", end)
+                end = len(text) if newline == -1 else newline
+                next_break = _PARAGRAPH_BREAK.match(text, end)
+                if next_break:
+                    following = text.find("\n", next_break.end())
+                    end = len(text) if following == -1 else following
+        spans.append((start, end))
+    return spans
+
+
+def _split_points(text: str, pattern, spans) -> list:
+    # (start, end) of every separator that does not fall inside a construct
+    points = []
+    i = 0
+    for match in pattern.finditer(text):
+        while i < len(spans) and spans[i][1] <= match.start():
+            i += 1
+        if i < len(spans) and spans[i][0] < match.end():
+            continue
+        points.append(match.span())
+    return points
+
+
+def split_letter(text: str, max_chars: int = DEFAULT_MAX_CHARS) -> list:
+    """
+    Split a letter into chunks of at most about ``max_chars`` characters.
+
+    A chunk can exceed ``max_chars`` only when there is no allowed split point
+    inside it (e.g. one very long "If betingelse" construct).
+
+    Args:
+        text (str): The letter.
+        max_chars (int, optional): Target maximum chunk length.
+
+    Returns:
+        list: (chunk, separator) pairs; ``join_chunks`` puts them back together.
+    """
+    spans = construct_spans(text)
+    points = _split_points(text, _PARAGRAPH_BREAK, spans)
+    # Pieces between allowed paragraph breaks, each with the break that follows
+    pieces = []
+    pos = 0
+    for start, end in points + [(len(text), len(text))]:
+        piece = text[pos:start]
+        if len(piece) > max_chars:
+            pieces.extend(_split_sentences(piece, pos, spans))
+            pieces[-1] = (pieces[-1][0], text[start:end])
+        else:
+            pieces.append((piece, text[start:end]))
+        pos = end
+
+    chunks = []
+    current, current_sep = pieces[0]
+    for piece, separator in pieces[1:]:
+        if len(current) + len(current_sep) + len(piece) > max_chars:
+            chunks.append((current, current_sep))
+            current = piece
+        else:
+            current = current + current_sep + piece
+        current_sep = separator
+    chunks.append((current, current_sep))
+    return chunks
+
+
+def _split_sentences(paragraph: str, offset: int, spans) -> list:
+    local = [(s - offset, e - offset) for s, e in spans]
+    pieces = []
+    pos = 0
+    for start, end in _split_points(paragraph, _SENTENCE_BREAK, local):
+        pieces.append((paragraph[pos:start], paragraph[start:end]))
+        pos = end
+    pieces.append((paragraph[pos:], ""))
+    return pieces
+
+
+def join_chunks(coded, chunks) -> str:
+    """
+    Reassemble coded chunks in order with their original separators.
+
+    Args:
+        coded (list): The coded text of every chunk, in order.
+        chunks (list): The (chunk, separator) pairs from ``split_letter``.
+
+    Returns:
+        str: The coded letter.
+    """
+    return "".join(
+        part.strip("\n") + separator for part, (_, separator) in zip(coded, chunks)
+    )
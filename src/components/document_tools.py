@@ -0,0 +1,134 @@
+"""
+Agent tools that edit a document kept in the graph state.
+
+``search_and_replace`` and ``replace_titels_with_nogle`` take and return the
+whole letter, so every tool call costs the full text twice, on every ReAct
+iteration. The tools here take a document handle instead: the text lives in
+``DocumentState["documents"]``, the tools update it through a ``Command`` and
+answer with a replacement count and a few examples, so a call costs the same
+number of tokens however long the letter is.
+
+Imported by ``agent.build_document_graph`` on first use (it needs langchain
+and langgraph).
+"""
+
+from typing import Annotated
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import InjectedToolCallId, tool
+from langgraph.graph import MessagesState
+from langgraph.prebuilt import InjectedState
+from langgraph.types import Command
+
+from components.tools import get_mapping_version, lookup_titles
+
+DEFAULT_HANDLE = "brev"
+MAX_EXAMPLES = 3
+VIEW_LIMIT = 2000
+
+
+def _merge_documents(left: dict, right: dict) -> dict:
+    return {**(left or {}), **(right or {})}
+
+
+class DocumentState(MessagesState):
+    # Document handle -> current text
+    documents: Annotated[dict, _merge_documents]
+
+
+def _document(state: dict, handle: str) -> str:
+    documents = state.get("documents") or {}
+    if handle not in documents:
+        raise ValueError(
+            f"Unknown document handle {handle!r}; known: {', '.join(documents)}"
+        )
+    return documents[handle]
+
+
+def _updated(handle: str, text: str, tool_call_id: str, summary: str) -> Command:
+    return Command(
+        update={
+            "documents": {handle: text},
+            "messages": [ToolMessage(summary, tool_call_id=tool_call_id)],
+        }
+    )
+
+
+@tool
+def search_and_replace_in_document(
+    handle: str,
+    search: str,
+    replace: str,
+    state: Annotated[dict, InjectedState],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
+    """
+    Replace every occurrence of 'search' with 'replace' in the document with the
+    given handle. Returns the number of replacements, not the text.
+    """
+    text = _document(state, handle)
+    count = text.count(search) if search else 0
+    if not count:
+        return _updated(handle, text, tool_call_id, f"No occurrences in {handle!r}.")
+    first = text.find(search)
+    return _updated(
+        handle,
+        text.replace(search, replace),
+        tool_call_id,
+        f"Replaced {count} occurrence(s) in {handle!r}, first at offset {first}.",
+    )
+
+
+@tool
+def replace_titles_in_document(
+    handle: str,
+    replacement_template: str,
+    state: Annotated[dict, InjectedState],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
+    """
+    Replace every Titel from the key list found in the document with
+    'replacement_template'; '<NØGLE>' in the template becomes the title's key.
+    Returns the number of replacements and a few examples, not the text.
+    """
+    text = _document(state, handle)
+    examples = []
+    count = 0
+
+    def replace(titel, nøgle):
+        nonlocal count
+        count += 1
+        if len(examples) < MAX_EXAMPLES:
+            examples.append(f"{titel!r} -> {nøgle!r}")
+        return replacement_template.replace("<NØGLE>", nøgle)
+
+    text = get_mapping_version().matcher.sub(replace, text)
+    summary = f"Replaced {count} title(s) in {handle!r}."
+    if examples:
+        summary += " Examples: " + "; ".join(examples)
+    return _updated(handle, text, tool_call_id, summary)
+
+
+@tool
+def view_document(
+    handle: str,
+    state: Annotated[dict, InjectedState],
+    start: int = 0,
+    length: int = VIEW_LIMIT,
+) -> str:
+    """
+    Return part of the current text of the document with the given handle,
+    from character offset 'start' (at most 2000 characters).
+    """
+    text = _document(state, handle)
+    start = max(0, start)
+    end = min(len(text), start + max(0, min(length, VIEW_LIMIT)))
+    return f"[{start}:{end} of {len(text)}]\n{text[start:end]}"
+
+
+DOCUMENT_TOOLS = [
+    search_and_replace_in_document,
+    replace_titles_in_document,
+    view_document,
+    lookup_titles,
+]
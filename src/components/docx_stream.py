@@ -0,0 +1,356 @@
+"""
+Streaming MERGEFIELD/IF converter working directly on ``word/document.xml``.
+
+``convert_text_to_mergefields`` loads the whole package into python-docx objects.
+This converter instead streams the main document part through lxml's iterparse,
+converts one top-level body block (paragraph, table, ...) at a time, writes it
+out and frees it, so memory stays bounded on very long letters. All other
+package parts are copied unchanged.
+"""
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+
+from components.field_syntax import find_fields
+from components.fields import MergeField, field_run
+from components.runs import W_NS, ParagraphText
+from components.stories import is_story_part, story_paragraphs
+
+DOCUMENT_PART = "word/document.xml"
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+_P, _R, _T, _HYPERLINK = _w("p"), _w("r"), _w("t"), _w("hyperlink")
+_RUN_TEXT = {_w("tab"): "\t", _w("br"): "\n", _w("cr"): "\n", _w("noBreakHyphen"): "-"}
+
+
+def _run_text(r) -> str:
+    parts = []
+    for child in r:
+        if child.tag == _T:
+            parts.append(child.text or "")
+        elif child.tag in _RUN_TEXT:
+            parts.append(_RUN_TEXT[child.tag])
+    return "".join(parts)
+
+
+def _paragraph_text(p) -> str:
+    # Mirrors python-docx Paragraph.text: runs and hyperlink runs
+    return "".join(
+        _run_text(r)
+        for child in p
+        if child.tag in (_R, _HYPERLINK)
+        for r in ([child] if child.tag == _R else child.iterchildren(_R))
+    )
+
+
+def _text_fields(text: str, matcher=None) -> list:
+    # (start, end, field) for every typed field, plus titles between them
+    fields = []
+    pos = 0
+    for field_start, field_end, field, _ in find_fields(text):
+        if matcher is not None and field_start > pos:
+            fields.extend(
+                (pos + start, pos + end, MergeField(nøgle))
+                for start, end, _, nøgle in matcher.finditer(text[pos:field_start])
+            )
+        fields.append((field_start, field_end, field))
+        pos = field_end
+    if matcher is not None and pos < len(text):
+        fields.extend(
+            (pos + start, pos + end, MergeField(nøgle))
+            for start, end, _, nøgle in matcher.finditer(text[pos:])
+        )
+    return fields
+
+
+def convert_paragraph(p, matcher=None) -> int:
+    """
+    Convert the placeholders in one ``w:p`` element in place.
+
+    Every typed field (``{ MERGEFIELD key }``, ``{ IF ... }``, nested to any
+    depth) becomes a field run, also when it is split over several runs; the
+    text around it is kept.
+
+    Args:
+        p (lxml.etree._Element): The paragraph element.
+        matcher (TitleMatcher, optional): If given, titles found in the runs
+            are turned into MERGEFIELDs for their Nøgle as well.
+
+    Returns:
+        int: Number of fields created.
+    """
+    if matcher is None and "{" not in _paragraph_text(p):
+        return 0
+
+    # Match over the whole paragraph so placeholders and titles split across
+    # runs are found too
+    text = ParagraphText(p)
+    fields = _text_fields(text.text, matcher)
+    if not fields:
+        return 0
+    return text.rewrite(
+        (start, end, lambda rPr, field=field: [field_run(field)])
+        for start, end, field in fields
+    )
+
+
+def _convert_block(elem, matcher=None) -> int:
+    # The block itself if it is a paragraph, and every paragraph inside it
+    # (tables, content controls, text boxes)
+    return sum(convert_paragraph(p, matcher) for p in story_paragraphs(elem))
+
+
+def convert_story_xml(data: bytes, matcher=None) -> tuple:
+    """
+    Convert a header, footer, footnotes or endnotes part. These are small, so
+    they are parsed whole instead of streamed.
+
+    Args:
+        data (bytes): The part XML.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        tuple: (int, bytes) - Number of fields created and the converted part.
+    """
+    from lxml import etree
+
+    root = etree.fromstring(data)
+    count = _convert_block(root, matcher)
+    if not count:
+        return 0, data
+    return count, etree.tostring(
+        root, xml_declaration=True, encoding="UTF-8", standalone=True
+    )
+
+
+# Tag name followed by the namespace declarations lxml puts on a serialized subtree
+_HEAD_DECLARATIONS = re.compile(rb'<[\w.:-]+((?:\s+xmlns(?::[\w.-]+)?="[^"]*")*)')
+_XMLNS_DECLARATION = re.compile(rb'\s+xmlns(?::([\w.-]+))?="([^"]*)"')
+
+
+class _PartWriter:
+    """Writes streamed elements, dropping namespace declarations already in scope."""
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.declared = set()
+        self._stripped = {}
+
+    def _strip(self, data: bytes) -> bytes:
+        # lxml repeats every in-scope namespace on a serialized subtree; drop the
+        # ones the streamed ancestors already declared. Blocks share the same
+        # declarations, so the stripped form is computed once and reused.
+        m = _HEAD_DECLARATIONS.match(data)
+        declarations = m.group(1)
+        if not declarations:
+            return data
+        stripped = self._stripped.get(declarations)
+        if stripped is None:
+            stripped = _XMLNS_DECLARATION.sub(
+                lambda d: (
+                    b""
+                    if (d.group(1) or b"", d.group(2)) in self.declared
+                    else d.group(0)
+                ),
+                declarations,
+            )
+            self._stripped[declarations] = stripped
+        return data[: m.start(1)] + stripped + data[m.end(1) :]
+
+    def open(self, elem):
+        from lxml import etree
+
+        shell = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+        data = self._strip(etree.tostring(shell))
+        self.declared.update(
+            ((prefix or "").encode("utf-8"), uri.encode("utf-8"))
+            for prefix, uri in elem.nsmap.items()
+        )
+        self._stripped.clear()
+        self.destination.write(data[: -len(b"/>")].rstrip() + b">")
+
+    def close(self, elem):
+        name = elem.tag.rsplit("}", 1)[-1]
+        if elem.prefix:
+            name = f"{elem.prefix}:{name}"
+        self.destination.write(f"</{name}>".encode("utf-8"))
+
+    def write(self, elem):
+        from lxml import etree
+
+        self.destination.write(self._strip(etree.tostring(elem, with_tail=False)))
+
+
+_DOCUMENT, _BODY = _w("document"), _w("body")
+# Common body-level blocks; any other body child is flushed with the next one
+_STREAMED_TAGS = (_DOCUMENT, _BODY, _P, _w("tbl"), _w("sdt"), _w("sectPr"))
+
+
+def convert_document_xml(source, destination, matcher=None) -> int:
+    """
+    Stream a ``word/document.xml`` part from ``source`` to ``destination``,
+    converting placeholders block by block.
+
+    Args:
+        source (file-like): Readable binary stream with the part.
+        destination (file-like): Writable binary stream for the converted part.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        int: Number of fields created.
+    """
+    from lxml import etree
+
+    writer = _PartWriter(destination)
+    count = 0
+
+    def flush(parent, upto=None):
+        # Convert, write and free the parent's children up to and including upto
+        nonlocal count
+        while len(parent):
+            child = parent[0]
+            if child.tag == _BODY:
+                return
+            count += _convert_block(child, matcher)
+            writer.write(child)
+            del parent[0]
+            if child is upto:
+                return
+
+    destination.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n')
+    for event, elem in etree.iterparse(
+        source, events=("start", "end"), tag=_STREAMED_TAGS
+    ):
+        if elem.tag == _DOCUMENT or elem.tag == _BODY:
+            if event == "start":
+                if elem.tag == _BODY:
+                    flush(elem.getparent())
+                writer.open(elem)
+            else:
+                flush(elem)
+                writer.close(elem)
+                if elem.tag == _BODY:
+                    # Written: what follows the body is flushed with the document
+                    elem.getparent().remove(elem)
+        elif event == "end":
+            parent = elem.getparent()
+            if parent is not None and parent.tag == _BODY:
+                flush(parent, elem)
+    return count
+
+
+def convert_package(source, destination, matcher=None) -> int:
+    """
+    Copy a .docx/.docm package, converting placeholders in the main document
+    (streamed) and in the headers, footers, footnotes and endnotes. Unlike
+    ``convert_docx_stream`` errors are raised, not reported.
+
+    Args:
+        source (str or file-like): The input package.
+        destination (str or file-like): Where to write the converted package.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        int: Number of fields created.
+    """
+    count = 0
+    with (
+        zipfile.ZipFile(source) as zin,
+        zipfile.ZipFile(destination, "w", zipfile.ZIP_DEFLATED) as zout,
+    ):
+        for item in zin.infolist():
+            target = zipfile.ZipInfo(item.filename, item.date_time)
+            target.compress_type = item.compress_type
+            target.external_attr = item.external_attr
+            with zin.open(item) as src, zout.open(target, "w") as dst:
+                if item.filename == DOCUMENT_PART:
+                    count += convert_document_xml(src, dst, matcher)
+                elif is_story_part(item.filename):
+                    converted, data = convert_story_xml(src.read(), matcher)
+                    count += converted
+                    dst.write(data)
+                else:
+                    shutil.copyfileobj(src, dst)
+    return count
+
+
+def convert_bytes(docx, matcher=None) -> tuple:
+    """
+    Convert a package held in memory.
+
+    Args:
+        docx (bytes or file-like): The input package, e.g. an upload.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        tuple: (int, bytes) - Number of fields created and the converted package.
+    """
+    if isinstance(docx, (bytes, bytearray, memoryview)):
+        docx = io.BytesIO(docx)
+    output = io.BytesIO()
+    count = convert_package(docx, output, matcher)
+    return count, output.getvalue()
+
+
+def convert_file(docx_path: str, output_path: str = None, matcher=None) -> int:
+    """
+    Convert a package on disk. The result is written to a temporary file next to
+    the output and moved into place only when conversion succeeded.
+
+    Args:
+        docx_path (str): The input .docx/.docm file.
+        output_path (str, optional): Output file. If None, ``docx_path`` is replaced.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        int: Number of fields created.
+    """
+    output_path = output_path or docx_path
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, suffix=os.path.splitext(output_path)[1]
+    )
+    os.close(fd)
+    try:
+        count = convert_package(docx_path, tmp_path, matcher)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return count
+
+
+def convert_docx_stream(docx_path, output_path=None, matcher=None) -> tuple:
+    """
+    Convert mergefield-like placeholders and IF fields into real Word fields
+    without loading the document through python-docx.
+
+    Args:
+        docx_path (str or file-like): The input .docx/.docm package.
+        output_path (str or file-like, optional): Where to write the result. If
+            None, ``docx_path`` (a path) is replaced.
+        matcher (TitleMatcher, optional): Also turn titles into MERGEFIELDs.
+
+    Returns:
+        tuple: (bool, str) - Success flag and a short summary.
+    """
+    try:
+        if isinstance(output_path, (str, type(None))):
+            count = convert_file(docx_path, output_path, matcher)
+        else:
+            count = convert_package(docx_path, output_path, matcher)
+        return (count > 0, f"Converted {count} fields")
+
+    except Exception as e:
+        import traceback
+
+        error_details = traceback.format_exc()
+        return (False, f"Error: {str(e)}\n{error_details}")
@@ -0,0 +1,328 @@
+"""
+Parser for typed field codes: ``{ MERGEFIELD key }`` and
+``{ IF "J" = "{ MERGEFIELD key }" "true" "false" }`` written as plain text in a
+letter.
+
+One pass over the text pairs every brace with a stack; braces without a partner
+are text. A second pass parses each brace group once, skipping over the groups
+nested in it after they have been parsed, so the whole paragraph is parsed in
+linear time. The result is an AST with source offsets:
+
+* ``Group`` - a brace group; ``name`` is its first word (``IF``, ``MERGEFIELD``)
+  and ``args`` its arguments,
+* ``Quoted`` - a quoted argument; quotes are ``"``, ``“``, ``”``, ``„`` and
+  ``''`` (Word's autocorrect mixes them), and its ``parts`` are text and groups,
+* ``Word`` - a bare argument: a key, an operator or a switch.
+
+``find_fields`` returns the outermost groups that are valid fields as
+``components.fields`` expressions; the text around them is left alone.
+"""
+
+from components.fields import Compare, IfField, MergeField
+
+_QUOTES = frozenset('"“”„')
+_OPERATORS = frozenset("=<>")
+_COMPARISONS = frozenset({"=", "<>", "<", ">", "<=", ">="})
+_SPACE = frozenset(" \t\n\r\xa0")
+
+# Groups nested deeper than this are not parsed (no letter nests fields this
+# deep; it keeps the recursion bounded on garbage input)
+MAX_DEPTH = 64
+
+
+class Word:
+    """A bare argument, e.g. a key, ``=`` or ``\\*``."""
+
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start: int, end: int, text: str):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"Word({self.start}, {self.end}, {self.text!r})"
+
+
+class Quoted:
+    """A quoted argument; ``parts`` are strings and nested ``Group`` nodes."""
+
+    __slots__ = ("start", "end", "parts")
+
+    def __init__(self, start: int, end: int, parts: list):
+        self.start = start
+        self.end = end
+        self.parts = parts
+
+    @property
+    def text(self):
+        """The quoted text if it holds no groups, otherwise None."""
+        if all(isinstance(part, str) for part in self.parts):
+            return "".join(self.parts)
+        return None
+
+    def __repr__(self) -> str:
+        return f"Quoted({self.start}, {self.end}, {self.parts!r})"
+
+
+class Group:
+    """
+    A brace group ``{ ... }``.
+
+    Attributes:
+        start (int): Offset of ``{``.
+        end (int): Offset after ``}``.
+        name (str): First word, upper-cased, or None if it does not start with
+            a word.
+        args (list): ``Word``, ``Quoted`` and ``Group`` nodes after the name.
+    """
+
+    __slots__ = ("start", "end", "name", "args")
+
+    def __init__(self, start: int, end: int, name, args: list):
+        self.start = start
+        self.end = end
+        self.name = name
+        self.args = args
+
+    def children(self) -> list:
+        """The groups directly inside this one, also those inside quotes."""
+        groups = []
+        for arg in self.args:
+            if isinstance(arg, Group):
+                groups.append(arg)
+            elif isinstance(arg, Quoted):
+                groups.extend(part for part in arg.parts if isinstance(part, Group))
+        return groups
+
+    def to_field(self):
+        """
+        The field this group describes, or None if it is not a valid
+        MERGEFIELD or IF field.
+        """
+        if self.name == "MERGEFIELD":
+            if not self.args or not isinstance(self.args[0], Word):
+                return None
+            switches = []
+            for arg in self.args[1:]:
+                if isinstance(arg, Word) and (switches or arg.text.startswith("\\")):
+                    switches.append(arg.text)
+                elif isinstance(arg, Quoted) and switches and arg.text is not None:
+                    switches.append(f'"{arg.text}"')
+                else:
+                    return None
+            return MergeField(self.args[0].text, " ".join(switches))
+        if self.name == "IF":
+            return self._if_field()
+        return None
+
+    def _if_field(self):
+        args = self.args
+        operands = [_operand(arg) for arg in args]
+        if any(operand is None for operand in operands):
+            return None
+        ops = [
+            i
+            for i, arg in enumerate(args)
+            if isinstance(arg, Word) and arg.text in _COMPARISONS
+        ]
+        if ops:
+            # { IF left op right "true" ["false"] }
+            if ops != [1] or len(args) not in (4, 5):
+                return None
+            condition = Compare(operands[0], args[1].text, operands[2])
+            results = operands[3:]
+        elif len(args) == 4:
+            # Placeholder shorthand: { IF "J" "{ MERGEFIELD key }" "true" "false" }
+            condition = Compare(operands[0], "=", operands[1])
+            results = operands[2:]
+        elif len(args) in (2, 3):
+            # { IF { MERGEFIELD key } "true" ["false"] }
+            condition = operands[0]
+            results = operands[1:]
+        else:
+            return None
+        return IfField(condition, *results)
+
+
+def _operand(arg):
+    # An argument as a components.fields operand: str, Field or list of both
+    if isinstance(arg, Word):
+        return arg.text
+    if isinstance(arg, Group):
+        return arg.to_field()
+    parts = []
+    for part in arg.parts:
+        if isinstance(part, Group):
+            part = part.to_field()
+            if part is None:
+                return None
+        parts.append(part)
+    if len(parts) == 1:
+        return parts[0]
+    if (
+        len(parts) == 3
+        and isinstance(parts[0], str)
+        and isinstance(parts[2], str)
+        and not isinstance(parts[1], str)
+        and not parts[0].strip()
+        and not parts[2].strip()
+    ):
+        # " { MERGEFIELD key } ": the field with stray spaces around it
+        return parts[1]
+    return parts or ""
+
+
+def match_braces(text: str) -> dict:
+    """
+    Pair the braces of ``text``.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        dict: Offset of every ``{`` that has a partner -> offset of its ``}``.
+    """
+    pairs = {}
+    stack = []
+    for i, char in enumerate(text):
+        if char == "{":
+            stack.append(i)
+        elif char == "}" and stack:
+            pairs[stack.pop()] = i
+    return pairs
+
+
+def _quote_length(text: str, i: int) -> int:
+    # Length of the quote starting at i, 0 if there is none
+    if text[i] in _QUOTES:
+        return 1
+    if text.startswith("''", i):
+        return 2
+    return 0
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pairs = match_braces(text)
+
+    def group(self, start: int, depth: int = 0) -> Group:
+        # Parse the group opened at start; nested groups are parsed once, by
+        # the recursive call, and then skipped
+        text = self.text
+        end = self.pairs[start]
+        if depth > MAX_DEPTH:
+            return Group(start, end + 1, None, [])
+        args = []
+        i = start + 1
+        while i < end:
+            char = text[i]
+            if char in _SPACE:
+                i += 1
+            elif char == "{" and i in self.pairs:
+                nested = self.group(i, depth + 1)
+                args.append(nested)
+                i = nested.end
+            elif _quote_length(text, i):
+                quoted = self.quoted(i, end, depth)
+                args.append(quoted)
+                i = quoted.end
+            elif char in _OPERATORS:
+                j = i + 1
+                while j < end and text[j] in _OPERATORS:
+                    j += 1
+                args.append(Word(i, j, text[i:j]))
+                i = j
+            else:
+                j = i + 1
+                while (
+                    j < end
+                    and text[j] not in _SPACE
+                    and text[j] not in _OPERATORS
+                    and text[j] != "{"
+                    and not _quote_length(text, j)
+                ):
+                    j += 1
+                args.append(Word(i, j, text[i:j]))
+                i = j
+        name = None
+        if args and isinstance(args[0], Word) and args[0].text.isalpha():
+            name = args.pop(0).text.upper()
+        return Group(start, end + 1, name, args)
+
+    def quoted(self, start: int, limit: int, depth: int) -> Quoted:
+        # A quote runs to the next quote outside nested groups, or to the end
+        # of the enclosing group if it is never closed
+        text = self.text
+        i = start + _quote_length(text, start)
+        parts = []
+        piece = i
+        while i < limit:
+            if text[i] == "{" and i in self.pairs:
+                if i > piece:
+                    parts.append(text[piece:i])
+                nested = self.group(i, depth + 1)
+                parts.append(nested)
+                i = piece = nested.end
+                continue
+            length = _quote_length(text, i)
+            if length:
+                if i > piece:
+                    parts.append(text[piece:i])
+                return Quoted(start, i + length, parts)
+            i += 1
+        if limit > piece:
+            parts.append(text[piece:limit])
+        return Quoted(start, limit, parts)
+
+
+def parse(text: str) -> list:
+    """
+    Parse all top-level brace groups of ``text``.
+
+    Args:
+        text (str): Paragraph text.
+
+    Returns:
+        list: ``Group`` nodes in text order; the text between them is not
+            part of any group.
+    """
+    if "{" not in text:
+        return []
+    parser = _Parser(text)
+    groups = []
+    i = 0
+    for start in sorted(parser.pairs):
+        if start < i:
+            continue
+        group = parser.group(start)
+        groups.append(group)
+        i = group.end
+    return groups
+
+
+def find_fields(text: str) -> list:
+    """
+    Find the fields typed in ``text``.
+
+    Groups that are not valid fields are searched for fields inside them, so a
+    field in a stray pair of braces is still found.
+
+    Args:
+        text (str): Paragraph text.
+
+    Returns:
+        list: (start, end, field, group) for every outermost valid field in text
+            order, ``field`` being a ``components.fields`` expression.
+    """
+    found = []
+    pending = parse(text)[::-1]
+    while pending:
+        group = pending.pop()
+        field = group.to_field()
+        if field is not None:
+            found.append((group.start, group.end, field, group))
+        else:
+            pending.extend(group.children()[::-1])
+    return found
@@ -0,0 +1,274 @@
+"""
+Word field construction.
+
+Every converter emits the same few elements: a run holding ``fldChar begin``,
+the instruction text, ``fldChar separate`` and ``fldChar end``. They are parsed
+once into templates and deep-copied per field instead of being assembled
+attribute by attribute, so every converter produces identical field XML.
+
+A field is either a raw instruction string (``" MERGEFIELD navn "``) or an
+expression built from ``MergeField``, ``Compare`` and ``IfField``, which can be
+nested to any depth; nested fields become real nested fields inside the
+instruction of the outer one::
+
+    IfField(Compare("J", "=", MergeField("ab-borger-enlig")), MergeField("Html:x"))
+
+``append_runs`` builds all the runs of a paragraph (text and fields) and adds
+them in one call.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from copy import deepcopy
+
+from components.runs import W_NS, XML_SPACE
+
+_BREAKS = re.compile(r"([\t\n])")
+
+
+class Field(ABC):
+    """Base class of field expressions."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def parts(self) -> list:
+        """
+        The instruction as a list of strings and nested ``Field`` objects.
+        """
+
+    def __str__(self) -> str:
+        # The field code as Word shows it with Alt+F9
+        return "{" + "".join(str(part) for part in self.parts()) + "}"
+
+
+class Instruction(Field):
+    """
+    A field with a literal instruction, e.g. ``Instruction(" MERGEFIELD navn ")``.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def parts(self) -> list:
+        return [self.text]
+
+
+class MergeField(Field):
+    """``{ MERGEFIELD key }``, optionally with switches such as ``\\* MERGEFORMAT``."""
+
+    __slots__ = ("key", "switches")
+
+    def __init__(self, key: str, switches: str = ""):
+        self.key = key
+        self.switches = switches
+
+    def parts(self) -> list:
+        if self.switches:
+            return [f" MERGEFIELD {self.key} {self.switches} "]
+        return [f" MERGEFIELD {self.key} "]
+
+
+class Compare(Field):
+    """
+    A comparison inside an IF instruction, e.g. ``"J" = "{ MERGEFIELD a }"``.
+    Not a field by itself; operands are strings (quoted) or fields.
+    """
+
+    __slots__ = ("left", "op", "right")
+
+    def __init__(self, left, op: str, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+    def parts(self) -> list:
+        return [*_operand(self.left), f" {self.op} ", *_operand(self.right)]
+
+    def __str__(self) -> str:
+        return "".join(str(part) for part in self.parts())
+
+
+class IfField(Field):
+    """
+    ``{ IF condition "true" "false" }``; ``condition`` is a ``Compare``, a field
+    or a string, the results are strings, fields or lists of both (quoted text
+    with fields in it). Without ``false`` the field shows nothing when the
+    condition is false.
+    """
+
+    __slots__ = ("condition", "true", "false")
+
+    def __init__(self, condition, true, false=None):
+        self.condition = condition
+        self.true = true
+        self.false = false
+
+    def parts(self) -> list:
+        if isinstance(self.condition, Compare):
+            condition = self.condition.parts()
+        else:
+            condition = _operand(self.condition)
+        parts = [" IF ", *condition, " ", *_operand(self.true)]
+        if self.false is not None:
+            parts += [" ", *_operand(self.false)]
+        parts.append(" ")
+        return parts
+
+
+def _operand(value) -> list:
+    if isinstance(value, Field):
+        return ['"', value, '"']
+    if isinstance(value, list):
+        return ['"', *value, '"']
+    return [f'"{value}"']
+
+
+def if_instruction(cond, mergefield, true_text, false_text) -> str:
+    """Instruction text of an IF field on a MERGEFIELD."""
+    if cond == "J":
+        return (
+            f' IF "J" = "{{ MERGEFIELD {mergefield} }}" "{true_text}" "{false_text}" '
+        )
+    return f' IF "{cond}" "{{ MERGEFIELD {mergefield} }}" "{true_text}" "{false_text}" '
+
+
+# --- Templates ---
+
+_TEMPLATES = None
+
+
+def _templates() -> dict:
+    # Parsed with python-docx's parser so the copies are its element classes
+    # (CT_R ...) when they end up in a python-docx document
+    global _TEMPLATES
+    if _TEMPLATES is None:
+        from docx.oxml import parse_xml
+
+        ns = f'xmlns:w="{W_NS}"'
+        _TEMPLATES = {
+            "r": parse_xml(f"<w:r {ns}/>"),
+            "t": parse_xml(f'<w:t {ns} xml:space="preserve"/>'),
+            "tab": parse_xml(f"<w:tab {ns}/>"),
+            "br": parse_xml(f"<w:br {ns}/>"),
+            "instrText": parse_xml(f'<w:instrText {ns} xml:space="preserve"/>'),
+            # The whole run of a field without nested fields
+            "field": parse_xml(
+                f'<w:r {ns}><w:fldChar w:fldCharType="begin"/>'
+                '<w:instrText xml:space="preserve"/>'
+                '<w:fldChar w:fldCharType="separate"/>'
+                '<w:fldChar w:fldCharType="end"/></w:r>'
+            ),
+            **{
+                kind: parse_xml(f'<w:fldChar {ns} w:fldCharType="{kind}"/>')
+                for kind in ("begin", "separate", "end")
+            },
+        }
+    return _TEMPLATES
+
+
+def _instr_text(text: str):
+    instr = deepcopy(_templates()["instrText"])
+    instr.text = text
+    return instr
+
+
+def field_elements(field) -> list:
+    """
+    The ``fldChar``/``instrText`` elements of a field, nested fields included.
+
+    Args:
+        field (Field or str): The field, or its instruction text.
+
+    Returns:
+        list: The elements, to be put into a ``w:r``.
+    """
+    templates = _templates()
+    parts = [field] if isinstance(field, str) else field.parts()
+    elements = [deepcopy(templates["begin"])]
+    text = []
+    for part in parts:
+        if isinstance(part, str):
+            text.append(part)
+            continue
+        if text:
+            elements.append(_instr_text("".join(text)))
+            text = []
+        elements.extend(field_elements(part))
+    if text:
+        elements.append(_instr_text("".join(text)))
+    elements.append(deepcopy(templates["separate"]))
+    elements.append(deepcopy(templates["end"]))
+    return elements
+
+
+def field_run(field, rPr=None):
+    """
+    Return a new ``w:r`` holding a complete field.
+
+    Args:
+        field (Field or str): The field, or its instruction text.
+        rPr (optional): ``w:rPr`` to copy into the run.
+
+    Returns:
+        The ``w:r`` element.
+    """
+    templates = _templates()
+    parts = [field] if isinstance(field, str) else field.parts()
+    if all(isinstance(part, str) for part in parts):
+        # No nested fields: one copy of the whole run
+        r = deepcopy(templates["field"])
+        r[1].text = "".join(parts)
+    else:
+        r = deepcopy(templates["r"])
+        r.extend(field_elements(field))
+    if rPr is not None:
+        r.insert(0, deepcopy(rPr))
+    return r
+
+
+def text_run(text: str, rPr=None):
+    """
+    Return a new ``w:r`` with plain text; tabs and line breaks become ``w:tab``
+    and ``w:br`` as in python-docx.
+    """
+    templates = _templates()
+    r = deepcopy(templates["r"])
+    if rPr is not None:
+        r.append(deepcopy(rPr))
+    for piece in _BREAKS.split(text):
+        if piece == "\t" or piece == "\n":
+            r.append(deepcopy(templates["tab" if piece == "\t" else "br"]))
+        elif piece:
+            t = deepcopy(templates["t"])
+            t.text = piece
+            if piece.strip() == piece:
+                del t.attrib[XML_SPACE]
+            r.append(t)
+    return r
+
+
+def append_runs(p, items, rPr=None) -> int:
+    """
+    Append text and field runs to a paragraph in one go.
+
+    Args:
+        p: The ``w:p`` element.
+        items (iterable): Strings (plain text) and ``Field`` objects.
+        rPr (optional): ``w:rPr`` copied into every new run.
+
+    Returns:
+        int: Number of fields appended.
+    """
+    runs = []
+    fields = 0
+    for item in items:
+        if isinstance(item, Field):
+            runs.append(field_run(item, rPr))
+            fields += 1
+        elif item:
+            runs.append(text_run(item, rPr))
+    p.extend(runs)
+    return fields
@@ -0,0 +1,233 @@
+"""
+Background jobs for long conversions.
+
+Streamlit runs the script in the user's session thread and reruns it on every
+widget change, so work done inline blocks the session and is lost on a rerun.
+``JobRunner`` runs conversions on a small thread pool instead. Every job has an
+id the UI keeps in session state, records progress events as it goes (one per
+stage or chunk), can be cancelled, and keeps its result until it is collected
+or pushed out by newer jobs. The UI polls ``JobRunner.get`` instead of waiting.
+
+Cancellation is cooperative: a queued job never starts, a running job stops at
+its next ``Job.progress`` call.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = frozenset({DONE, FAILED, CANCELLED})
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_JOBS = 50
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when its job has been cancelled."""
+
+
+class Job:
+    """
+    One background job.
+
+    Attributes:
+        id (str): Job id.
+        label (str): Short description shown in the UI.
+        status (str): One of ``PENDING``, ``RUNNING``, ``DONE``, ``FAILED`` and
+            ``CANCELLED``.
+        events (list): Progress events as dicts with stage, done, total, message
+            and time (seconds since the job was submitted).
+        result: The job function's return value, once ``DONE``.
+        error (str): The exception message, once ``FAILED``.
+    """
+
+    def __init__(self, job_id: str, label: str = ""):
+        self.id = job_id
+        self.label = label
+        self.status = PENDING
+        self.events = []
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation was requested."""
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from submission until now, or until the job finished."""
+        return (self.finished or time.monotonic()) - self.submitted
+
+    @property
+    def latest(self):
+        """The most recent progress event, or None."""
+        with self._lock:
+            return self.events[-1] if self.events else None
+
+    def progress(
+        self, stage: str, done: int = None, total: int = None, message: str = ""
+    ) -> None:
+        """
+        Record a progress event. Called by the job function.
+
+        Args:
+            stage (str): Current stage, e.g. "convert" or "chunk".
+            done (int, optional): Units of the stage completed.
+            total (int, optional): Units of the stage in total.
+            message (str, optional): Free text for the UI.
+
+        Raises:
+            JobCancelled: If the job has been cancelled.
+        """
+        if self.cancelled:
+            raise JobCancelled(self.id)
+        event = {
+            "stage": stage,
+            "done": done,
+            "total": total,
+            "message": message,
+            "time": round(time.monotonic() - self.submitted, 3),
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def fraction(self):
+        """Completed fraction of the latest stage with a total, or None."""
+        with self._lock:
+            for event in reversed(self.events):
+                if event["total"]:
+                    return min(1.0, (event["done"] or 0) / event["total"])
+        return None
+
+    def _finish(self, status: str, result=None, error: str = None) -> None:
+        self.result = result
+        self.error = error
+        self.finished = time.monotonic()
+        self.status = status
+
+
+class JobRunner:
+    """
+    Runs job functions on a thread pool and keeps the most recent jobs.
+
+    Args:
+        max_workers (int, optional): Jobs running at the same time.
+        max_jobs (int, optional): Jobs kept; the oldest finished jobs are
+            forgotten beyond this.
+    """
+
+    def __init__(
+        self, max_workers: int = DEFAULT_MAX_WORKERS, max_jobs: int = DEFAULT_MAX_JOBS
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="brevkoder-job"
+        )
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._max_jobs = max_jobs
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, label: str = "", **kwargs) -> Job:
+        """
+        Start ``func(job, *args, **kwargs)`` in the background.
+
+        The function reports progress with ``job.progress(...)`` and returns the
+        job's result.
+
+        Args:
+            func (callable): The job function.
+            *args: Passed on to ``func``.
+            label (str, optional): Short description of the job.
+            **kwargs: Passed on to ``func``.
+
+        Returns:
+            Job: The new job.
+        """
+        with self._lock:
+            job = Job(f"job-{next(self._ids)}", label)
+            self._jobs[job.id] = job
+            self._prune()
+            # Stored before _run can drop it: a fast job's _run waits for the lock
+            self._futures[job.id] = self._executor.submit(
+                self._run, job, func, args, kwargs
+            )
+        return job
+
+    def _run(self, job: Job, func, args, kwargs) -> None:
+        if job.cancelled:
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            result = func(job, *args, **kwargs)
+        except JobCancelled:
+            job._finish(CANCELLED)
+        except Exception as e:
+            job._finish(FAILED, error=f"{type(e).__name__}: {e}")
+        else:
+            job._finish(CANCELLED if job.cancelled else DONE, result=result)
+        finally:
+            with self._lock:
+                self._futures.pop(job.id, None)
+
+    def _prune(self) -> None:
+        # Forget the oldest finished jobs beyond max_jobs
+        excess = len(self._jobs) - self._max_jobs
+        for job_id in [j.id for j in self._jobs.values() if j.status in FINISHED]:
+            if excess <= 0:
+                break
+            del self._jobs[job_id]
+            self._futures.pop(job_id, None)
+            excess -= 1
+
+    def get(self, job_id: str):
+        """Return the job with this id, or None if it is unknown or forgotten."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Request cancellation of a job.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            bool: True if the job was still pending or running.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job._cancel.set()
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                # Never started: the pool will not run it
+                job._finish(CANCELLED)
+                self._futures.pop(job_id, None)
+        return True
+
+    def jobs(self) -> list:
+        """All kept jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel every unfinished job and stop the pool."""
+        for job in self.jobs():
+            self.cancel(job.id)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,315 @@
+"""
+Persistent compiled index of a Titel -> Nøgle mapping file.
+
+Parsing the Excel/CSV key list with pandas is slow, so the parsed titles and keys,
+together with the compiled title matcher, are written once to a flat binary file
+in the user's cache directory. Later loads memory-map that file: they take a few
+milliseconds and the pages are shared between worker processes. The index is
+keyed by the source file's size, mtime and SHA-256, and rebuilt when it changes.
+
+File layout (native byte order, int32 arrays aligned to 4 bytes):
+
+    header      struct _HEADER
+    sections    titles/keys UTF-8 blobs with offset arrays, then the matcher's
+                edge_start, edge_chars, edge_targets, fail, depth and output
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from components.matcher import TitleMatcher, mapping_fingerprint, register_matcher
+
+_MAGIC = b"BRVKIDX1"
+_SECTIONS = (
+    "title_offsets",
+    "title_blob",
+    "key_offsets",
+    "key_blob",
+    "edge_start",
+    "edge_chars",
+    "edge_targets",
+    "fail",
+    "depth",
+    "output",
+)
+# magic, byte order, source size, source mtime_ns, source sha256, mapping
+# fingerprint, entry count, then (offset, length) for every section
+_HEADER = struct.Struct("<8s1sqq32s40sI" + "QQ" * len(_SECTIONS))
+
+
+def default_cache_dir() -> str:
+    """
+    Directory holding compiled mapping indexes. Override with the
+    ``BREVKODER_CACHE_DIR`` environment variable.
+    """
+    return os.environ.get("BREVKODER_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "brevkoder"
+    )
+
+
+class StringTable:
+    """Read-only sequence of strings stored as one UTF-8 blob plus offsets."""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        return str(self._blob[self._offsets[index] : self._offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class CompiledMapping:
+    """
+    A loaded mapping index: titles, keys and the compiled matcher over them.
+
+    Attributes:
+        path (str): The source Excel/CSV file.
+        sha256 (str): Hash of the source file content.
+        fingerprint (str): ``mapping_fingerprint`` of ``as_dict()``.
+        titles (StringTable): Titles, in source order.
+        keys (StringTable): Keys, aligned with ``titles``.
+        matcher (TitleMatcher): Compiled matcher over the titles.
+    """
+
+    def __init__(self, path, sha256, fingerprint, titles, keys, matcher):
+        self.path = path
+        self.sha256 = sha256
+        self.fingerprint = fingerprint
+        self.titles = titles
+        self.keys = keys
+        self.matcher = matcher
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def as_dict(self) -> dict:
+        """Return the mapping as an interned Titel -> Nøgle dict."""
+        return {
+            sys.intern(titel): sys.intern(nøgle)
+            for titel, nøgle in zip(self.titles, self.keys)
+        }
+
+
+def read_mapping_source(path) -> dict:
+    """
+    Parse a key list with pandas. Excel files use the "query" sheet (or the first
+    sheet); CSV files are ';'-separated. Rows without a title or key are dropped.
+
+    Args:
+        path (str or file-like): The .xlsx or .csv file.
+
+    Returns:
+        dict: Titel -> Nøgle, both as str. Empty if the columns are missing.
+    """
+    import pandas as pd
+
+    name = path if isinstance(path, str) else getattr(path, "name", "")
+    if str(name).lower().endswith(".csv"):
+        sheet = pd.read_csv(path, sep=";", encoding="utf-8-sig")
+    else:
+        df = pd.read_excel(path, sheet_name=None)
+        # Try to find the right sheet ("query" or first sheet)
+        sheet = df["query"] if "query" in df else next(iter(df.values()))
+    # Expect columns: "Titel" and "Nøgle"
+    if "Titel" not in sheet.columns or "Nøgle" not in sheet.columns:
+        return {}
+    sheet = sheet.dropna(subset=["Titel", "Nøgle"])
+    return dict(zip(sheet["Titel"].astype(str), sheet["Nøgle"].astype(str)))
+
+
+def _file_sha256(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def _index_path(path: str, cache_dir: str) -> str:
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{name}.idx")
+
+
+def _pack_strings(strings):
+    from array import array
+
+    offsets = array("i", [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets.tobytes(), bytes(blob)
+
+
+def _write_index(index_path, stat, sha256, mappings):
+    matcher = TitleMatcher.from_mapping(mappings)
+    title_offsets, title_blob = _pack_strings(matcher.titles)
+    key_offsets, key_blob = _pack_strings(matcher.keys)
+    sections = {
+        "title_offsets": title_offsets,
+        "title_blob": title_blob,
+        "key_offsets": key_offsets,
+        "key_blob": key_blob,
+        "edge_start": matcher.edge_start.tobytes(),
+        "edge_chars": matcher.edge_chars.tobytes(),
+        "edge_targets": matcher.edge_targets.tobytes(),
+        "fail": matcher.fail.tobytes(),
+        "depth": matcher.depth.tobytes(),
+        "output": matcher.output.tobytes(),
+    }
+    fingerprint = mapping_fingerprint(dict(zip(matcher.titles, matcher.keys)))
+
+    body = bytearray()
+    layout = []
+    for name in _SECTIONS:
+        # Keep int32 sections aligned for memoryview.cast
+        body += b"\x00" * (-(_HEADER.size + len(body)) % 4)
+        layout += [_HEADER.size + len(body), len(sections[name])]
+        body += sections[name]
+    header = _HEADER.pack(
+        _MAGIC,
+        sys.byteorder[0].encode("ascii"),
+        stat.st_size,
+        stat.st_mtime_ns,
+        sha256,
+        fingerprint.encode("ascii"),
+        len(matcher.titles),
+        *layout,
+    )
+
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(body)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _map_sections(data, layout, count: int) -> dict:
+    # Views on the sections of a mapped index; ValueError if the layout does
+    # not fit the file
+    view = memoryview(data)
+    sections = {}
+    for i, name in enumerate(_SECTIONS):
+        offset, length = layout[2 * i], layout[2 * i + 1]
+        if offset < _HEADER.size or offset + length > len(view):
+            raise ValueError(f"{name} lies outside the index file")
+        section = view[offset : offset + length]
+        sections[name] = section if name.endswith("_blob") else section.cast("i")
+    for strings in ("title", "key"):
+        offsets = sections[f"{strings}_offsets"]
+        blob = sections[f"{strings}_blob"]
+        if len(offsets) != count + 1 or offsets[0] != 0 or offsets[-1] != len(blob):
+            raise ValueError(f"{strings} offsets do not match the index")
+    return sections
+
+
+def _open_index(index_path, path, stat):
+    """Map an index file, or return None if it is missing, foreign or stale."""
+    try:
+        with open(index_path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _HEADER.size:
+        return None
+    fields = _HEADER.unpack(header)
+    magic, order, size, mtime_ns, sha256, fingerprint, count = fields[:7]
+    if magic != _MAGIC or order != sys.byteorder[0].encode("ascii"):
+        return None
+    if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        # Touched but maybe not changed (copy, checkout): compare content
+        if size != stat.st_size or _file_sha256(path) != sha256:
+            return None
+        try:
+            with open(index_path, "r+b") as f:
+                f.write(_HEADER.pack(magic, order, size, stat.st_mtime_ns, *fields[4:]))
+        except OSError:
+            pass
+    try:
+        with open(index_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        sections = _map_sections(data, fields[7:], count)
+        fingerprint = fingerprint.decode("ascii")
+    except (TypeError, ValueError):
+        # Truncated or corrupt (an interrupted copy, a full disk): a cache miss
+        return None
+
+    titles = StringTable(sections["title_blob"], sections["title_offsets"])
+    keys = StringTable(sections["key_blob"], sections["key_offsets"])
+    matcher = TitleMatcher(
+        titles,
+        keys,
+        sections["edge_start"],
+        sections["edge_chars"],
+        sections["edge_targets"],
+        sections["fail"],
+        sections["depth"],
+        sections["output"],
+    )
+    register_matcher(fingerprint, matcher)
+    return CompiledMapping(path, sha256.hex(), fingerprint, titles, keys, matcher)
+
+
+def load_compiled_mapping(path: str, cache_dir: str = None):
+    """
+    Load the compiled index for a key list, building it first if the source file
+    is new or has changed. The matcher is registered so ``compile_matcher`` on
+    the same mapping content reuses it instead of recompiling.
+
+    Args:
+        path (str): Path to the .xlsx or .csv key list.
+        cache_dir (str, optional): Where to keep index files. Defaults to
+            ``default_cache_dir()``.
+
+    Returns:
+        CompiledMapping or None: The loaded index, or None if the source file
+        does not exist or cannot be parsed.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    index_path = _index_path(path, cache_dir or default_cache_dir())
+    compiled = _open_index(index_path, path, stat)
+    if compiled is not None:
+        return compiled
+
+    sha256 = _file_sha256(path)
+    try:
+        mappings = read_mapping_source(path)
+    except Exception:
+        return None
+    try:
+        _write_index(index_path, stat, sha256, mappings)
+    except OSError:
+        # Read-only cache location: fall back to an in-memory index
+        matcher = TitleMatcher.from_mapping(mappings)
+        fingerprint = mapping_fingerprint(dict(zip(matcher.titles, matcher.keys)))
+        register_matcher(fingerprint, matcher)
+        return CompiledMapping(
+            path, sha256.hex(), fingerprint, matcher.titles, matcher.keys, matcher
+        )
+    return _open_index(index_path, path, stat)
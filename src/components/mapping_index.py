@@ -0,0 +1,257 @@
+"""
+Precomputed lookups for resolving "If betingelse" conditions.
+
+An IF field needs the condition key (the Nøgle of the condition title) and the
+key of the Html block shown when the condition holds. That companion is found
+by convention: ``Html:<key>`` if it exists, otherwise the first Html key that
+contains the part of the key after its prefix (``ab-``, ``af:`` ...), plus a few
+declarative special cases. ``MappingIndex`` computes all of this once per
+mapping so each condition resolves with dict lookups.
+
+Condition titles in real letters rarely match the key list exactly (trailing
+spaces, different casing, a curly quote, a typo), so a title that is not found
+is looked up approximately: first by its normalized form, then among the titles
+sharing the most words with it, accepting the closest one within a bounded edit
+distance.
+"""
+
+from bisect import bisect_right
+from collections import Counter
+
+from components.matcher import fingerprint_cache
+from components.trigram import normalize
+
+HTML_PREFIX = "Html:"
+
+# Condition keys whose Html companion does not follow the naming convention
+SPECIAL_HTML_COMPANIONS = {
+    "ab-ubegraenset-fuldmagt": "Html:x-fuldmagtsbetingelse",
+}
+
+# Condition titles with a fixed companion when no other rule finds one
+SPECIAL_TITLE_COMPANIONS = {
+    "Ubegrænset fuldmagt": "Html:x-fuldmagtsbetingelse",
+}
+
+# Approximate title matching: accepted below this many edits per character of
+# the normalized title, with at least this confidence, among this many of the
+# titles sharing the most words with the condition
+FUZZY_EDIT_RATIO = 0.15
+FUZZY_MIN_CONFIDENCE = 0.85
+FUZZY_CANDIDATES = 16
+
+
+def _key_suffix(key: str):
+    # "ab-borger-enlig" -> "borger-enlig", "af:navn" -> "navn"
+    if "-" in key:
+        return key.split("-", 1)[1]
+    if ":" in key:
+        return key.split(":", 1)[1]
+    return None
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance between two strings, computed only up to ``limit``.
+
+    Args:
+        a (str): First string.
+        b (str): Second string.
+        limit (int): Largest distance of interest.
+
+    Returns:
+        int: The distance, or ``limit + 1`` if it exceeds ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    # Only cells within ``limit`` of the diagonal can stay within ``limit``
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(a) + 1)]
+    for i, cb in enumerate(b, 1):
+        lo = max(1, i - limit)
+        hi = min(len(a), i + limit)
+        current = [over] * (len(a) + 1)
+        if i <= limit:
+            current[0] = i
+        for j in range(lo, hi + 1):
+            cost = previous[j - 1] + (a[j - 1] != cb)
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost if cost < over else over
+        if min(current[lo - 1 : hi + 1]) >= over:
+            return over
+        previous = current
+    return previous[-1]
+
+
+class MappingIndex:
+    """
+    Title/key lookups for one Titel -> Nøgle mapping.
+
+    Attributes:
+        title_to_key (dict): Titel -> Nøgle.
+        key_to_title (dict): Nøgle -> first Titel using it.
+        html_companions (dict): Nøgle -> Html key shown when the condition holds,
+            for every key that has one.
+        normalized (dict): Normalized title -> Titel, for every title.
+        word_postings (dict): Word of a normalized title -> normalized titles
+            containing it.
+    """
+
+    def __init__(
+        self,
+        mappings: dict,
+        special_html_companions: dict = None,
+        special_title_companions: dict = None,
+    ):
+        if special_html_companions is None:
+            special_html_companions = SPECIAL_HTML_COMPANIONS
+        if special_title_companions is None:
+            special_title_companions = SPECIAL_TITLE_COMPANIONS
+        self.special_title_companions = dict(special_title_companions)
+
+        self.title_to_key = {}
+        self.key_to_title = {}
+        for titel, nøgle in mappings.items():
+            if not isinstance(nøgle, str):
+                continue
+            self.title_to_key[titel] = nøgle
+            self.key_to_title.setdefault(nøgle, titel)
+
+        self.normalized = {}
+        self.word_postings = {}
+        for titel in self.title_to_key:
+            normalized = normalize(str(titel))
+            if not normalized or normalized in self.normalized:
+                continue
+            self.normalized[normalized] = titel
+            for word in set(normalized.split()):
+                self.word_postings.setdefault(word, []).append(normalized)
+
+        html_keys = [k for k in self.key_to_title if k.startswith(HTML_PREFIX)]
+        html_set = set(html_keys)
+        # All Html keys in mapping order, joined so that "first Html key containing
+        # the suffix" becomes one str.find plus a bisect over the start offsets.
+        joined = "\x00".join(html_keys)
+        starts = []
+        offset = 0
+        for k in html_keys:
+            starts.append(offset)
+            offset += len(k) + 1
+
+        self.html_companions = {}
+        for nøgle in self.key_to_title:
+            if nøgle in special_html_companions:
+                self.html_companions[nøgle] = special_html_companions[nøgle]
+                continue
+            if HTML_PREFIX + nøgle in html_set:
+                self.html_companions[nøgle] = HTML_PREFIX + nøgle
+                continue
+            suffix = _key_suffix(nøgle)
+            if suffix:
+                found = joined.find(suffix)
+                if found != -1:
+                    self.html_companions[nøgle] = html_keys[
+                        bisect_right(starts, found) - 1
+                    ]
+
+    def key_for(self, titel: str):
+        """Return the Nøgle for a title, or None."""
+        return self.title_to_key.get(titel)
+
+    def title_for(self, nøgle: str):
+        """Return the first title mapped to a key, or None."""
+        return self.key_to_title.get(nøgle)
+
+    def html_companion(self, nøgle: str):
+        """Return the Html key shown when ``nøgle`` is true, or None."""
+        return self.html_companions.get(nøgle)
+
+    def match_title(self, condition_title: str) -> tuple:
+        """
+        Find the title a condition refers to, allowing small differences.
+
+        Args:
+            condition_title (str): The title following "If betingelse".
+
+        Returns:
+            tuple: (titel, confidence) - the best matching title and a score
+                between 0 and 1 (1.0 for an exact or normalized match), or
+                (None, 0.0) if no title is close enough.
+        """
+        if condition_title in self.title_to_key:
+            return condition_title, 1.0
+        query = normalize(condition_title)
+        if not query:
+            return None, 0.0
+        if query in self.normalized:
+            return self.normalized[query], 1.0
+
+        limit = max(1, int(len(query) * FUZZY_EDIT_RATIO))
+        shared = Counter()
+        for word in set(query.split()):
+            shared.update(self.word_postings.get(word, ()))
+        best, best_distance = None, limit + 1
+        for candidate, _ in shared.most_common(FUZZY_CANDIDATES):
+            distance = edit_distance(query, candidate, min(limit, best_distance))
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        if best is None:
+            return None, 0.0
+        confidence = 1 - best_distance / max(len(query), len(best))
+        if confidence < FUZZY_MIN_CONFIDENCE:
+            return None, 0.0
+        return self.normalized[best], round(confidence, 4)
+
+    def resolve(self, condition_title: str, fuzzy: bool = True) -> tuple:
+        """
+        Resolve an "If betingelse" condition title.
+
+        Args:
+            condition_title (str): The title following "If betingelse".
+            fuzzy (bool, optional): Fall back to ``match_title`` when the title
+                is not in the mapping as written.
+
+        Returns:
+            tuple: (condition_key, true_result_key, confidence) - either key may
+                be None; confidence is 1.0 for a title in the mapping as written,
+                ``match_title``'s score for an approximate match and 0.0 when
+                the title is not resolved.
+        """
+        condition_key = self.title_to_key.get(condition_title)
+        confidence = 1.0 if condition_key else 0.0
+        if not condition_key and fuzzy:
+            titel, confidence = self.match_title(condition_title)
+            if titel is not None:
+                condition_title = titel
+                condition_key = self.title_to_key[titel]
+        if not condition_key:
+            return condition_key, None, 0.0
+        true_result_key = self.html_companions.get(condition_key)
+        if not true_result_key:
+            true_result_key = self.special_title_companions.get(condition_title)
+        return condition_key, true_result_key, confidence
+
+
+# Built indexes by mapping content
+_indexes = fingerprint_cache(MappingIndex)
+
+
+def get_mapping_index(mappings: dict, fingerprint: str = None) -> MappingIndex:
+    """
+    Return the ``MappingIndex`` for a mapping, building it only once per
+    distinct mapping content.
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping.
+        fingerprint (str, optional): Its ``mapping_fingerprint``, if already
+            computed.
+
+    Returns:
+        MappingIndex: The index.
+    """
+    return _indexes(mappings, fingerprint)
@@ -0,0 +1,244 @@
+"""
+Hot-reloadable, versioned key lists.
+
+A ``MappingRegistry`` owns one key list file. ``current()`` returns an immutable
+``MappingVersion`` (the parsed mapping and its compiled matcher); a watcher
+thread polls the file and, once a change has settled, builds the new version in
+the background and publishes it with a single reference assignment. A version
+is only published when it is complete, and a request that already holds a
+version keeps using it (the memory-mapped index of the old version stays valid
+after the index file is replaced), so a conversion never sees a half-built or
+mixed mapping.
+
+``use_version`` pins a version for the current context: code that looks the
+mapping up through ``tools.get_mappings`` (the agent tools, the pre-pass, the
+result cache keys) then sees the same version for the whole request, even if a
+new one is published meanwhile. ``MappingVersion.version`` tags results with the
+key list they were made with.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from components.mapping_cache import load_compiled_mapping
+from components.matcher import (
+    compile_matcher,
+    mapping_fingerprint,
+    register_fingerprint,
+)
+
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Version pinned for the current request, see use_version
+_PINNED = ContextVar("pinned_mapping_version", default=None)
+
+
+def version_tag(fingerprint: str) -> str:
+    """Short version tag of a mapping, from its ``mapping_fingerprint``."""
+    return fingerprint[:12]
+
+
+class MappingVersion:
+    """
+    One loaded version of a key list. Never modified after it is published.
+
+    Attributes:
+        path (str): The source file.
+        number (int): Load counter within the registry (1 for the first load).
+        version (str): Content tag, the same in every process for the same key list.
+        fingerprint (str): ``mapping_fingerprint`` of ``mappings``.
+        mappings (dict): Titel -> Nøgle; must not be modified.
+        matcher (TitleMatcher): Compiled matcher over the titles.
+        loaded_at (float): ``time.time()`` when the version was published.
+    """
+
+    def __init__(self, path: str, number: int, compiled=None):
+        self.path = path
+        self.number = number
+        if compiled is not None:
+            self.mappings = compiled.as_dict()
+            self.fingerprint = compiled.fingerprint
+            self.matcher = compiled.matcher
+        else:
+            # Missing key list: an empty mapping, so callers need no special case
+            self.mappings = {}
+            self.fingerprint = mapping_fingerprint(self.mappings)
+            self.matcher = compile_matcher(self.mappings)
+        # Lookups keyed by this mapping then skip hashing it
+        register_fingerprint(self.mappings, self.fingerprint)
+        self.version = version_tag(self.fingerprint)
+        self.loaded_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.mappings)
+
+    def __repr__(self) -> str:
+        return f"MappingVersion({self.path!r}, version={self.version!r})"
+
+
+class MappingRegistry:
+    """
+    The current version of one key list, reloaded when the file changes.
+
+    Args:
+        path (str): The .xlsx or .csv key list.
+        cache_dir (str, optional): Directory for compiled mapping indexes.
+        poll_interval (float, optional): Seconds between checks of the file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_dir: str = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self._current = None
+        self._signature = None
+        self._loads = 0
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def current(self) -> MappingVersion:
+        """Return the current version, loading it first on the very first call."""
+        current = self._current
+        if current is None:
+            self.reload()
+            current = self._current
+        return current
+
+    def reload(self) -> bool:
+        """
+        Load the key list if it changed since the last load and publish it.
+
+        A file that is missing or cannot be parsed (e.g. while it is being
+        saved or replaced) keeps the previous version in place and is tried
+        again on the next call; only the very first load publishes an empty
+        mapping for a missing file.
+
+        Returns:
+            bool: True if a new version was published.
+        """
+        with self._reload_lock:
+            signature = self._stat_signature()
+            if self._current is not None and signature == self._signature:
+                return False
+            compiled = None
+            if signature is not None:
+                compiled = load_compiled_mapping(self.path, self.cache_dir)
+            if compiled is None and self._current is not None:
+                # Missing or unparsable: keep serving the version we have
+                return False
+            self._signature = signature
+            if (
+                self._current is not None
+                and compiled is not None
+                and compiled.fingerprint == self._current.fingerprint
+            ):
+                # Touched but same content
+                return False
+            self._loads += 1
+            version = MappingVersion(self.path, self._loads, compiled)
+            # The swap: readers see either the old or the new version, never a mix
+            self._current = version
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(version)
+        return True
+
+    def subscribe(self, listener) -> None:
+        """Call ``listener(version)`` whenever a new version is published."""
+        with self._reload_lock:
+            self._listeners.append(listener)
+
+    def start(self) -> "MappingRegistry":
+        """Start the watcher thread (if not running) and return the registry."""
+        if self._watcher is None or not self._watcher.is_alive():
+            self.current()
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="mapping-watcher", daemon=True
+            )
+            self._watcher.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the watcher thread."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self) -> None:
+        pending = None
+        while not self._stop.wait(self.poll_interval):
+            signature = self._stat_signature()
+            if signature == self._signature:
+                pending = None
+                continue
+            # Reload once the file has stopped changing for one interval
+            if signature != pending:
+                pending = signature
+                continue
+            try:
+                self.reload()
+            except Exception:
+                # Keep serving the current version; retried on the next change
+                pass
+            pending = None
+
+
+# Registries by absolute source path
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(path: str, watch: bool = True) -> MappingRegistry:
+    """
+    Return the process-wide registry for a key list file.
+
+    Args:
+        path (str): The .xlsx or .csv key list.
+        watch (bool, optional): Start the watcher thread if it is not running.
+
+    Returns:
+        MappingRegistry: The registry.
+    """
+    key = os.path.abspath(path)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(key)
+        if registry is None:
+            registry = _REGISTRIES[key] = MappingRegistry(path)
+    return registry.start() if watch else registry
+
+
+def pinned_version():
+    """The version pinned with ``use_version`` in this context, or None."""
+    return _PINNED.get()
+
+
+@contextmanager
+def use_version(version: MappingVersion):
+    """
+    Pin ``version`` for the code inside the ``with`` block (and threads or tasks
+    started from it with a copy of the context).
+    """
+    token = _PINNED.set(version)
+    try:
+        yield version
+    finally:
+        _PINNED.reset(token)
@@ -0,0 +1,325 @@
+"""
+Compiled multi-pattern matcher for Titel -> Nøgle replacement.
+
+The matcher is an Aho-Corasick automaton with leftmost-longest semantics, so a
+letter is scanned once no matter how many titles the mapping contains, and a
+replacement can never be rewritten by a later title.
+"""
+
+import hashlib
+from bisect import bisect_left
+from array import array
+from collections import OrderedDict, deque
+
+
+def is_title(titel) -> bool:
+    """Whether a key list cell holds a title (not empty, not a pandas NaN)."""
+    # NaN != NaN
+    return bool(titel) and titel == titel
+
+
+# Fingerprints of mappings that are never modified (the mapping of a
+# MappingVersion), by object id, so they are not hashed again on every lookup
+_KNOWN_FINGERPRINTS = OrderedDict()
+_KNOWN_FINGERPRINTS_SIZE = 8
+
+
+def register_fingerprint(mappings: dict, fingerprint: str) -> None:
+    """
+    Remember the fingerprint of a mapping that will not be modified, so
+    ``mapping_fingerprint`` returns it without hashing the mapping again.
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping; must not be modified
+            afterwards.
+        fingerprint (str): Its ``mapping_fingerprint``.
+    """
+    # The entry keeps the mapping alive, so its id cannot be reused meanwhile
+    _KNOWN_FINGERPRINTS[id(mappings)] = (mappings, fingerprint)
+    _KNOWN_FINGERPRINTS.move_to_end(id(mappings))
+    if len(_KNOWN_FINGERPRINTS) > _KNOWN_FINGERPRINTS_SIZE:
+        _KNOWN_FINGERPRINTS.popitem(last=False)
+
+
+def mapping_fingerprint(mappings: dict) -> str:
+    """
+    Return a stable hash of a Titel -> Nøgle mapping, used as cache key for
+    compiled structures built from it.
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping.
+
+    Returns:
+        str: Hex digest identifying the mapping content.
+    """
+    known = _KNOWN_FINGERPRINTS.get(id(mappings))
+    if known is not None and known[0] is mappings:
+        return known[1]
+    digest = hashlib.sha1()
+    for titel, nøgle in mappings.items():
+        digest.update(str(titel).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(str(nøgle).encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def fingerprint_cache(build, size: int = 8):
+    """
+    Wrap ``build(mappings)`` so it runs once per distinct mapping content; the
+    results for the ``size`` most recently used mappings are kept.
+
+    Args:
+        build (callable): Builds the structure for a Titel -> Nøgle mapping.
+        size (int, optional): Number of mappings to keep results for.
+
+    Returns:
+        callable: ``get(mappings, fingerprint=None)`` returning the cached or
+            newly built result (pass the mapping's fingerprint if it is already
+            known); ``get.put(fingerprint, value)`` stores a value built
+            elsewhere (e.g. loaded from disk).
+    """
+    # Results keyed by mapping fingerprint, most recently used last
+    cache = OrderedDict()
+
+    def put(fingerprint: str, value) -> None:
+        cache[fingerprint] = value
+        cache.move_to_end(fingerprint)
+        if len(cache) > size:
+            cache.popitem(last=False)
+
+    def get(mappings: dict, fingerprint: str = None):
+        if fingerprint is None:
+            fingerprint = mapping_fingerprint(mappings)
+        value = cache.get(fingerprint)
+        if value is None:
+            value = build(mappings)
+        put(fingerprint, value)
+        return value
+
+    get.put = put
+    return get
+
+
+class TitleMatcher:
+    """
+    Aho-Corasick automaton over the titles of a mapping.
+
+    The automaton is stored as flat arrays (CSR layout: edges of node ``n`` are
+    ``edge_chars[edge_start[n]:edge_start[n + 1]]``, sorted by code point) so it
+    can be built in memory or loaded straight from a memory-mapped file.
+    """
+
+    def __init__(
+        self,
+        titles,
+        keys,
+        edge_start,
+        edge_chars,
+        edge_targets,
+        fail,
+        depth,
+        output,
+    ):
+        self.titles = titles
+        self.keys = keys
+        self.edge_start = edge_start
+        self.edge_chars = edge_chars
+        self.edge_targets = edge_targets
+        self.fail = fail
+        self.depth = depth
+        # Pattern index of the longest title ending in each node (-1 if none)
+        self.output = output
+        # Most characters in a letter fall back to the root, so its edges are
+        # kept in a dict for a cheap fast path.
+        self._root = {
+            chr(edge_chars[i]): edge_targets[i]
+            for i in range(edge_start[0], edge_start[1])
+        }
+
+    @classmethod
+    def from_mapping(cls, mappings: dict) -> "TitleMatcher":
+        """
+        Build a matcher from a Titel -> Nøgle mapping. Empty titles are skipped;
+        for duplicate titles the last key wins, as with dict assignment.
+
+        Args:
+            mappings (dict): The Titel -> Nøgle mapping.
+
+        Returns:
+            TitleMatcher: The compiled matcher.
+        """
+        patterns = {}
+        for titel, nøgle in mappings.items():
+            if is_title(titel):
+                patterns[str(titel)] = str(nøgle)
+        titles = list(patterns)
+        keys = [patterns[t] for t in titles]
+
+        # Build the trie with dict edges
+        goto = [{}]
+        terminal = [-1]
+        for index, titel in enumerate(titles):
+            node = 0
+            for ch in titel:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    terminal.append(-1)
+                node = nxt
+            terminal[node] = index
+
+        # Breadth-first renumbering, failure links and outputs
+        count = len(goto)
+        order = [0]
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for ch in sorted(goto[node]):
+                order.append(goto[node][ch])
+                queue.append(goto[node][ch])
+        new_id = [0] * count
+        for position, node in enumerate(order):
+            new_id[node] = position
+
+        fail = array("i", [0] * count)
+        depth = array("i", [0] * count)
+        output = array("i", [-1] * count)
+        for node in order:
+            nid = new_id[node]
+            for ch, child in goto[node].items():
+                cid = new_id[child]
+                depth[cid] = depth[nid] + 1
+                if node == 0:
+                    fail[cid] = 0
+                else:
+                    state = order[fail[nid]]
+                    while state and ch not in goto[state]:
+                        state = order[fail[new_id[state]]]
+                    target = goto[state].get(ch, 0)
+                    fail[cid] = new_id[target] if target != child else 0
+            output[nid] = terminal[node] if terminal[node] >= 0 else output[fail[nid]]
+
+        edge_start = array("i", [0] * (count + 1))
+        edge_chars = array("i")
+        edge_targets = array("i")
+        for node in order:
+            nid = new_id[node]
+            for ch in sorted(goto[node]):
+                edge_chars.append(ord(ch))
+                edge_targets.append(new_id[goto[node][ch]])
+            edge_start[nid + 1] = len(edge_chars)
+
+        return cls(
+            titles, keys, edge_start, edge_chars, edge_targets, fail, depth, output
+        )
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def _step(self, state: int, ch: str) -> int:
+        edge_start, edge_chars, fail = self.edge_start, self.edge_chars, self.fail
+        code = ord(ch)
+        while state:
+            lo, hi = edge_start[state], edge_start[state + 1]
+            i = bisect_left(edge_chars, code, lo, hi)
+            if i < hi and edge_chars[i] == code:
+                return self.edge_targets[i]
+            state = fail[state]
+        return self._root.get(ch, 0)
+
+    def finditer(self, text: str):
+        """
+        Yield non-overlapping matches in a single left-to-right scan. At each
+        position the leftmost match wins, and among those the longest.
+
+        Args:
+            text (str): The text to scan.
+
+        Yields:
+            tuple: (start, end, titel, nøgle) for every match.
+        """
+        depth, output = self.depth, self.output
+        length = len(text)
+        pos = 0
+        while pos < length:
+            state = 0
+            best = None
+            i = pos
+            while i < length:
+                state = self._step(state, text[i])
+                i += 1
+                pattern = output[state]
+                if pattern >= 0:
+                    start = i - len(self.titles[pattern])
+                    if (
+                        best is None
+                        or start < best[0]
+                        or (start == best[0] and i > best[1])
+                    ):
+                        best = (start, i, pattern)
+                # No later match can start at or before the candidate
+                if best is not None and i - depth[state] > best[0]:
+                    break
+            if best is None:
+                return
+            start, end, pattern = best
+            yield start, end, self.titles[pattern], self.keys[pattern]
+            pos = end
+
+    def sub(self, repl, text: str) -> str:
+        """
+        Replace every match in ``text``, like ``re.sub``.
+
+        Args:
+            repl (str or callable): Replacement string, or a function called
+                with (titel, nøgle) that returns the replacement.
+            text (str): The text to rewrite.
+
+        Returns:
+            str: The rewritten text.
+        """
+        parts = []
+        pos = 0
+        for start, end, titel, nøgle in self.finditer(text):
+            parts.append(text[pos:start])
+            parts.append(repl(titel, nøgle) if callable(repl) else repl)
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
+
+
+# Compiled matchers by mapping content
+_compiled_matchers = fingerprint_cache(TitleMatcher.from_mapping)
+
+
+def register_matcher(fingerprint: str, matcher: TitleMatcher) -> None:
+    """
+    Make an already compiled matcher (e.g. loaded from the on-disk mapping
+    index) available to ``compile_matcher`` for the mapping with this fingerprint.
+
+    Args:
+        fingerprint (str): ``mapping_fingerprint`` of the mapping.
+        matcher (TitleMatcher): The compiled matcher.
+    """
+    _compiled_matchers.put(fingerprint, matcher)
+
+
+def compile_matcher(mappings: dict, fingerprint: str = None) -> TitleMatcher:
+    """
+    Return the compiled matcher for a mapping, building it only once per
+    distinct mapping content.
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping.
+        fingerprint (str, optional): Its ``mapping_fingerprint``, if already
+            computed.
+
+    Returns:
+        TitleMatcher: The compiled matcher.
+    """
+    return _compiled_matchers(mappings, fingerprint)
@@ -0,0 +1,219 @@
+"""
+Content-addressed cache of converted paragraphs.
+
+Templates are uploaded again and again with a sentence changed, and letters
+share boilerplate paragraphs, so most paragraphs have been converted before.
+The converters look every paragraph up by the hash of its source XML, the
+converter and the mapping version; a hit splices the cached result in (or leaves
+the paragraph alone if converting it changed nothing) and replays what it added
+to the report, and only new paragraphs are converted.
+
+The key covers everything the conversion of a paragraph depends on: its own
+XML (text, runs, formatting, relationship ids) and the key list. The cache is
+in memory and per process; entries are bounded by number and by size.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class CachedParagraph:
+    """
+    The outcome of converting one paragraph.
+
+    Attributes:
+        xml (bytes): The converted paragraph XML, or None if the conversion left
+            the paragraph unchanged.
+        counts (dict): Field type -> number of fields the conversion created.
+        events (list): (level, kind, detail) report events of the paragraph.
+        extra: Converter-specific data (e.g. the paragraph's debug line).
+    """
+
+    __slots__ = ("xml", "counts", "events", "extra")
+
+    def __init__(self, xml=None, counts=None, events=(), extra=None):
+        self.xml = xml
+        self.counts = counts or {}
+        self.events = list(events)
+        self.extra = extra
+
+    @property
+    def size(self) -> int:
+        return len(self.xml or b"") + 64 * (1 + len(self.events))
+
+
+class ParagraphCache:
+    """
+    Thread-safe LRU cache of converted paragraphs.
+
+    Args:
+        max_entries (int, optional): Maximum number of paragraphs kept.
+        max_bytes (int, optional): Approximate maximum size of the kept XML.
+    """
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def source(p) -> bytes:
+        """The serialized source XML of a ``w:p`` element."""
+        from lxml import etree
+
+        return etree.tostring(p)
+
+    @staticmethod
+    def cacheable(source: bytes) -> bool:
+        """
+        Whether a paragraph can be taken from the cache. Paragraphs anchoring
+        text boxes hold other paragraphs, which the converters visit (and may
+        replace) separately, so they are always converted.
+        """
+        return b"txbxContent" not in source
+
+    @staticmethod
+    def key(source: bytes, converter: str, version: str = "") -> str:
+        """
+        Cache key of a paragraph.
+
+        Args:
+            source (bytes): The paragraph's XML, from ``ParagraphCache.source``.
+            converter (str): Name of the conversion (its output format).
+            version (str, optional): Mapping version the conversion uses.
+
+        Returns:
+            str: Hex digest.
+        """
+        digest = hashlib.sha256(source)
+        digest.update(f"\x00{converter}\x00{version}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return the ``CachedParagraph`` for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedParagraph) -> None:
+        """Store a conversion outcome, evicting the least recently used ones."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def record(
+        self,
+        key: str,
+        source: bytes,
+        p,
+        report=None,
+        counts_before=None,
+        events_before: int = 0,
+        extra=None,
+    ) -> None:
+        """
+        Store the outcome of converting paragraph ``p`` (now in its converted
+        state), with what the conversion added to ``report``.
+
+        Args:
+            key (str): The paragraph's cache key.
+            source (bytes): Its XML before the conversion.
+            p: The converted ``w:p`` element.
+            report (ConversionReport, optional): The report the conversion wrote to.
+            counts_before (dict, optional): Copy of ``report.counts`` before the
+                conversion.
+            events_before (int, optional): ``report.recorded_events`` before
+                the conversion.
+            extra (optional): Converter-specific data to keep with the entry.
+        """
+        xml = self.source(p)
+        counts = {}
+        events = []
+        if report is not None:
+            counts_before = counts_before or {}
+            counts = {
+                kind: n - counts_before.get(kind, 0)
+                for kind, n in report.counts.items()
+                if n != counts_before.get(kind, 0)
+            }
+            events = [
+                (level, kind, detail)
+                for level, kind, _, detail in report.events_since(events_before)
+            ]
+        self.put(
+            key,
+            CachedParagraph(None if xml == source else xml, counts, events, extra),
+        )
+
+    @staticmethod
+    def apply(p, entry: CachedParagraph, report=None, index: int = None):
+        """
+        Put a cached conversion in place of paragraph ``p`` and replay its report
+        counts and events.
+
+        Args:
+            p: The source ``w:p`` element.
+            entry (CachedParagraph): The cached outcome.
+            report (ConversionReport, optional): Report to update.
+            index (int, optional): Paragraph index for the replayed events.
+
+        Returns:
+            The ``w:p`` element now in the document.
+        """
+        if entry.xml is not None:
+            from docx.oxml import parse_xml
+
+            converted = parse_xml(entry.xml)
+            p.getparent().replace(p, converted)
+            p = converted
+        if report is not None:
+            for kind, n in entry.counts.items():
+                report.count(kind, n)
+            for level, kind, detail in entry.events:
+                report.event(level, kind, index, detail)
+            report.cached_paragraphs += 1
+        return p
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_paragraph_cache() -> ParagraphCache:
+    """The process-wide paragraph cache, created on first use."""
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = ParagraphCache()
+        return _DEFAULT_CACHE
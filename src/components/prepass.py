@@ -0,0 +1,237 @@
+"""
+Deterministic pre-pass before the coding agent.
+
+Turning every known Titel into its MERGEFIELD is dictionary work, so it is done
+locally with the compiled title matcher. The resulting field codes are replaced
+by sentinel tokens (``⟦0⟧``, ``⟦1⟧``, ...) that the model is told to keep, and
+only paragraphs that still need judgement go to the model: those with an
+"If betingelse" construct and those with an unresolved candidate phrase (the
+first two words of a title without the rest of it). Everything else is final
+after the pre-pass.
+
+Construct paragraphs are sent as written: the model has to build the IF field
+around the condition's key, which a sentinel would hide from it. Their locally
+coded form is only used if the model's answer for them is rejected.
+"""
+
+import logging
+import re
+from bisect import bisect_right
+
+from components.chunking import construct_spans
+from components.matcher import compile_matcher, fingerprint_cache
+
+MERGEFIELD_TEMPLATE = "{{ MERGEFIELD {} }}"
+SENTINEL_PATTERN = re.compile(r"⟦(\d+)⟧")
+PROTECTED_NOTE = (
+    "Tekst som ⟦0⟧, ⟦1⟧ osv. er allerede kodet og skal gengives uændret. "
+    "Behold linjeskiftene, så hver linje i svaret svarer til en linje i teksten."
+)
+
+_WORD = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+
+def _bigrams(text: str):
+    words = _WORD.findall(text.lower())
+    return zip(words, words[1:])
+
+
+def _build_bigrams(mappings: dict) -> frozenset:
+    bigrams = set()
+    for titel in mappings:
+        words = _WORD.findall(str(titel).lower())
+        if len(words) >= 2:
+            bigrams.add((words[0], words[1]))
+    return frozenset(bigrams)
+
+
+_candidate_bigrams = fingerprint_cache(_build_bigrams)
+
+
+def candidate_bigrams(mappings: dict) -> frozenset:
+    """
+    Return the lower-cased first two words of every multi-word title; seeing
+    one in the text without the full title suggests a title the model must judge
+    (a variant spelling, an inflection, a title split by other words).
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping.
+
+    Returns:
+        frozenset: (word, word) tuples.
+    """
+    return _candidate_bigrams(mappings)
+
+
+class PreparedLetter:
+    """
+    A letter after the local pre-pass.
+
+    Attributes:
+        paragraphs (list): Every line of the letter, titles replaced by
+            sentinels (except in construct paragraphs, see ``fallback``).
+        protected (list): Field code of each sentinel, by sentinel number.
+        needs_model (list): Indexes of the paragraphs the model must see.
+        fallback (dict): Paragraph index -> locally coded line, used instead of
+            ``paragraphs`` when the model's line is rejected.
+        rejected (list): Indexes of the paragraphs whose answer the last
+            ``merge`` rejected.
+    """
+
+    def __init__(self, paragraphs, protected, needs_model, fallback=None):
+        self.paragraphs = paragraphs
+        self.protected = protected
+        self.needs_model = needs_model
+        self.fallback = fallback or {}
+        self.rejected = []
+
+    def model_text(self) -> str:
+        """The paragraphs that need the model, one per line."""
+        return "\n".join(self.paragraphs[i] for i in self.needs_model)
+
+    def restore(self, text: str) -> str:
+        """Replace sentinels with their field codes."""
+        return SENTINEL_PATTERN.sub(
+            lambda m: (
+                self.protected[int(m.group(1))]
+                if int(m.group(1)) < len(self.protected)
+                else m.group(0)
+            ),
+            text,
+        )
+
+    def merge(self, coded: str = None) -> str:
+        """
+        Combine the model's answer with the locally coded paragraphs.
+
+        A coded line replaces its paragraph only if it kept exactly the same
+        sentinels. If the answer has as many lines as were sent, lines are
+        matched by position; otherwise lines with sentinels are matched to the
+        paragraph those sentinels belong to, and the lines between two matched
+        lines by position when their counts agree. Paragraphs without an
+        accepted line keep their local coding; they are listed in ``rejected``
+        and logged.
+
+        Args:
+            coded (str, optional): The model's answer to ``model_text()``.
+
+        Returns:
+            str: The coded letter.
+        """
+        paragraphs = list(self.paragraphs)
+        accepted = {}
+        if coded is not None:
+            lines = coded.split("\n")
+            if len(lines) == len(self.needs_model):
+                pairs = zip(self.needs_model, lines)
+            else:
+                pairs = self._align(lines)
+            for i, line in pairs:
+                if _sentinels(line) == _sentinels(paragraphs[i]):
+                    accepted[i] = line
+        self.rejected = [i for i in self.needs_model if i not in accepted]
+        for i in self.rejected:
+            paragraphs[i] = self.fallback.get(i, paragraphs[i])
+        paragraphs = [accepted.get(i, line) for i, line in enumerate(paragraphs)]
+        if coded is not None and self.rejected:
+            logger.warning(
+                "Pre-pass kept the local coding of %d of %d paragraphs "
+                "(model answer: %d lines for %d sent)",
+                len(self.rejected),
+                len(self.needs_model),
+                len(coded.split("\n")),
+                len(self.needs_model),
+            )
+        return self.restore("\n".join(paragraphs))
+
+    def _align(self, lines: list) -> list:
+        # (paragraph index, line) pairs for an answer whose line count differs:
+        # sentinels are unique, so a line with sentinels belongs to the
+        # paragraph that holds them; these anchors split the rest into runs
+        # that are paired by position if both sides have the same length
+        position = {}
+        for k, i in enumerate(self.needs_model):
+            for number in SENTINEL_PATTERN.findall(self.paragraphs[i]):
+                position[number] = k
+        anchors = [(-1, -1)]
+        for j, line in enumerate(lines):
+            owners = {position.get(n) for n in SENTINEL_PATTERN.findall(line)}
+            if len(owners) == 1 and None not in owners:
+                k = owners.pop()
+                if k > anchors[-1][1]:
+                    anchors.append((j, k))
+        anchors.append((len(lines), len(self.needs_model)))
+        pairs = []
+        for (j0, k0), (j1, k1) in zip(anchors, anchors[1:]):
+            if j1 - j0 == k1 - k0:
+                pairs.extend(
+                    (self.needs_model[k], lines[j])
+                    for j, k in zip(range(j0 + 1, j1), range(k0 + 1, k1))
+                )
+            if k1 < len(self.needs_model):
+                pairs.append((self.needs_model[k1], lines[j1]))
+        return pairs
+
+    @property
+    def model_chars(self) -> int:
+        """Characters sent to the model."""
+        return len(self.model_text())
+
+
+def prepare_letter(text: str, mappings: dict) -> PreparedLetter:
+    """
+    Resolve every known title locally and select the paragraphs the model
+    still has to code.
+
+    Args:
+        text (str): The letter, one paragraph per line.
+        mappings (dict): The Titel -> Nøgle mapping.
+
+    Returns:
+        PreparedLetter: The pre-processed letter.
+    """
+    matcher = compile_matcher(mappings)
+    bigrams = candidate_bigrams(mappings)
+    protected = []
+
+    def protect(titel, nøgle):
+        protected.append(MERGEFIELD_TEMPLATE.format(nøgle))
+        return f"⟦{len(protected) - 1}⟧"
+
+    # Paragraphs touched by an "If betingelse" construct (a bare condition line
+    # also covers the paragraph it governs)
+    in_construct = set()
+    line_starts = [0]
+    for m in re.finditer("\n", text):
+        line_starts.append(m.end())
+    for start, end in construct_spans(text):
+        first = _line_index(line_starts, start)
+        last = _line_index(line_starts, max(start, end - 1))
+        in_construct.update(range(first, last + 1))
+
+    paragraphs = []
+    needs_model = []
+    fallback = {}
+    for i, line in enumerate(text.split("\n")):
+        coded = matcher.sub(protect, line)
+        if i in in_construct:
+            # The model sees the titles of a construct, not sentinels
+            paragraphs.append(line)
+            fallback[i] = coded
+            needs_model.append(i)
+            continue
+        paragraphs.append(coded)
+        remaining = SENTINEL_PATTERN.sub(" ", coded)
+        if any(b in bigrams for b in _bigrams(remaining)):
+            needs_model.append(i)
+    return PreparedLetter(paragraphs, protected, needs_model, fallback)
+
+
+def _sentinels(line: str) -> list:
+    return sorted(SENTINEL_PATTERN.findall(line))
+
+
+def _line_index(line_starts, offset: int) -> int:
+    return bisect_right(line_starts, offset) - 1
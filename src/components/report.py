@@ -0,0 +1,159 @@
+"""
+Structured result of a document conversion.
+
+Replaces the free-text debug string: counts per field type and timings per stage
+are always collected, paragraph and field events only when the caller asks for
+them through ``verbosity``. Events are stored as plain tuples and formatted only
+when the report is printed, so the default path allocates nothing per paragraph.
+Long conversions keep the first and the last events and count every event by
+kind, so the end of a large document is never missing from its report.
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Verbosity levels
+SUMMARY = 0  # counts and timings only
+FIELDS = 1  # plus one event per converted field
+PARAGRAPHS = 2  # plus one event per processed paragraph
+
+
+class ConversionReport:
+    """
+    Counts, timings and sampled events of one conversion.
+
+    Of more than ``max_events`` events, the first ``max_events // 2`` and the
+    most recent ones up to ``max_events`` are kept.
+
+    Attributes:
+        source (str): Name of the converted document.
+        verbosity (int): ``SUMMARY``, ``FIELDS`` or ``PARAGRAPHS``.
+        counts (dict): Field type ("if", "if_generic", "mergefield", ...) -> number
+            of fields created.
+        timings (dict): Stage ("load", "convert", "save", ...) -> seconds.
+        events (list): Kept (level, kind, paragraph index, detail) tuples in
+            the order recorded, at most ``max_events`` of them; empty at
+            ``SUMMARY``.
+        event_counts (dict): Event kind -> number of events recorded, kept or
+            not.
+        recorded_events (int): Events recorded, kept or not.
+        dropped_events (int): Events recorded between the first and the last
+            kept ones and not kept.
+        error (str): Error message and traceback if the conversion failed.
+        cached_paragraphs (int): Paragraphs taken from the paragraph cache.
+    """
+
+    def __init__(self, source: str = None, verbosity: int = SUMMARY, max_events=200):
+        self.source = source
+        self.verbosity = verbosity
+        self.max_events = max_events
+        self.counts = {}
+        self.timings = {}
+        self.event_counts = {}
+        self.recorded_events = 0
+        self._head_size = max_events // 2
+        self._head = []
+        self._tail = deque(maxlen=max_events - self._head_size)
+        self.error = None
+        self.cached_paragraphs = 0
+
+    @property
+    def total(self) -> int:
+        """Number of fields created."""
+        return sum(self.counts.values())
+
+    @property
+    def events(self) -> list:
+        """The kept events, oldest first."""
+        return self._head + list(self._tail)
+
+    @property
+    def dropped_events(self) -> int:
+        """Events recorded but not kept."""
+        return self.recorded_events - len(self._head) - len(self._tail)
+
+    def events_since(self, mark: int) -> list:
+        """
+        Kept events recorded after ``mark``, a former value of
+        ``recorded_events``.
+        """
+        # The head holds events 0.. and the tail the most recent ones
+        tail_start = self.recorded_events - len(self._tail)
+        tail = list(self._tail)[max(0, mark - tail_start) :]
+        return self._head[mark:] + tail
+
+    def count(self, field_type: str, n: int = 1):
+        self.counts[field_type] = self.counts.get(field_type, 0) + n
+
+    def event(self, level: int, kind: str, paragraph: int, detail=None):
+        """
+        Record an event if ``level`` is within the verbosity. Check
+        ``report.verbosity`` before building an expensive ``detail``.
+        """
+        if level > self.verbosity:
+            return
+        self.recorded_events += 1
+        self.event_counts[kind] = self.event_counts.get(kind, 0) + 1
+        if len(self._head) < self._head_size:
+            self._head.append((level, kind, paragraph, detail))
+        else:
+            self._tail.append((level, kind, paragraph, detail))
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the ``with`` block to ``timings[name]``."""
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.timings[name] = (
+                self.timings.get(name, 0.0) + time.perf_counter() - started
+            )
+
+    def as_dict(self) -> dict:
+        """Return the report as JSON-serializable data."""
+        return {
+            "source": self.source,
+            "total": self.total,
+            "counts": dict(self.counts),
+            "timings": {name: round(s, 6) for name, s in self.timings.items()},
+            "events": [
+                {"kind": kind, "paragraph": paragraph, "detail": detail}
+                for _, kind, paragraph, detail in self.events
+            ],
+            "event_counts": dict(self.event_counts),
+            "dropped_events": self.dropped_events,
+            "cached_paragraphs": self.cached_paragraphs,
+            "error": self.error,
+        }
+
+    def __str__(self) -> str:
+        if self.error:
+            return f"Error: {self.error}"
+        counts = ", ".join(f"{kind}: {n}" for kind, n in sorted(self.counts.items()))
+        seconds = sum(self.timings.values())
+        lines = [
+            f"Converted {self.total} fields"
+            + (f" ({counts})" if counts else "")
+            + f" in {seconds * 1000:.1f} ms"
+            + (
+                f", {self.cached_paragraphs} paragraphs from cache"
+                if self.cached_paragraphs
+                else ""
+            )
+        ]
+        dropped = self.dropped_events
+        for i, (_, kind, paragraph, detail) in enumerate(self.events):
+            if dropped and i == len(self._head):
+                lines.append(f"  ... {dropped} more events")
+            lines.append(
+                f"  paragraph {paragraph + 1}: {kind}"
+                + (f" {detail}" if detail is not None else "")
+            )
+        if dropped:
+            events = ", ".join(
+                f"{kind}: {n}" for kind, n in sorted(self.event_counts.items())
+            )
+            lines.append(f"  {self.recorded_events} events ({events})")
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+"""
+Disk-backed cache of agent results.
+
+Editors re-run the same letter many times; each run through the agent costs
+seconds and tokens. Results are stored in a small SQLite database in the user's
+cache directory, keyed by a hash of the normalized prompt, the input text, the
+mapping fingerprint and the agent that answered (model deployment and agent
+version), so a repeat of an unchanged request is answered locally and a new
+model or agent never serves an old answer. Entries expire after a TTL and the least recently used ones are
+evicted once the cache holds ``max_entries``.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from components.mapping_cache import default_cache_dir
+
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Whitespace and line-ending edits in the prompt do not change the request
+    return " ".join(prompt.split())
+
+
+def normalize_text(text: str) -> str:
+    # Keep the letter's words and line structure, ignore line endings and
+    # trailing whitespace
+    return "\n".join(
+        line.rstrip() for line in text.replace("\r\n", "\n").split("\n")
+    ).strip("\n")
+
+
+def result_key(
+    prompt: str, text: str, fingerprint: str, mode: str = "", agent: str = ""
+) -> str:
+    """
+    Cache key for one agent request.
+
+    Args:
+        prompt (str): The instruction prompt.
+        text (str): The letter text.
+        fingerprint (str): ``mapping_fingerprint`` of the mapping in use.
+        mode (str, optional): Agent variant, for results that differ in form
+            from the plain agent's.
+        agent (str, optional): Identity of the model and agent version that
+            answers the request (``agent.agent_tag``).
+
+    Returns:
+        str: Hex SHA-256 of the normalized parts.
+    """
+    digest = hashlib.sha256()
+    parts = [
+        normalize_prompt(prompt),
+        normalize_text(text),
+        fingerprint or "",
+        mode,
+        agent,
+    ]
+    for part in parts:
+        data = part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache with a TTL, stored in SQLite.
+
+    Safe to share between threads and processes (each call opens its own
+    connection; the database runs in WAL mode).
+
+    Attributes:
+        path (str): The database file.
+        max_entries (int): Entries kept before the least recently used are evicted.
+        ttl_seconds (float): Lifetime of an entry from when it was stored.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.path = path or os.path.join(default_cache_dir(), "results.sqlite3")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call, committed on success and always closed
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        """Return the cached value for ``key``, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store ``value``, then drop expired and least recently used entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now),
+            )
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
@@ -0,0 +1,157 @@
+"""
+Paragraph-level text index over Word runs.
+
+Word splits a phrase over several runs (rsids, spell-check, formatting), so
+matching ``run.text`` one run at a time misses titles and placeholders.
+``ParagraphText`` concatenates the paragraph's run text once, keeps an offset
+table back to the run children, and splices replacement runs (fields) over any
+number of runs in a single rewrite.
+"""
+
+from copy import deepcopy
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# Stands in for run content that is not text (drawings, field characters, ...)
+# and for boundaries between run containers; titles never contain it, so no
+# match can span it.
+BARRIER = "\ufffc"
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+_R, _T, _RPR = _w("r"), _w("t"), _w("rPr")
+_RUN_TEXT = {_w("tab"): "\t", _w("br"): "\n", _w("cr"): "\n", _w("noBreakHyphen"): "-"}
+# Containers whose runs are part of the paragraph text
+_RUN_CONTAINERS = (_w("hyperlink"), _w("ins"), _w("smartTag"))
+
+
+def _iter_runs(p):
+    for child in p:
+        if child.tag == _R:
+            yield child
+        elif child.tag in _RUN_CONTAINERS:
+            yield from child.iterchildren(_R)
+
+
+class ParagraphText:
+    """
+    Concatenated text of a ``w:p`` element with an offset table to its runs.
+
+    Attributes:
+        p (lxml.etree._Element): The paragraph.
+        text (str): The run text, with ``BARRIER`` for non-text run content and
+            between runs in different containers (e.g. a hyperlink).
+    """
+
+    def __init__(self, p):
+        self.p = p
+        parts = []
+        # Per run: (run, start, end, [(child, start, end), ...])
+        self._runs = []
+        pos = 0
+        container = None
+        for r in _iter_runs(p):
+            if container is not None and r.getparent() is not container:
+                parts.append(BARRIER)
+                pos += 1
+            container = r.getparent()
+            run_start = pos
+            children = []
+            for child in r:
+                if child.tag == _RPR:
+                    continue
+                if child.tag == _T:
+                    text = child.text or ""
+                elif child.tag in _RUN_TEXT:
+                    text = _RUN_TEXT[child.tag]
+                else:
+                    text = BARRIER
+                if text:
+                    parts.append(text)
+                    children.append((child, pos, pos + len(text)))
+                    pos += len(text)
+            self._runs.append((r, run_start, pos, children))
+        self.text = "".join(parts)
+
+    def rewrite(self, spans) -> int:
+        """
+        Replace text spans with new runs in one pass over the paragraph.
+
+        Text outside the spans keeps its runs and formatting; runs a span only
+        partly covers are split. Spans covering a ``BARRIER`` are skipped so
+        non-text content is never removed. The index is stale afterwards.
+
+        Args:
+            spans (iterable): Non-overlapping (start, end, build) triples sorted
+                by start; ``build(rPr)`` is called with the ``w:rPr`` of the run
+                where the span starts (or None) and returns the run elements to
+                insert.
+
+        Returns:
+            int: Number of spans replaced.
+        """
+        spans = [
+            span
+            for span in spans
+            if span[0] < span[1] and BARRIER not in self.text[span[0] : span[1]]
+        ]
+        si = 0
+        for r, run_start, run_end, children in self._runs:
+            while si < len(spans) and spans[si][1] <= run_start:
+                si += 1
+            if si == len(spans) or spans[si][0] >= run_end:
+                continue
+            replacement = self._split_run(r, children, spans, si)
+            parent = r.getparent()
+            for new_r in replacement:
+                r.addprevious(new_r)
+            parent.remove(r)
+        return len(spans)
+
+    @staticmethod
+    def _split_run(r, children, spans, si) -> list:
+        rPr = r.find(_RPR)
+        out = []
+        piece = None
+
+        def keep(element):
+            nonlocal piece
+            if piece is None:
+                piece = r.makeelement(_R, dict(r.attrib))
+                if rPr is not None:
+                    piece.append(deepcopy(rPr))
+            piece.append(element)
+
+        def close_piece():
+            nonlocal piece
+            if piece is not None:
+                out.append(piece)
+                piece = None
+
+        for child, start, end in children:
+            pos = start
+            while pos < end:
+                while si < len(spans) and spans[si][1] <= pos:
+                    si += 1
+                span = spans[si] if si < len(spans) else None
+                if span is not None and span[0] <= pos:
+                    # Inside a span: emit its runs where it starts, drop the text
+                    if span[0] == pos:
+                        close_piece()
+                        out.extend(span[2](rPr))
+                    pos = min(span[1], end)
+                    continue
+                cut = min(end, span[0]) if span is not None else end
+                if child.tag == _T:
+                    t = r.makeelement(_T, {XML_SPACE: "preserve"})
+                    t.text = child.text[pos - start : cut - start]
+                    keep(t)
+                else:
+                    keep(child)
+                pos = cut
+        close_piece()
+        return out
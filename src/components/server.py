@@ -0,0 +1,477 @@
+"""
+Local HTTP service for coding letters without the Streamlit UI.
+
+Exposes the existing operations over plain HTTP (standard library only):
+
+    GET  /health           Status, workers, mapping and load.
+    POST /replace-titles   JSON {"text", "template"} -> {"text", "replaced"};
+                           "<NØGLE>" in the template becomes the title's key.
+    POST /convert          A .docx body -> the .docx with its placeholder text
+                           turned into Word fields (convert_text_to_mergefields).
+                           The report is in the X-Conversion-Report header.
+    POST /code             JSON {"prompt", "text", "mode"} -> {"text"}; mode is
+                           "prepass" (default), "chunked" or "agent".
+
+Requests run on a process pool that is started and warmed up before the server
+accepts connections; each worker loads the compiled key list once and reloads
+it in the background when the file changes (``MappingRegistry``). Responses
+that use the key list carry the ``mapping_version`` they were made with. Bodies
+over ``max_bytes`` get 413, and requests beyond ``max_concurrent`` in flight get
+503 straight away instead of queueing. The server binds to localhost by default;
+``--stub-llm`` replaces the Azure model with ``agent.get_stub_llm`` so the whole
+pipeline runs offline.
+
+Usage (from the src directory):
+    python -m components.server --port 8765
+    python -m components.server --mapping "../documents/Liste over alle nøgler.csv" --workers 4 --stub-llm
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from components.mapping_registry import DEFAULT_POLL_INTERVAL, MappingRegistry
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_TIMEOUT = 300.0
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+CODE_MODES = ("prepass", "chunked", "agent")
+
+# Set in each worker process by _init_worker
+_WORKER_REGISTRY = None
+_WORKER_STUB_LLM = False
+
+
+def _init_worker(mapping_path, cache_dir, stub_llm, poll_interval):
+    global _WORKER_REGISTRY, _WORKER_STUB_LLM
+    _WORKER_STUB_LLM = stub_llm
+    if mapping_path:
+        # Each worker follows changes to the key list on its own
+        _WORKER_REGISTRY = MappingRegistry(mapping_path, cache_dir, poll_interval)
+        if not len(_WORKER_REGISTRY.start().current()):
+            raise RuntimeError(f"Could not load mapping: {mapping_path}")
+
+
+def _worker_version():
+    if _WORKER_REGISTRY is None:
+        return None
+    return _WORKER_REGISTRY.current()
+
+
+def _warm_up() -> dict:
+    # Runs once per worker before the server starts; imports the converters so
+    # the first request does not pay for them
+    import components.docx_stream  # noqa: F401
+    import components.tools  # noqa: F401
+
+    version = _worker_version()
+    return {
+        "pid": os.getpid(),
+        "titles": len(version) if version else 0,
+        "mapping_version": version.version if version else None,
+    }
+
+
+def _replace_titles(text: str, template: str) -> dict:
+    version = _worker_version()
+    if version is None:
+        raise ValueError("The service was started without a mapping")
+    replaced = 0
+
+    def replace(titel, nøgle):
+        nonlocal replaced
+        replaced += 1
+        return template.replace("<NØGLE>", nøgle)
+
+    return {
+        "text": version.matcher.sub(replace, text),
+        "replaced": replaced,
+        "mapping_version": version.version,
+    }
+
+
+def _convert(docx: bytes, verbosity: int) -> tuple:
+    from components.tools import convert_text_to_mergefields_bytes
+
+    success, report, output = convert_text_to_mergefields_bytes(docx, verbosity)
+    return success, report.as_dict(), output
+
+
+@functools.lru_cache(maxsize=None)
+def _stub_graph():
+    from components import agent
+
+    return agent.build_graph(agent.get_stub_llm())
+
+
+def _code(prompt: str, text: str, mode: str) -> dict:
+    from contextlib import nullcontext
+
+    from components import agent
+    from components.mapping_registry import use_version
+
+    kwargs = {}
+    if _WORKER_STUB_LLM:
+        # Stub answers must not end up in the shared result cache
+        kwargs = {"graph": _stub_graph(), "cache": False}
+    version = _worker_version()
+    # The agent, its tools and the pre-pass all use the worker's key list
+    with use_version(version) if version else nullcontext():
+        if mode == "agent":
+            coded = agent.code_letter(prompt, text, **kwargs)
+        else:
+            coded = agent.code_letter_prepass(
+                prompt, text, chunked=mode == "chunked", **kwargs
+            )
+        return {"text": coded, "mapping_version": agent.get_mapping_version().version}
+
+
+class HTTPError(Exception):
+    """An error answered with the given HTTP status and a JSON message."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ConversionService:
+    """
+    The worker pool and request limits behind the HTTP handler.
+
+    Args:
+        mapping_path (str, optional): Key list (.xlsx/.csv) loaded by every worker.
+        workers (int, optional): Worker processes. Defaults to the number of CPUs.
+        max_concurrent (int, optional): Requests processed at the same time;
+            more get 503. Defaults to twice the number of workers.
+        max_bytes (int, optional): Largest accepted request body.
+        timeout (float, optional): Seconds a request may take before 504.
+        cache_dir (str, optional): Directory for compiled mapping indexes.
+        stub_llm (bool, optional): Use the offline stub model for /code.
+        poll_interval (float, optional): Seconds between checks of the key list
+            for changes; a changed key list is reloaded without a restart.
+    """
+
+    def __init__(
+        self,
+        mapping_path: str = None,
+        workers: int = None,
+        max_concurrent: int = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        timeout: float = DEFAULT_TIMEOUT,
+        cache_dir: str = None,
+        stub_llm: bool = False,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.mapping_path = mapping_path
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or 2 * self.workers
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.stub_llm = stub_llm
+        self.started = time.time()
+        self.served = 0
+        self.in_flight = 0
+        self.worker_info = []
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._registry = None
+        self._cache_dir = cache_dir
+        self._poll_interval = poll_interval
+
+    def start(self) -> None:
+        """Start the worker processes and wait until each has loaded the mapping."""
+        if self.mapping_path:
+            # Build the compiled index once up front so workers only map it; the
+            # registry here only reports the current version in /health
+            self._registry = MappingRegistry(
+                self.mapping_path, self._cache_dir, self._poll_interval
+            )
+            if not len(self._registry.start().current()):
+                raise ValueError(f"Could not load mapping: {self.mapping_path}")
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(
+                self.mapping_path,
+                self._cache_dir,
+                self.stub_llm,
+                self._poll_interval,
+            ),
+        )
+        # Submitted back to back, the warm-up tasks start every worker
+        futures = [self._pool.submit(_warm_up) for _ in range(self.workers)]
+        self.worker_info = [future.result() for future in futures]
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._registry is not None:
+            self._registry.stop()
+
+    def run(self, func, *args):
+        """
+        Run ``func(*args)`` on the pool within the concurrency limit.
+
+        A slot is held until the task has finished, not until the response is
+        sent: a task that is already running cannot be cancelled, so after a
+        504 it keeps its worker busy, and releasing its slot then would let
+        new requests pile up behind it. Such a request still counts in
+        ``in_flight`` until it ends.
+
+        Raises:
+            HTTPError: 503 when all slots are taken, 504 on timeout.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HTTPError(503, "Too many requests in progress, try again later")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._pool.submit(func, *args)
+        except BaseException:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Only a task still waiting in the queue is cancelled here
+            future.cancel()
+            raise HTTPError(504, f"Request took more than {self.timeout:g} s")
+
+    def _finished(self, future) -> None:
+        # Runs once per task, when it has completed, failed or been cancelled
+        with self._lock:
+            self.in_flight -= 1
+            self.served += 1
+        self._slots.release()
+
+    def health(self) -> dict:
+        """Status for the /health endpoint."""
+        version = self._registry.current() if self._registry else None
+        return {
+            "status": "ok" if self._pool is not None else "stopped",
+            "workers": self.workers,
+            "warm_workers": len({info["pid"] for info in self.worker_info}),
+            "mapping": self.mapping_path,
+            "mapping_version": version.version if version else None,
+            "titles": len(version) if version else 0,
+            "stub_llm": self.stub_llm,
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "max_bytes": self.max_bytes,
+            "served": self.served,
+            "uptime": round(time.time() - self.started, 1),
+        }
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """Routes requests to the ``ConversionService`` on ``self.server.service``."""
+
+    server_version = "BrevkoderService/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/health":
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        routes = {
+            "/replace-titles": self._replace_titles,
+            "/convert": self._convert,
+            "/code": self._code,
+        }
+        route = routes.get(self.path.split("?", 1)[0])
+        try:
+            # Read the body before anything can fail, so an error answer leaves
+            # the connection at the start of the next request
+            body = self._read_body()
+            if route is None:
+                raise HTTPError(404, f"Unknown path {self.path}")
+            route(body)
+        except HTTPError as e:
+            self._send_json(e.status, {"error": e.message})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    # --- Endpoints ---
+
+    def _replace_titles(self, body: bytes):
+        request = self._json(body, ("text", "template"))
+        result = self.server.service.run(
+            _replace_titles, request["text"], request["template"]
+        )
+        self._send_json(200, result)
+
+    def _convert(self, body: bytes):
+        if not body:
+            raise HTTPError(400, "Send the .docx file as the request body")
+        verbosity = int(self.headers.get("X-Verbosity", 0) or 0)
+        success, report, output = self.server.service.run(_convert, body, verbosity)
+        if not success:
+            error = (report.get("error") or "Conversion failed").split("\n", 1)[0]
+            self._send_json(422, {"error": error, "report": report})
+            return
+        headers = {
+            "X-Conversion-Report": json.dumps(
+                {k: report[k] for k in ("total", "counts", "timings")}
+            )
+        }
+        self._send(200, output, DOCX_MIME, headers)
+
+    def _code(self, body: bytes):
+        request = self._json(body, ("prompt", "text"))
+        mode = request.get("mode", "prepass")
+        if mode not in CODE_MODES:
+            raise HTTPError(400, f"mode must be one of {', '.join(CODE_MODES)}")
+        result = self.server.service.run(
+            _code, request["prompt"], request["text"], mode
+        )
+        self._send_json(200, result)
+
+    # --- Helpers ---
+
+    def _read_body(self) -> bytes:
+        length = self.headers.get("Content-Length")
+        if length is None or not length.strip().isdecimal():
+            # Where the body ends is unknown: close the connection after the answer
+            self.close_connection = True
+            if length is None:
+                raise HTTPError(411, "Content-Length is required")
+            raise HTTPError(400, "Invalid Content-Length")
+        length = int(length)
+        if length > self.server.service.max_bytes:
+            # Not read: the connection is closed after the answer
+            self.close_connection = True
+            raise HTTPError(
+                413, f"Request body exceeds {self.server.service.max_bytes} bytes"
+            )
+        return self.rfile.read(length)
+
+    def _json(self, body: bytes, required) -> dict:
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Expected a JSON object")
+        for name in required:
+            if not isinstance(request.get(name), str):
+                raise HTTPError(400, f"'{name}' (string) is required")
+        return request
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def make_server(
+    service: ConversionService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> ThreadingHTTPServer:
+    """
+    Start ``service`` and return an HTTP server for it (not yet serving).
+
+    Args:
+        service (ConversionService): The configured service.
+        host (str, optional): Interface to bind; localhost by default.
+        port (int, optional): Port; 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: Call ``serve_forever()`` on it.
+    """
+    service.start()
+    server = ThreadingHTTPServer((host, port), ConversionHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local letter coding service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--mapping", help="Key list (.xlsx/.csv) for the workers")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--max-concurrent", type=int, default=None, help="Requests in flight at once"
+    )
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--cache-dir", help="Directory for compiled mapping indexes")
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between checks of the key list for changes",
+    )
+    parser.add_argument(
+        "--stub-llm", action="store_true", help="Use an offline stub instead of Azure"
+    )
+    args = parser.parse_args(argv)
+
+    if args.mapping is None:
+        from components.tools import DEFAULT_MAPPING_PATH
+
+        args.mapping = (
+            DEFAULT_MAPPING_PATH if os.path.exists(DEFAULT_MAPPING_PATH) else None
+        )
+    service = ConversionService(
+        mapping_path=args.mapping,
+        workers=args.workers,
+        max_concurrent=args.max_concurrent,
+        max_bytes=args.max_bytes,
+        timeout=args.timeout,
+        cache_dir=args.cache_dir,
+        stub_llm=args.stub_llm,
+        poll_interval=args.poll_interval,
+    )
+    server = make_server(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(
+        f"Serving on http://{host}:{port} with {service.workers} warm workers",
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
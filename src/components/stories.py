@@ -0,0 +1,98 @@
+"""
+Every paragraph of a Word package, in one walk.
+
+``doc.paragraphs`` only yields the body's top-level paragraphs, so placeholders
+in tables, text boxes, headers, footers, footnotes and endnotes were never
+converted. The text of a package lives in its story parts
+(``word/document.xml``, ``word/header*.xml``, ``word/footer*.xml``,
+``word/footnotes.xml``, ``word/endnotes.xml``); one XPath per part
+(``descendant-or-self::w:p``) finds all their paragraphs, however deeply they are
+nested in tables, content controls or text boxes, without building a python-docx
+object per container.
+
+A text box paragraph sits inside a run of its anchor paragraph, and Word stores
+most text boxes twice (DrawingML and a VML fallback); both copies are visited.
+"""
+
+import re
+
+from components.runs import W_NS
+
+# Part names of the story parts, with or without the leading "/"
+STORY_PART = re.compile(
+    r"^/?word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$"
+)
+
+_PARAGRAPHS = None
+
+
+def is_story_part(partname: str) -> bool:
+    """Whether a package part holds document text."""
+    return STORY_PART.match(partname) is not None
+
+
+def story_paragraphs(root) -> list:
+    """
+    All ``w:p`` elements in an element (the root of a story part, a table, a
+    body block...), in document order, including nested ones.
+
+    Args:
+        root: The element.
+
+    Returns:
+        list: The paragraphs; an anchor paragraph comes before the paragraphs of
+            its text boxes.
+    """
+    global _PARAGRAPHS
+    if _PARAGRAPHS is None:
+        from lxml import etree
+
+        _PARAGRAPHS = etree.XPath("descendant-or-self::w:p", namespaces={"w": W_NS})
+    return _PARAGRAPHS(root)
+
+
+class Stories:
+    """
+    The story parts of a python-docx ``Document``, main document first.
+
+    Headers and footers are parsed by python-docx already; footnotes and
+    endnotes are plain parts to python-docx, so they are parsed here and
+    written back by ``flush``.
+
+    Args:
+        document (docx.document.Document): The document.
+
+    Attributes:
+        parts (list): (partname, root element) of every story part.
+    """
+
+    def __init__(self, document):
+        from docx.oxml import parse_xml
+
+        self.parts = []
+        self._parsed = []
+        for part in document.part.package.iter_parts():
+            partname = str(part.partname)
+            if not is_story_part(partname):
+                continue
+            root = getattr(part, "element", None)
+            if root is None:
+                root = parse_xml(part.blob)
+                self._parsed.append((part, root))
+            self.parts.append((partname, root))
+        # document.xml first, then the other parts by name
+        self.parts.sort(key=lambda item: (item[0] != "/word/document.xml", item[0]))
+
+    def paragraphs(self):
+        """Yield (partname, ``w:p`` element) for every paragraph of the package."""
+        for partname, root in self.parts:
+            for p in story_paragraphs(root):
+                yield partname, p
+
+    def flush(self) -> None:
+        """Write the parts parsed here back to the package; call before saving."""
+        from docx.opc.oxml import serialize_part_xml
+
+        for part, root in self._parsed:
+            # python-docx serializes a plain Part from its blob
+            part._blob = serialize_part_xml(root)
@@ -1,26 +1,42 @@
 # --- Tool: Create a Word document from text ---
-from docx import Document
+import functools
 import io
 
 
-def text_to_word_docx(text: str, output_path: str = None) -> bytes:
+def text_to_word_stream(text: str) -> io.BytesIO:
     """
-    Create a Word (.docx) document from the given text. Each line becomes a paragraph.
-    If output_path is provided, saves the file there. Returns the bytes of the document.
+    Create a Word (.docx) document from the given text in memory. Each line becomes a paragraph.
 
     Args:
         text (str): The input text.
-        output_path (str, optional): Path to save the .docx file. If None, only returns bytes.
 
     Returns:
-        bytes: The .docx file as bytes.
+        io.BytesIO: The .docx file, positioned at the start.
     """
+    from docx import Document
+
     doc = Document()
     for line in text.splitlines():
         doc.add_paragraph(line)
     doc_io = io.BytesIO()
     doc.save(doc_io)
-    doc_bytes = doc_io.getvalue()
+    doc_io.seek(0)
+    return doc_io
+
+
+def text_to_word_docx(text: str, output_path: str = None) -> bytes:
+    """
+    Create a Word (.docx) document from the given text. Each line becomes a paragraph.
+    If output_path is provided, saves the file there. Returns the bytes of the document.
+
+    Args:
+        text (str): The input text.
+        output_path (str, optional): Path to save the .docx file. If None, only returns bytes.
+
+    Returns:
+        bytes: The .docx file as bytes.
+    """
+    doc_bytes = text_to_word_stream(text).getvalue()
     if output_path:
         with open(output_path, "wb") as f:
             f.write(doc_bytes)
@@ -32,21 +48,17 @@ Tool functions for document processing and mapping replacements.
 """
 
 import os
-import pandas as pd
+
+from components.mapping_cache import load_compiled_mapping
+from components.mapping_registry import get_registry, pinned_version
+from components.trigram import get_trigram_index
 
 
 # --- Minimal Excel mapping loader ---
 def load_excel_mapping(path):
-    try:
-        df = pd.read_excel(path, sheet_name=None)
-        # Try to find the right sheet ("query" or first sheet)
-        sheet = df["query"] if "query" in df else next(iter(df.values()))
-        # Expect columns: "Titel" and "Nøgle"
-        if "Titel" in sheet.columns and "Nøgle" in sheet.columns:
-            return dict(zip(sheet["Titel"], sheet["Nøgle"]))
-    except Exception:
-        pass
-    return {}
+    # Served from the compiled on-disk index; pandas only runs when the file changed
+    compiled = load_compiled_mapping(path)
+    return compiled.as_dict() if compiled else {}
 
 
 # Path to default mapping Excel (relative to this file)
@@ -55,7 +67,36 @@ DEFAULT_MAPPING_PATH = os.path.join(
     "documents",
     "Liste over alle nøgler.xlsx",
 )
-MAPPINGS_DICT = load_excel_mapping(DEFAULT_MAPPING_PATH)
+
+
+def get_mapping_version():
+    """
+    Return the mapping version to use: the one pinned for the current request
+    (``mapping_registry.use_version``), otherwise the current version of the
+    default key list. The key list is loaded on first use rather than at import,
+    and reloaded in the background when the file changes.
+
+    Returns:
+        MappingVersion: The mapping, its matcher and its version tag.
+    """
+    return pinned_version() or get_registry(DEFAULT_MAPPING_PATH).current()
+
+
+def get_mappings() -> dict:
+    """
+    Return the default Titel -> Nøgle mapping (see ``get_mapping_version``).
+
+    Returns:
+        dict: The default mapping (empty if the key list is missing).
+    """
+    return get_mapping_version().mappings
+
+
+def __getattr__(name):
+    # MAPPINGS_DICT stays available as a lazily loaded module attribute
+    if name == "MAPPINGS_DICT":
+        return get_mappings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def search_and_replace(text: str, search: str, replace: str) -> str:
@@ -78,6 +119,7 @@ def replace_titels_with_nogle(text: str, replacement_template: str) -> str:
     """
     Replace all occurrences of each 'Titel' in the mapping Excel with the replacement_template.
     If '<NØGLE>' is present in the template, it is replaced with the corresponding key (Nøgle).
+    The text is scanned once; where titles overlap, the leftmost and then longest one wins.
 
     Args:
         text (str): The input text.
@@ -86,192 +128,221 @@ def replace_titels_with_nogle(text: str, replacement_template: str) -> str:
     Returns:
         str: The modified text.
     """
-    result = text
-    for titel, nøgle in MAPPINGS_DICT.items():
-        if titel:
-            if "<NØGLE>" in replacement_template:
-                replacement = replacement_template.replace("<NØGLE>", str(nøgle))
-            else:
-                replacement = replacement_template
-            result = result.replace(str(titel), replacement)
-    return result
+    matcher = get_mapping_version().matcher
+    if "<NØGLE>" in replacement_template:
+        return matcher.sub(
+            lambda titel, nøgle: replacement_template.replace("<NØGLE>", nøgle), text
+        )
+    return matcher.sub(replacement_template, text)
 
 
-# --- Tool: Convert mergefield-like text and IF fields to actual Word fields ---
-from docx.oxml import OxmlElement
-import re
+# --- Tool: Look up candidate keys for a free-text phrase ---
+def get_title_index():
+    """
+    Return the trigram index of the mapping version in use, built once per
+    version so a lookup does not re-fingerprint the whole mapping on every call.
 
+    Returns:
+        TrigramIndex: The index over ``get_mappings()``.
+    """
+    return _title_index(get_mapping_version())
+
+
+@functools.lru_cache(maxsize=4)
+def _title_index(version):
+    return get_trigram_index(version.mappings)
 
-def convert_text_to_mergefields(docx_path: str, output_path: str = None) -> tuple:
+
+def lookup_titles(phrase: str, k: int = 5) -> str:
     """
-    Detects mergefield-like placeholders and IF fields in a Word document and converts them into actual merge fields and IF fields.
-    Specifically handles lines like:
-    { IF "J" "{ MERGEFIELD ab-borger-enlig-ved-aeldrecheck-berettigelse }" "dine" "din og din samlever/ægtefælles" }
+    Find the Titel entries in the key list most similar to 'phrase' (e.g. the title
+    in an 'If betingelse' line that is spelled, inflected or cased differently) and
+    return them with their Nøgle and a similarity score between 0 and 1.
 
     Args:
-        docx_path (str): Path to the input .docx file.
-        output_path (str, optional): Path to save the modified .docx file. If None, overwrites the input file.
+        phrase (str): The phrase to look up.
+        k (int): The number of candidates to return (at most 20).
 
     Returns:
-        tuple: (bool, str) - Success flag and debug info
+        str: One 'Titel -> Nøgle (score)' line per candidate, best first.
     """
-    try:
-        import re
-        from docx import Document
-        from docx.oxml import OxmlElement
-        from docx.oxml.ns import qn
+    candidates = get_title_index().search(phrase, max(1, min(k, 20)))
+    if not candidates:
+        return f"No titles resemble {phrase!r}."
+    return "\n".join(
+        f"{titel} -> {nøgle} ({score:.2f})" for titel, nøgle, score in candidates
+    )
 
-        doc = Document(docx_path)
-        debug_info = []
-        conversion_count = 0
 
-        # Simplified patterns for direct match
-        mergefield_pattern = re.compile(r"\{ *MERGEFIELD +([^\} ]+) *\}")
+# --- Tool: Convert mergefield-like text and IF fields to actual Word fields ---
 
-        # Exact pattern for the example
-        if_pattern = re.compile(
-            r'\{\s*IF\s+"J"\s+"{\s*MERGEFIELD\s+([\w\-:]+)\s*}"\s+"([^"]*)"\s+"([^"]*)"\s*\}'
-        )
 
-        # More generic pattern as fallback
-        if_pattern_generic = re.compile(
-            r'\{\s*IF\s+"([^"]+)"\s+"{\s*MERGEFIELD\s+([\w\-:]+)\s*}"\s+"([^"]*)"\s+"([^"]*)"\s*\}'
-        )
+def convert_text_to_mergefields(
+    docx_path: str,
+    output_path: str = None,
+    verbosity: int = 0,
+    paragraph_cache=None,
+) -> tuple:
+    """
+    Detects mergefield-like placeholders and IF fields in a Word document and converts them into actual merge fields and IF fields.
+    Handles any number of fields per paragraph, nested to any depth, such as:
+    { IF "J" "{ MERGEFIELD ab-borger-enlig-ved-aeldrecheck-berettigelse }" "dine" "din og din samlever/ægtefælles" }
+    The text around the fields is kept (see components.field_syntax).
+
+    Args:
+        docx_path (str or file-like): Path to the input .docx file, or a readable stream.
+        output_path (str or file-like, optional): Path or writable stream for the modified .docx file.
+            If None, overwrites the input file (docx_path must then be a path).
+        verbosity (int, optional): components.report level; 1 records every converted
+            field, 2 also every paragraph. Default 0: counts and timings only.
+        paragraph_cache (ParagraphCache, optional): Cache of converted paragraphs.
+            Defaults to the process-wide cache; False converts every paragraph.
 
-        debug_info.append(f"Processing document: {docx_path}")
-
-        # Define helper function to create merge fields
-        def create_merge_field(run, field_name):
-            run.text = ""
-
-            # Create field begin
-            fldChar1 = OxmlElement("w:fldChar")
-            fldChar1.set(qn("w:fldCharType"), "begin")
-
-            # Create instruction text
-            instrText = OxmlElement("w:instrText")
-            instrText.set(
-                qn("xml:space"), "preserve"
-            )  # Important to preserve whitespace
-            instrText.text = f" MERGEFIELD {field_name} "
-
-            # Create field separator
-            fldChar2 = OxmlElement("w:fldChar")
-            fldChar2.set(qn("w:fldCharType"), "separate")
-
-            # Create field end
-            fldChar3 = OxmlElement("w:fldChar")
-            fldChar3.set(qn("w:fldCharType"), "end")
-
-            # Append elements
-            r = run._r
-            r.append(fldChar1)
-            r.append(instrText)
-            r.append(fldChar2)
-            r.append(fldChar3)
-
-        # Define helper function to create IF fields
-        def create_if_field(paragraph, cond, mergefield, true_text, false_text):
-            # Remove all runs in the paragraph
-            for run in list(paragraph.runs):
-                paragraph._element.remove(run._element)
-
-            # Add new run for the field
-            run = paragraph.add_run()
-            r = run._r
-
-            # Create field begin
-            fldChar1 = OxmlElement("w:fldChar")
-            fldChar1.set(qn("w:fldCharType"), "begin")
-
-            # Create instruction text
-            instrText = OxmlElement("w:instrText")
-            instrText.set(
-                qn("xml:space"), "preserve"
-            )  # Important to preserve whitespace
-
-            # Special format for the case where condition is "J"
-            if cond == "J":
-                instrText.text = f' IF "J" = "{{ MERGEFIELD {mergefield} }}" "{true_text}" "{false_text}" '
-            else:
-                instrText.text = f' IF "{cond}" "{{ MERGEFIELD {mergefield} }}" "{true_text}" "{false_text}" '
-
-            # Create field separator
-            fldChar2 = OxmlElement("w:fldChar")
-            fldChar2.set(qn("w:fldCharType"), "separate")
-
-            # Create field end
-            fldChar3 = OxmlElement("w:fldChar")
-            fldChar3.set(qn("w:fldCharType"), "end")
-
-            # Append elements
-            r.append(fldChar1)
-            r.append(instrText)
-            r.append(fldChar2)
-            r.append(fldChar3)
-
-        # Process each paragraph
-        for i, para in enumerate(doc.paragraphs):
-            para_text = para.text.strip()
-            debug_info.append(f"Processing paragraph {i+1}: '{para_text[:50]}...'")
-
-            # Look for the exact match first - this is crucial for the example line
-            m = if_pattern.search(para_text)
-            if m:
-                mergefield_name = m.group(1)
-                true_text = m.group(2)
-                false_text = m.group(3)
-                debug_info.append(
-                    f"Found exact IF pattern with mergefield: {mergefield_name}"
-                )
-                create_if_field(para, "J", mergefield_name, true_text, false_text)
-                conversion_count += 1
-                continue
-
-            # Try the generic pattern as fallback
-            m = if_pattern_generic.search(para_text)
-            if m:
-                cond = m.group(1)
-                mergefield_name = m.group(2)
-                true_text = m.group(3)
-                false_text = m.group(4)
-                debug_info.append(
-                    f"Found generic IF pattern with condition: {cond}, mergefield: {mergefield_name}"
-                )
-                create_if_field(para, cond, mergefield_name, true_text, false_text)
-                conversion_count += 1
-                continue
-
-            # Otherwise, search for MERGEFIELDs in runs
-            for run in para.runs:
-                matches = list(mergefield_pattern.finditer(run.text))
-                if not matches:
+    Returns:
+        tuple: (bool, ConversionReport) - Success flag and the conversion report
+            (str() gives a readable summary)
+    """
+    from components.paragraph_cache import get_paragraph_cache
+    from components.report import FIELDS, PARAGRAPHS, ConversionReport
+
+    cache = get_paragraph_cache() if paragraph_cache is None else paragraph_cache
+
+    source_name = (
+        docx_path
+        if isinstance(docx_path, str)
+        else getattr(docx_path, "name", "<stream>")
+    )
+    report = ConversionReport(source_name, verbosity)
+    paragraph_events = verbosity >= PARAGRAPHS
+    field_events = verbosity >= FIELDS
+    try:
+        from docx import Document
+        from docx.text.paragraph import Paragraph
+
+        from components.field_syntax import find_fields
+        from components.fields import IfField, MergeField, field_run
+        from components.runs import BARRIER, ParagraphText
+        from components.stories import Stories
+
+        with report.stage("load"):
+            doc = Document(docx_path)
+
+        def field_kind(field):
+            # Report counts: "if" for the usual { IF "J" ... } form
+            if isinstance(field, MergeField):
+                return "mergefield"
+            condition = field.condition if isinstance(field, IfField) else None
+            if getattr(condition, "left", None) == "J":
+                return "if"
+            return "if_generic"
+
+        def convert_paragraph(i, para, para_text):
+            if paragraph_events:
+                report.event(PARAGRAPHS, "paragraph", i, para_text.strip()[:50])
+            if "{" not in para_text:
+                return
+
+            # Parse the field codes over the whole paragraph text, so codes Word
+            # split across several runs are found too; the text around them and
+            # its formatting are kept
+            text = ParagraphText(para._p)
+            spans = []
+            for start, end, field, _ in find_fields(text.text):
+                if BARRIER in text.text[start:end]:
+                    # Spans over non-text content are never rewritten
                     continue
-                new_text = run.text
-                for match in reversed(matches):
-                    field_name = match.group(1)
-                    before = new_text[: match.start()]
-                    after = new_text[match.end() :]
-                    debug_info.append(f"Found MERGEFIELD: {field_name}")
-                    run.text = before
-                    merge_run = para.add_run()
-                    create_merge_field(merge_run, field_name)
-                    if after:
-                        para.add_run(after)
-                    new_text = before
-                    conversion_count += 1
+                kind = field_kind(field)
+                if field_events:
+                    detail = field.key if kind == "mergefield" else str(field)
+                    report.event(FIELDS, kind, i, detail)
+                report.count(kind)
+                spans.append((start, end, lambda rPr, field=field: [field_run(field)]))
+            if spans:
+                text.rewrite(spans)
+
+        # Process every paragraph of the package (body, tables, text boxes,
+        # headers, footers, footnotes, endnotes); paragraphs converted before are
+        # taken from the cache. The events recorded depend on the verbosity, so it
+        # is part of the key.
+        converter = f"mergefields:{min(verbosity, PARAGRAPHS)}"
+        with report.stage("convert"):
+            stories = Stories(doc)
+            for i, (_, p) in enumerate(stories.paragraphs()):
+                para = Paragraph(p, None)
+                para_text = para.text
+                if cache is False or "{" not in para_text:
+                    # A paragraph without a brace has nothing to convert; that is
+                    # cheaper to see than serializing and hashing it for the cache
+                    convert_paragraph(i, para, para_text)
+                    continue
+                source = cache.source(p)
+                if not cache.cacheable(source):
+                    convert_paragraph(i, para, para_text)
+                    continue
+                key = cache.key(source, converter)
+                entry = cache.get(key)
+                if entry is not None:
+                    cache.apply(p, entry, report, i)
+                    continue
+                counts_before = dict(report.counts)
+                events_before = report.recorded_events
+                convert_paragraph(i, para, para_text)
+                cache.record(key, source, p, report, counts_before, events_before)
+            stories.flush()
 
         if output_path is None:
             output_path = docx_path
-        doc.save(output_path)
+        with report.stage("save"):
+            doc.save(output_path)
 
-        debug_message = f"Converted {conversion_count} fields"
-        if debug_info:
-            debug_message += f"\nDebug info: {', '.join(debug_info)}"
-        return (conversion_count > 0, debug_message)
+        return (report.total > 0, report)
 
     except Exception as e:
         import traceback
 
-        error_details = traceback.format_exc()
-        return (False, f"Error: {str(e)}\n{error_details}")
+        report.error = f"{str(e)}\n{traceback.format_exc()}"
+        return (False, report)
+
+
+# --- In-memory variants: no temporary files ---
+def convert_text_to_mergefields_stream(
+    source, destination, verbosity: int = 0, paragraph_cache=None
+) -> tuple:
+    """
+    Same as convert_text_to_mergefields, reading from and writing to file-like objects
+    (e.g. a Streamlit upload and an io.BytesIO).
+
+    Args:
+        source (file-like): Readable binary stream with the .docx file.
+        destination (file-like): Writable binary stream for the modified .docx file.
+        verbosity (int, optional): Report verbosity, see convert_text_to_mergefields.
+        paragraph_cache (ParagraphCache, optional): See convert_text_to_mergefields.
+
+    Returns:
+        tuple: (bool, ConversionReport) - Success flag and the conversion report
+    """
+    return convert_text_to_mergefields(source, destination, verbosity, paragraph_cache)
+
+
+def convert_text_to_mergefields_bytes(
+    docx, verbosity: int = 0, paragraph_cache=None
+) -> tuple:
+    """
+    Same as convert_text_to_mergefields, taking and returning the document in memory.
+
+    Args:
+        docx (bytes or file-like): The .docx file as bytes, or a readable stream such as an upload.
+        verbosity (int, optional): Report verbosity, see convert_text_to_mergefields.
+        paragraph_cache (ParagraphCache, optional): See convert_text_to_mergefields.
+
+    Returns:
+        tuple: (bool, ConversionReport, bytes) - Success flag, the conversion report and
+            the modified .docx file (empty if the conversion failed).
+    """
+    if isinstance(docx, (bytes, bytearray, memoryview)):
+        docx = io.BytesIO(docx)
+    output = io.BytesIO()
+    success, report = convert_text_to_mergefields_stream(
+        docx, output, verbosity, paragraph_cache
+    )
+    return success, report, output.getvalue()
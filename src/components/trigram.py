@@ -0,0 +1,130 @@
+"""
+Trigram index for fuzzy title lookup.
+
+Lets the agent resolve a free-text phrase (e.g. the title after "If betingelse",
+with different casing, inflection or a typo) to candidate keys without putting
+thousands of Titel/Nøgle pairs into the context. Titles are normalized and split
+into character trigrams; an inverted index from trigram to title ids gives the
+shared-trigram count of every candidate in one pass over the query's postings,
+and candidates are ranked by Dice similarity.
+
+Trigrams found in more than ``COMMON_FRACTION`` of the titles ("  b", "er ")
+carry little information but make up most of the postings, so they are left out
+of the candidate count whenever the query has rarer ones. The best
+``RESCORE_FACTOR * k`` candidates are then scored exactly against their full
+trigram sets. Lookups on a few thousand titles take well under a millisecond.
+"""
+
+import heapq
+import re
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
+
+from components.matcher import fingerprint_cache, is_title
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+COMMON_FRACTION = 0.05
+RESCORE_FACTOR = 8
+
+
+def normalize(text: str) -> str:
+    """Casefold, turn punctuation into spaces and collapse whitespace."""
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of the normalized text, padded at the ends."""
+    padded = f"  {normalize(text)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted trigram index over the titles of a mapping.
+
+    Attributes:
+        titles (list): Titles, by id.
+        keys (list): Keys, aligned with ``titles``.
+        grams (list): Trigram set of every title, by id.
+        postings (dict): Trigram -> tuple of title ids containing it.
+    """
+
+    def __init__(self, mappings: dict):
+        self.titles = []
+        self.keys = []
+        self.grams = []
+        postings = {}
+        for titel, nøgle in mappings.items():
+            if not is_title(titel) or not isinstance(nøgle, str):
+                continue
+            titel = str(titel)
+            grams = frozenset(trigrams(titel))
+            title_id = len(self.titles)
+            self.titles.append(titel)
+            self.keys.append(nøgle)
+            self.grams.append(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(title_id)
+        self.postings = {gram: tuple(ids) for gram, ids in postings.items()}
+        self._common = max(1, int(len(self.titles) * COMMON_FRACTION))
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def search(self, phrase: str, k: int = 5, min_score: float = 0.0) -> list:
+        """
+        Return the ``k`` titles most similar to ``phrase``.
+
+        Args:
+            phrase (str): Free text, e.g. a condition title.
+            k (int, optional): Number of candidates.
+            min_score (float, optional): Drop candidates scoring below this.
+
+        Returns:
+            list: (titel, nøgle, score) tuples, best first; score is the Dice
+                coefficient of the trigram sets (1.0 for an exact match).
+        """
+        grams = trigrams(phrase)
+        if not grams or k <= 0:
+            return []
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        rare = [ids for ids in lists if len(ids) <= self._common] or lists
+        shared = Counter(chain.from_iterable(rare))
+        candidates = heapq.nlargest(
+            RESCORE_FACTOR * k, shared.items(), key=itemgetter(1)
+        )
+        size = len(grams)
+        title_grams = self.grams
+
+        def dice(title_id):
+            other = title_grams[title_id]
+            return 2 * len(grams & other) / (size + len(other))
+
+        best = heapq.nlargest(
+            k, ((dice(title_id), title_id) for title_id, _ in candidates)
+        )
+        return [
+            (self.titles[title_id], self.keys[title_id], round(score, 4))
+            for score, title_id in best
+            if score >= min_score
+        ]
+
+
+# Built indexes by mapping content
+_indexes = fingerprint_cache(TrigramIndex)
+
+
+def get_trigram_index(mappings: dict) -> TrigramIndex:
+    """
+    Return the ``TrigramIndex`` for a mapping, building it only once per
+    distinct mapping content.
+
+    Args:
+        mappings (dict): The Titel -> Nøgle mapping.
+
+    Returns:
+        TrigramIndex: The index.
+    """
+    return _indexes(mappings)
@@ -0,0 +1,64 @@
+"""
+Shared fixtures for the tests in this directory.
+
+Run from the src directory:
+    python -m pytest -q
+"""
+
+import csv
+
+import pytest
+
+# A small key list in the layout of the exported one
+KEY_LIST = {
+    "Borgers navn": "ab-borger-navn",
+    "Borgers adresse": "ab-borger-adresse",
+    "Borgers navn og adresse": "ab-borger-navn-og-adresse",
+    "Er enlig": "ab-borger-enlig",
+    "Samlet beløb": "ab-samlet-beloeb",
+}
+
+
+def write_key_list(path, mapping: dict) -> str:
+    """Write ``mapping`` as a ';'-separated key list with a BOM."""
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["Titel", "Nøgle"])
+        writer.writerows(mapping.items())
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep compiled mapping indexes out of the user's cache directory."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("BREVKODER_CACHE_DIR", str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def keys() -> dict:
+    """A copy of ``KEY_LIST``."""
+    return dict(KEY_LIST)
+
+
+@pytest.fixture(scope="session")
+def write_keys():
+    """``write_key_list``, for tests that change a key list."""
+    return write_key_list
+
+
+@pytest.fixture
+def key_list(tmp_path) -> str:
+    """Path of a .csv key list holding ``KEY_LIST``."""
+    return write_key_list(tmp_path / "keys.csv", KEY_LIST)
+
+
+@pytest.fixture
+def mapping_version(key_list):
+    """Pin a ``MappingVersion`` of ``KEY_LIST`` for the test."""
+    from components.mapping_cache import load_compiled_mapping
+    from components.mapping_registry import MappingVersion, use_version
+
+    with use_version(MappingVersion(key_list, 1, load_compiled_mapping(key_list))):
+        yield
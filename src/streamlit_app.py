@@ -1,28 +1,61 @@
 import streamlit as st
 import pandas as pd
+import hashlib
+import io
 import os
 import logging
-from components.tools import text_to_word_docx, convert_text_to_mergefields
+from components.mapping_cache import read_mapping_source
+from components.matcher import (
+    compile_matcher,
+    mapping_fingerprint,
+    register_fingerprint,
+)
+from components.jobs import DONE, FAILED, FINISHED, JobRunner
+from components.tools import text_to_word_docx, convert_text_to_mergefields_bytes
 
-# from components.agent import graph, load_excel_mapping
+# from components.agent import code_letter, load_excel_mapping
 # from components.tools import search_and_replace, replace_titels_with_nogle
 
 # logging.basicConfig(level=logging.DEBUG)
 
 
-# Function to load mappings from an uploaded Excel file
-def load_uploaded_mappings(uploaded_file):
+# --- Mapping loading, cached across reruns ---
+# Streamlit reruns this script on every widget change. Parsed mappings and their
+# compiled matchers are cached on the file content hash, so typing in a text
+# area does not re-read the key list.
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def parse_mappings(digest: str, name: str, _content: bytes):
+    # Keyed on ``digest`` only; the returned dict is shared between reruns and
+    # sessions, so it must not be modified
     try:
-        df = pd.read_excel(uploaded_file, sheet_name=None)
-        # Try to find the right sheet ("query" or first sheet)
-        sheet = df["query"] if "query" in df else next(iter(df.values()))
-        # Expect columns: "Titel" and "Nøgle"
-        if "Titel" in sheet.columns and "Nøgle" in sheet.columns:
-            return dict(zip(sheet["Titel"], sheet["Nøgle"])), None
-        else:
-            return {}, "Excel-filen mangler 'Titel' eller 'Nøgle' kolonner."
+        source = io.BytesIO(_content)
+        source.name = name
+        mappings = read_mapping_source(source)
     except Exception as e:
-        return {}, f"Fejl ved indlæsning af Excel-fil: {str(e)}"
+        return {}, f"Fejl ved indlæsning af {name}: {str(e)}"
+    if not mappings:
+        return {}, f"{name} mangler 'Titel' eller 'Nøgle' kolonner."
+    # Hash the shared dict once: later lookups (matcher, MappingIndex, paragraph
+    # cache) find its fingerprint by identity. Compile the title matcher once
+    # per mapping content.
+    fingerprint = mapping_fingerprint(mappings)
+    register_fingerprint(mappings, fingerprint)
+    compile_matcher(mappings, fingerprint)
+    return mappings, None
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def mapping_frame(digest: str, _mappings: dict) -> pd.DataFrame:
+    # Preview table for the mapping with content hash ``digest``
+    return pd.DataFrame(
+        {"Titel": list(_mappings.keys()), "Nøgle": list(_mappings.values())}
+    )
 
 
 st.set_page_config(page_title="Brevkoder-automater", layout="wide")
@@ -44,18 +77,19 @@ with st.expander("Om denne app", expanded=False):
     """
     )
 
-# Load default mapping from CSV at startup
+# Load default mapping from CSV (cached on its content)
 default_mapping_path = os.path.join("documents", "Liste over alle nøgler.csv")
 default_mappings = None
+default_digest = None
 if os.path.exists(default_mapping_path):
-    try:
-        df_default = pd.read_csv(default_mapping_path, sep=";")
-        if "Titel" in df_default.columns and "Nøgle" in df_default.columns:
-            default_mappings = {
-                row["Titel"]: row["Nøgle"] for _, row in df_default.iterrows()
-            }
-    except Exception as e:
-        st.error(f"Fejl ved indlæsning af standard-CSV: {str(e)}")
+    with open(default_mapping_path, "rb") as f:
+        default_content = f.read()
+    default_digest = content_hash(default_content)
+    default_mappings, error = parse_mappings(
+        default_digest, os.path.basename(default_mapping_path), default_content
+    )
+    if error:
+        st.error(error)
 
 st.subheader("1. Upload Excel-fil med Titel/Nøgle-koblinger")
 
@@ -68,23 +102,21 @@ uploaded_file = st.file_uploader("Vælg en Excel-fil", type=["xlsx"])
 
 mappings = None
 if uploaded_file is not None:
-    mappings, error = load_uploaded_mappings(uploaded_file)
+    uploaded_content = uploaded_file.getvalue()
+    uploaded_digest = content_hash(uploaded_content)
+    mappings, error = parse_mappings(
+        uploaded_digest, uploaded_file.name, uploaded_content
+    )
     if error:
         st.error(error)
     else:
         st.write("Antal koblinger fundet:", len(mappings))
         with st.expander("Vis titel/nøgle-par (fra uploadet fil)", expanded=False):
-            st.dataframe(
-                pd.DataFrame(list(mappings.items()), columns=["Titel", "Nøgle"]),
-                hide_index=True,
-            )
+            st.dataframe(mapping_frame(uploaded_digest, mappings), hide_index=True)
 elif default_mappings:
     st.write("Antal koblinger fundet:", len(default_mappings))
     with st.expander("Vis titel/nøgle-par (fra standardfil)", expanded=False):
-        st.dataframe(
-            pd.DataFrame(list(default_mappings.items()), columns=["Titel", "Nøgle"]),
-            hide_index=True,
-        )
+        st.dataframe(mapping_frame(default_digest, default_mappings), hide_index=True)
     mappings = default_mappings
 else:
     st.info("Upload venligst en Excel-fil med koblinger.")
@@ -193,123 +225,119 @@ if "kodning_output" not in st.session_state:
     st.session_state["kodning_output"] = None
 
 
-if st.button("Start kodning"):
-    try:
-        if uploaded_docx is not None:
-            # Process the uploaded Word document (mock: just extract text, real: would use LLM/agent)
-            # For demo, just use the mock result and write it to a .docx, then convert mergefields
-            with st.spinner("Word-dokument behandles og mergefields indsættes..."):
-                import tempfile
-
-                # Generate mock result with special focus on the exact IF pattern example
-                mock_result = 'Vi lægger desuden vægt på, at det også af afgørelsen om ældrecheck fremgik, at vi ved opgørelsen af din likvide formue havde hentet { IF "J" "{ MERGEFIELD ab-borger-enlig-ved-aeldrecheck-berettigelse }" "dine" "din og din samlever/ægtefælles" } formueoplysninger fra seneste årsopgørelse fra Skattestyrelsen.'
-
-                # Save mock result as docx
-                # Create a temporary file
-                import os
-
-                with tempfile.NamedTemporaryFile(
-                    delete=False, suffix=".docx"
-                ) as tmp_docx:
-                    tmp_path = tmp_docx.name
-
-                try:
-                    # Convert text to Word document
-                    text_to_word_docx(mock_result, tmp_path)
-
-                    # Convert mergefield-like text to real mergefields
-                    success, debug_info = convert_text_to_mergefields(
-                        tmp_path, tmp_path
-                    )
-
-                    # Read the bytes for download
-                    with open(tmp_path, "rb") as f:
-                        doc_bytes = f.read()
-
-                    if success:
-                        st.success(
-                            f"Word-dokument med mergefields er klar til download!"
-                        )
-                        st.session_state["kodning_docx_bytes"] = doc_bytes
-                    else:
-                        st.warning(
-                            f"Bemærk: Ingen felter blev konverteret. {debug_info}"
-                        )
-                        st.session_state["kodning_docx_bytes"] = doc_bytes
-
-                    st.session_state["kodning_output"] = (
-                        None  # No text output for Word doc
-                    )
-
-                except Exception as e:
-                    st.error(f"Fejl under konvertering: {str(e)}")
-                    import traceback
-
-                    st.error(f"Detaljer: {traceback.format_exc()}")
-                finally:
-                    # Clean up the temporary file
-                    if os.path.exists(tmp_path):
-                        try:
-                            os.unlink(tmp_path)
-                        except:
-                            pass
-        else:
-            # --- Sprogmodel/agent kode (udkommenteret for demo/eksempeltilstand) ---
-            # combined_prompt = f"{llm_prompt}\n\nText to process:\n{input_text}"
-            # with st.spinner("Teksten behandles med sprogmodel..."):
-            #     result_placeholder = st.empty()
-            #     transformed_text = ""
-            #     for event in graph.stream(
-            #         {"messages": [{"role": "user", "content": combined_prompt}]}
-            #     ):
-            #         for value in event.values():
-            #             if value["messages"] and len(value["messages"]) > 0:
-            #                 latest_message = value["messages"][-1].content
-            #                 if latest_message:
-            #                     transformed_text = latest_message
-            #                     result_placeholder.markdown(
-            #                         f"**Behandlingens resultat:**\n{transformed_text}"
-            #                     )
-            #     st.success("Transformationen er færdig!")
-            #     st.subheader("Resultat:")
-            #     st.markdown(transformed_text)
-
-            # --- Mock transformation instead of LLM/agent ---
-            with st.spinner("Teksten behandles (demotilstand)..."):
-                mock_result = get_mock_result(input_text)
-                st.session_state["kodning_output"] = mock_result
-
-                # Create a temporary docx for conversion
-                import tempfile
-
-                with tempfile.NamedTemporaryFile(
-                    delete=False, suffix=".docx"
-                ) as tmp_docx:
-                    text_to_word_docx(mock_result, tmp_docx.name)
-                    try:
-                        # Convert mergefield-like text to real mergefields
-                        success, debug_info = convert_text_to_mergefields(
-                            tmp_docx.name, tmp_docx.name
-                        )
-                        # Read the bytes for download
-                        with open(tmp_docx.name, "rb") as f:
-                            doc_bytes = f.read()
-
-                        st.session_state["kodning_docx_bytes"] = doc_bytes
-
-                        # if success:
-                        #     st.success(f"Eksempel på kodning er færdig! {debug_info if debug_info else ''}")
-                        # else:
-                        #     st.warning(f"Ingen mergefields blev fundet i teksten. {debug_info if debug_info else ''}")
-                    except Exception as e:
-                        st.error(f"Fejl under konvertering af mergefields: {str(e)}")
-                        import traceback
-
-                        st.error(f"Detaljer: {traceback.format_exc()}")
-    except Exception as e:
-        st.error(f"Error during mock kodning: {str(e)}")
-        st.session_state["kodning_output"] = None
-        st.session_state["kodning_docx_bytes"] = None
+# --- Background kodning ---
+# The conversion runs as a job on a shared background runner; the session only
+# keeps the job id and polls it, so widget changes neither block on nor lose
+# work in progress.
+
+
+@st.cache_resource
+def get_job_runner():
+    return JobRunner()
+
+
+def kodning_job(job, coded_text, show_text):
+    # Turn the coded text into a Word document with real fields
+    job.progress("docx", 0, 2, "Word-dokument oprettes...")
+    docx = text_to_word_docx(coded_text)
+    job.progress("convert", 1, 2, "Mergefields indsættes...")
+    # Convert mergefield-like text to real mergefields in memory
+    success, report, doc_bytes = convert_text_to_mergefields_bytes(docx)
+    job.progress("done", 2, 2, "Færdig")
+    return {
+        "success": success,
+        "report": str(report),
+        "docx_bytes": doc_bytes,
+        "output": coded_text if show_text else None,
+    }
+
+
+def collect_job(job):
+    # Move a finished job's result into session state
+    st.session_state["kodning_job"] = None
+    if job.status == DONE:
+        result = job.result
+        st.session_state["kodning_output"] = result["output"]
+        st.session_state["kodning_docx_bytes"] = result["docx_bytes"]
+        if result["output"] is None:
+            st.session_state["kodning_message"] = (
+                ("success", "Word-dokument med mergefields er klar til download!")
+                if result["success"]
+                else (
+                    "warning",
+                    f"Bemærk: Ingen felter blev konverteret. {result['report']}",
+                )
+            )
+    elif job.status == FAILED:
+        st.session_state["kodning_message"] = (
+            "error",
+            f"Fejl under konvertering: {job.error}",
+        )
+    else:
+        st.session_state["kodning_message"] = ("info", "Kodningen blev annulleret.")
+
+
+if st.button("Start kodning", disabled=bool(st.session_state.get("kodning_job"))):
+    st.session_state["kodning_output"] = None
+    st.session_state["kodning_docx_bytes"] = None
+    st.session_state["kodning_message"] = None
+    if uploaded_docx is not None:
+        # Process the uploaded Word document (mock: real would use LLM/agent)
+        # Generate mock result with special focus on the exact IF pattern example
+        mock_result = 'Vi lægger desuden vægt på, at det også af afgørelsen om ældrecheck fremgik, at vi ved opgørelsen af din likvide formue havde hentet { IF "J" "{ MERGEFIELD ab-borger-enlig-ved-aeldrecheck-berettigelse }" "dine" "din og din samlever/ægtefælles" } formueoplysninger fra seneste årsopgørelse fra Skattestyrelsen.'
+        job = get_job_runner().submit(
+            kodning_job, mock_result, False, label=uploaded_docx.name
+        )
+    else:
+        # --- Sprogmodel/agent kode (udkommenteret for demo/eksempeltilstand) ---
+        # Repeats of an unchanged prompt/text/key list come from the result cache
+        # job = get_job_runner().submit(
+        #     lambda job: kodning_job(
+        #         job,
+        #         code_letter_chunked(
+        #             llm_prompt,
+        #             input_text,
+        #             on_progress=lambda done, total: job.progress(
+        #                 "chunk", done, total, f"Afsnit {done} af {total} kodet..."
+        #             ),
+        #         ),
+        #         True,
+        #     ),
+        #     label="Tekst",
+        # )
+
+        # --- Mock transformation instead of LLM/agent ---
+        job = get_job_runner().submit(
+            kodning_job, get_mock_result(input_text), True, label="Tekst"
+        )
+    st.session_state["kodning_job"] = job.id
+
+
+@st.fragment(run_every=0.5)
+def kodning_progress():
+    job_id = st.session_state.get("kodning_job")
+    job = get_job_runner().get(job_id) if job_id else None
+    if job is None:
+        if job_id:
+            st.session_state["kodning_job"] = None
+        return
+    if job.status in FINISHED:
+        collect_job(job)
+        st.rerun()
+    latest = job.latest
+    st.progress(
+        job.fraction() or 0.0,
+        text=latest["message"] if latest else "Venter i kø...",
+    )
+    if st.button("Annuller kodning"):
+        get_job_runner().cancel(job_id)
+
+
+kodning_progress()
+
+message = st.session_state.get("kodning_message")
+if message:
+    getattr(st, message[0])(message[1])
 
 # Only show the download button if output exists
 if st.session_state.get("kodning_output"):
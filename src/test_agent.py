@@ -0,0 +1,153 @@
+import types
+
+import pytest
+
+from components import agent
+from components.result_cache import ResultCache
+
+PROMPT = "Kod brevet."
+LETTER = "\n".join(
+    [
+        "Kære Borgers navn",
+        "",
+        "Vi skriver til dig på Borgers adresse.",
+        "If betingelse Er enlig",
+        "Du bor alene.",
+        "",
+        "Borgers, navn og adresse er ændret.",
+        "Med venlig hilsen",
+    ]
+)
+
+
+class EchoGraph:
+    """Stands in for the agent graph: answers with the text it was sent."""
+
+    def __init__(self):
+        self.texts = []
+
+    def _answer(self, state):
+        content = state["messages"][0]["content"]
+        text = content.partition("Text to process:\n")[2]
+        self.texts.append(text)
+        return types.SimpleNamespace(content=text)
+
+    def stream(self, state):
+        yield {"tool_calling_llm": {"messages": [self._answer(state)]}}
+
+    async def ainvoke(self, state):
+        return {"messages": [*state["messages"], self._answer(state)]}
+
+
+@pytest.fixture
+def graph():
+    return EchoGraph()
+
+
+def test_code_letter_returns_the_last_message(graph):
+    assert agent.code_letter(PROMPT, "Hej", graph=graph, cache=False) == "Hej"
+
+
+def test_chunked_coding_reassembles_the_letter(graph):
+    progress = []
+    letter = "\n\n".join(f"Afsnit {i}. " + "tekst " * 20 for i in range(30))
+    coded = agent.code_letter_chunked(
+        PROMPT,
+        letter,
+        graph=graph,
+        cache=False,
+        max_chars=300,
+        on_progress=lambda done, total: progress.append((done, total)),
+    )
+    assert coded == letter
+    assert len(graph.texts) > 1
+    assert progress[-1] == (len(graph.texts), len(graph.texts))
+
+
+def test_chunked_coding_keeps_constructs_in_one_chunk(graph):
+    agent.code_letter_chunked(PROMPT, LETTER, graph=graph, cache=False, max_chars=40)
+    assert any("If betingelse Er enlig\nDu bor alene." in text for text in graph.texts)
+
+
+def test_chunked_coding_uses_the_result_cache(graph, tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    letter = "\n\n".join(f"Afsnit {i}. " + "tekst " * 20 for i in range(5))
+    first = agent.code_letter_chunked(
+        PROMPT, letter, graph=graph, cache=cache, max_chars=300
+    )
+    calls = len(graph.texts)
+    second = agent.code_letter_chunked(
+        PROMPT, letter, graph=graph, cache=cache, max_chars=300
+    )
+    assert first == second == letter
+    assert len(graph.texts) == calls
+
+
+def test_results_are_cached_per_agent(graph, tmp_path):
+    class OtherGraph(EchoGraph):
+        pass
+
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    agent.code_letter(PROMPT, "Hej", graph=graph, cache=cache)
+    agent.code_letter(PROMPT, "Hej", graph=EchoGraph(), cache=cache)
+    other = OtherGraph()
+    agent.code_letter(PROMPT, "Hej", graph=other, cache=cache)
+    assert (len(graph.texts), len(other.texts)) == (1, 1)
+
+
+def test_agent_tag_names_the_model_and_tools():
+    default = agent.agent_tag()
+    assert agent.AZURE_DEPLOYMENT in default
+    assert "search_and_replace" in default
+    stub_graph = agent.build_graph(agent.get_stub_llm())
+    tag = stub_graph.config["metadata"]["agent_tag"]
+    assert tag == agent.agent_tag(agent.get_stub_llm())
+    assert tag != default
+    assert "echo" in tag
+
+
+def test_prepass_codes_known_titles_locally(graph, keys):
+    coded = agent.code_letter_prepass(
+        PROMPT, LETTER, graph=graph, cache=False, mappings=keys
+    )
+    lines = coded.split("\n")
+    assert lines[0] == "Kære { MERGEFIELD ab-borger-navn }"
+    assert lines[2] == "Vi skriver til dig på { MERGEFIELD ab-borger-adresse }."
+    # The graph echoes the construct unchanged, as sent
+    assert lines[3:5] == ["If betingelse Er enlig", "Du bor alene."]
+    assert lines[-1] == "Med venlig hilsen"
+
+
+def test_prepass_sends_only_paragraphs_that_need_judgement(graph, keys):
+    agent.code_letter_prepass(PROMPT, LETTER, graph=graph, cache=False, mappings=keys)
+    (sent,) = graph.texts
+    # The construct with its title readable, and the title split by a comma
+    assert sent.split("\n") == [
+        "If betingelse Er enlig",
+        "Du bor alene.",
+        "Borgers, navn og adresse er ændret.",
+    ]
+
+
+def test_prepass_without_model_work_does_not_call_the_model(graph, keys):
+    coded = agent.code_letter_prepass(
+        PROMPT,
+        "Kære Borgers navn\nSamlet beløb: 100 kr.",
+        graph=graph,
+        cache=False,
+        mappings=keys,
+    )
+    assert coded == (
+        "Kære { MERGEFIELD ab-borger-navn }\n"
+        "{ MERGEFIELD ab-samlet-beloeb }: 100 kr."
+    )
+    assert graph.texts == []
+
+
+def test_prepass_chunked(graph, keys):
+    coded = agent.code_letter_prepass(
+        PROMPT, LETTER, graph=graph, cache=False, mappings=keys, chunked=True
+    )
+    assert coded == agent.code_letter_prepass(
+        PROMPT, LETTER, graph=graph, cache=False, mappings=keys
+    )
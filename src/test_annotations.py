@@ -0,0 +1,114 @@
+import io
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from components.annotations import (
+    FieldAnnotation,
+    LetterAnnotations,
+    annotations_to_docx,
+    apply_annotations,
+    resolve_annotations,
+)
+
+LETTER = "Kære Borgers navn\nDu bor alene.\nHilsen Borgers navn"
+
+
+def mergefield(quote, key, start=-1):
+    return FieldAnnotation(
+        kind="mergefield", quote=quote, key=key, start=start, end=start + len(quote)
+    )
+
+
+def test_annotation_at_its_offsets_is_applied():
+    text, rejected = apply_annotations(
+        LETTER, [mergefield("Borgers navn", "ab-borger-navn", start=5)]
+    )
+    assert text.split("\n")[0] == "Kære { MERGEFIELD ab-borger-navn }"
+    assert text.split("\n")[2] == "Hilsen Borgers navn"
+    assert rejected == []
+
+
+def test_misplaced_quote_is_reanchored_to_the_nearest_occurrence():
+    # Both offsets are off by a few characters; each lands on its own occurrence
+    annotations = LetterAnnotations(
+        annotations=[
+            mergefield("Borgers navn", "ab-borger-navn", start=40),
+            mergefield("Borgers navn", "ab-borger-navn", start=2),
+        ]
+    )
+    accepted, rejected = resolve_annotations(LETTER, annotations)
+    assert [start for start, _, _ in accepted] == [5, LETTER.rindex("Borgers")]
+    assert rejected == []
+
+
+def test_quote_without_offsets_takes_the_first_free_occurrence():
+    accepted, _ = resolve_annotations(
+        LETTER,
+        [mergefield("Borgers navn", "a"), mergefield("Borgers navn", "b")],
+    )
+    assert [(start, a.key) for start, _, a in accepted] == [
+        (5, "a"),
+        (LETTER.rindex("Borgers"), "b"),
+    ]
+
+
+def test_unplaceable_and_incomplete_annotations_are_rejected():
+    missing = mergefield("Borgers adresse", "ab-borger-adresse", start=5)
+    overlapping = mergefield("Kære Borgers", "ab-kaere", start=0)
+    no_key = mergefield("Du bor", "", start=18)
+    if_without_text = FieldAnnotation(kind="if", quote="Du bor alene.", key="k")
+    text, rejected = apply_annotations(
+        LETTER,
+        [
+            mergefield("Borgers navn", "ab-borger-navn", start=5),
+            missing,
+            overlapping,
+            no_key,
+            if_without_text,
+        ],
+    )
+    assert rejected == [missing, overlapping, no_key, if_without_text]
+    assert text.count("MERGEFIELD") == 1
+
+
+def test_if_annotation_becomes_an_if_placeholder():
+    annotation = FieldAnnotation(
+        kind="if",
+        quote="Du bor alene.",
+        start=18,
+        end=31,
+        key="ab-borger-enlig",
+        true_text="Du bor alene.",
+        false_text="",
+    )
+    text, _ = apply_annotations(LETTER, [annotation])
+    assert text.split("\n")[1] == (
+        '{ IF "J" "{ MERGEFIELD ab-borger-enlig }" "Du bor alene." "" }'
+    )
+
+
+def test_annotations_to_docx_builds_real_fields():
+    annotations = [
+        mergefield("Borgers navn", "ab-borger-navn", start=5),
+        FieldAnnotation(
+            kind="if",
+            quote="Du bor alene.",
+            start=18,
+            end=31,
+            key="ab-borger-enlig",
+            true_text="Du bor alene.",
+        ),
+        # Spans two lines, so it cannot become one field
+        mergefield("alene.\nHilsen", "x", start=25),
+    ]
+    data, rejected = annotations_to_docx(LETTER, annotations)
+    assert [a.key for a in rejected] == ["x"]
+    paragraphs = Document(io.BytesIO(data)).paragraphs
+    assert [p.text for p in paragraphs] == ["Kære ", "", "Hilsen Borgers navn"]
+    instructions = [
+        "".join(i.text for i in p._p.iter(qn("w:instrText"))) for p in paragraphs
+    ]
+    assert instructions[0] == " MERGEFIELD ab-borger-navn "
+    assert "MERGEFIELD ab-borger-enlig" in instructions[1]
+    assert instructions[1].lstrip().startswith("IF")
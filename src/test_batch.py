@@ -0,0 +1,80 @@
+import io
+import json
+import os
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+
+from components.batch import collect_inputs, main, run_batch
+
+
+def write_letter(path, *paragraphs) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    doc.save(path)
+    return str(path)
+
+
+def instructions(path) -> list:
+    body = Document(path).element.body
+    return [i.text for i in body.iter(qn("w:instrText"))]
+
+
+@pytest.fixture
+def letters(tmp_path):
+    root = tmp_path / "breve"
+    write_letter(root / "a.docx", "Kære { MERGEFIELD ab-borger-navn }")
+    write_letter(root / "under" / "b.docm", "Samlet beløb: 100 kr.")
+    write_letter(root / "~$a.docx", "Words lock file")
+    (root / "noter.txt").write_text("ikke et brev")
+    return root
+
+
+def test_collect_inputs_walks_directories_and_skips_non_letters(letters):
+    found = collect_inputs([str(letters)])
+    assert sorted(relative for _, relative in found) == [
+        "a.docx",
+        os.path.join("under", "b.docm"),
+    ]
+
+
+def test_collect_inputs_numbers_duplicate_output_names(letters, tmp_path):
+    other = write_letter(tmp_path / "andre" / "a.docx", "x")
+    found = collect_inputs([str(letters / "a.docx"), other, str(letters / "a.docx")])
+    assert [relative for _, relative in found] == ["a.docx", "a-2.docx"]
+
+
+def test_run_batch_converts_placeholders_and_titles(letters, tmp_path, key_list):
+    output = tmp_path / "kodede"
+    summary = run_batch([str(letters)], str(output), key_list, workers=1)
+    assert (summary["total"], summary["converted"], summary["failed"]) == (2, 2, 0)
+    assert summary["fields"] == 2
+    assert instructions(output / "a.docx") == [" MERGEFIELD ab-borger-navn "]
+    assert instructions(output / "under" / "b.docm") == [
+        " MERGEFIELD ab-samlet-beloeb "
+    ]
+
+
+def test_a_broken_letter_is_reported_and_the_rest_converted(letters, tmp_path):
+    (letters / "broken.docx").write_bytes(b"not a docx")
+    output = tmp_path / "kodede"
+    summary = run_batch([str(letters)], str(output), workers=1)
+    assert (summary["converted"], summary["failed"]) == (2, 1)
+    (failed,) = [f for f in summary["files"] if not f["ok"]]
+    assert failed["source"].endswith("broken.docx")
+    assert failed["error"]
+    assert not (output / "broken.docx").exists()
+    # Without a key list only the placeholders are converted
+    assert instructions(output / "under" / "b.docm") == []
+
+
+def test_main_writes_the_summary_and_fails_on_errors(letters, tmp_path):
+    output = tmp_path / "kodede"
+    assert main([str(letters), "-o", str(output), "--workers", "1"]) == 0
+    with open(output / "summary.json", encoding="utf-8") as f:
+        assert json.load(f)["converted"] == 2
+    (letters / "broken.docx").write_bytes(b"not a docx")
+    assert main([str(letters), "-o", str(output), "--workers", "1"]) == 1
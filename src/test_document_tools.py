@@ -0,0 +1,80 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from components import agent
+
+LETTER = "Kære Borgers navn\nEr enlig: ja\nHilsen Borgers navn"
+
+
+class ScriptedLLM(BaseChatModel):
+    """Answers with the next of its messages, ignoring the conversation."""
+
+    script: list
+    seen: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.seen.append(list(messages))
+        message = self.script[len(self.seen) - 1]
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def call(name: str, **args) -> AIMessage:
+    return AIMessage(
+        content="", tool_calls=[{"name": name, "args": args, "id": f"call-{name}"}]
+    )
+
+
+def run(*calls, text=LETTER) -> tuple:
+    llm = ScriptedLLM(script=[*calls, AIMessage(content="Færdig")], seen=[])
+    graph = agent.build_document_graph(llm)
+    coded = agent.code_document("Kod brevet.", text, graph=graph, cache=False)
+    tool_messages = [m for m in llm.seen[-1] if isinstance(m, ToolMessage)]
+    return coded, [m.content for m in tool_messages]
+
+
+def test_titles_are_replaced_in_the_state(mapping_version):
+    coded, (summary,) = run(
+        call(
+            "replace_titles_in_document",
+            handle="brev",
+            replacement_template="{ MERGEFIELD <NØGLE> }",
+        )
+    )
+    assert coded == (
+        "Kære { MERGEFIELD ab-borger-navn }\n"
+        "{ MERGEFIELD ab-borger-enlig }: ja\n"
+        "Hilsen { MERGEFIELD ab-borger-navn }"
+    )
+    # The model gets a count and examples, not the letter
+    assert summary.startswith("Replaced 3 title(s) in 'brev'.")
+    assert "Hilsen" not in summary
+
+
+def test_edits_build_on_each_other():
+    coded, summaries = run(
+        call("search_and_replace_in_document", handle="brev", search="ja", replace="J"),
+        call("search_and_replace_in_document", handle="brev", search="J", replace="N"),
+        call("search_and_replace_in_document", handle="brev", search="x", replace="y"),
+    )
+    assert coded.split("\n")[1] == "Er enlig: N"
+    assert summaries[0] == "Replaced 1 occurrence(s) in 'brev', first at offset 28."
+    assert summaries[2] == "No occurrences in 'brev'."
+
+
+def test_view_document_returns_a_window():
+    _, (view,) = run(call("view_document", handle="brev", start=5, length=12))
+    assert view == f"[5:17 of {len(LETTER)}]\nBorgers navn"
+
+
+def test_unknown_handle_is_reported_to_the_model():
+    coded, (error,) = run(call("view_document", handle="andet"))
+    assert "Unknown document handle 'andet'" in error
+    assert coded == LETTER
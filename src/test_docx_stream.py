@@ -0,0 +1,124 @@
+import io
+import zipfile
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from components.docx_stream import DOCUMENT_PART, convert_docx_stream, convert_package
+
+
+def docx_bytes(*paragraphs, cells=()) -> bytes:
+    # A letter with one paragraph per string and a one-row table of cells
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    if cells:
+        table = doc.add_table(rows=1, cols=len(cells))
+        for cell, text in zip(table.rows[0].cells, cells):
+            cell.text = text
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def convert(data: bytes) -> tuple:
+    output = io.BytesIO()
+    count = convert_package(io.BytesIO(data), output)
+    return count, output.getvalue()
+
+
+def instructions(element) -> list:
+    return [i.text for i in element.iter(qn("w:instrText"))]
+
+
+def test_placeholder_becomes_a_mergefield():
+    count, data = convert(docx_bytes("Kære { MERGEFIELD ab-borger-navn }!"))
+    assert count == 1
+    (paragraph,) = Document(io.BytesIO(data)).paragraphs
+    assert paragraph.text == "Kære !"
+    assert instructions(paragraph._p) == [" MERGEFIELD ab-borger-navn "]
+
+
+def test_if_placeholder_becomes_an_if_field():
+    count, data = convert(
+        docx_bytes('{ IF "J" "{ MERGEFIELD ab-borger-enlig }" "alene" "sammen" }')
+    )
+    assert count >= 1
+    (paragraph,) = Document(io.BytesIO(data)).paragraphs
+    assert "".join(instructions(paragraph._p)).lstrip().startswith("IF")
+    assert paragraph.text == ""
+
+
+def test_paragraphs_in_tables_are_converted():
+    count, data = convert(
+        docx_bytes(
+            "Tabel:", cells=["{ MERGEFIELD ab-a }", "tekst", "{ MERGEFIELD ab-b }"]
+        )
+    )
+    assert count == 2
+    (table,) = Document(io.BytesIO(data)).tables
+    assert instructions(table._tbl) == [" MERGEFIELD ab-a ", " MERGEFIELD ab-b "]
+
+
+def test_blocks_keep_their_order_and_the_section_properties():
+    texts = [
+        f"Afsnit {i} {{ MERGEFIELD ab-{i} }}" if i % 3 == 0 else f"Afsnit {i}"
+        for i in range(300)
+    ]
+    count, data = convert(docx_bytes(*texts))
+    assert count == 100
+    doc = Document(io.BytesIO(data))
+    assert [p.text for p in doc.paragraphs] == [
+        f"Afsnit {i} " if i % 3 == 0 else f"Afsnit {i}" for i in range(300)
+    ]
+    assert doc.element.body[-1].tag == qn("w:sectPr")
+
+
+def test_other_parts_are_copied_unchanged():
+    source = docx_bytes("{ MERGEFIELD ab-borger-navn }")
+    _, data = convert(source)
+    with zipfile.ZipFile(io.BytesIO(source)) as before:
+        with zipfile.ZipFile(io.BytesIO(data)) as after:
+            assert after.namelist() == before.namelist()
+            for name in before.namelist():
+                if name != DOCUMENT_PART:
+                    assert after.read(name) == before.read(name), name
+
+
+def test_convert_docx_stream_replaces_the_file(tmp_path):
+    path = tmp_path / "brev.docx"
+    path.write_bytes(docx_bytes("Kære { MERGEFIELD ab-borger-navn }"))
+    assert convert_docx_stream(str(path)) == (True, "Converted 1 fields")
+    assert Document(str(path)).paragraphs[0].text == "Kære "
+    assert [p.name for p in tmp_path.iterdir()] == ["brev.docx"]
+
+
+def test_convert_docx_stream_reports_errors_and_keeps_the_file(tmp_path):
+    path = tmp_path / "brev.docx"
+    path.write_bytes(b"not a docx")
+    ok, message = convert_docx_stream(str(path))
+    assert not ok
+    assert message.startswith("Error")
+    assert path.read_bytes() == b"not a docx"
+    assert [p.name for p in tmp_path.iterdir()] == ["brev.docx"]
+
+
+def test_elements_after_the_body_are_kept():
+    source = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(docx_bytes("Kære { MERGEFIELD ab-a }"))) as zin:
+        with zipfile.ZipFile(source, "w") as zout:
+            for name in zin.namelist():
+                data = zin.read(name)
+                if name == DOCUMENT_PART:
+                    data = data.replace(
+                        b"</w:body>", b'</w:body><w:trailer w:val="slut"/>'
+                    )
+                zout.writestr(name, data)
+    count, data = convert(source.getvalue())
+    assert count == 1
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        xml = z.read(DOCUMENT_PART)
+    assert xml.endswith(b'</w:body><w:trailer w:val="slut"/></w:document>')
+    assert instructions(Document(io.BytesIO(data)).element.body) == [
+        " MERGEFIELD ab-a "
+    ]
@@ -0,0 +1,85 @@
+from components.field_syntax import MAX_DEPTH, find_fields, match_braces, parse
+from components.fields import Compare, IfField, MergeField
+
+
+def fields(text: str) -> list:
+    return [(start, end, str(field)) for start, end, field, _ in find_fields(text)]
+
+
+def test_mergefield_with_surrounding_text():
+    text = "Kære { MERGEFIELD navn }, du får { MERGEFIELD beloeb \\# 0 } kr."
+    found = find_fields(text)
+    assert [text[start:end] for start, end, _, _ in found] == [
+        "{ MERGEFIELD navn }",
+        "{ MERGEFIELD beloeb \\# 0 }",
+    ]
+    first, second = (field for _, _, field, _ in found)
+    assert isinstance(first, MergeField) and first.key == "navn"
+    assert second.key == "beloeb" and second.switches == "\\# 0"
+
+
+def test_nested_if_field():
+    text = '{ IF "J" = "{ MERGEFIELD ab-borger-enlig }" "dine" "jeres" }'
+    ((start, end, field, group),) = find_fields(text)
+    assert (start, end) == (0, len(text))
+    assert isinstance(field, IfField)
+    assert isinstance(field.condition, Compare)
+    assert field.condition.right.key == "ab-borger-enlig"
+    assert (field.true, field.false) == ("dine", "jeres")
+    assert group.name == "IF"
+    assert str(field) == text
+
+
+def test_placeholder_shorthand_without_operator():
+    text = '{ IF "J" "{ MERGEFIELD ab-borger-enlig }" "dine" "jeres" }'
+    ((_, _, field, _),) = find_fields(text)
+    assert field.condition.op == "="
+    assert field.condition.right.key == "ab-borger-enlig"
+
+
+def test_typographic_and_doubled_single_quotes():
+    for text in (
+        "{ IF “J” = “{ MERGEFIELD enlig }” “dine” “jeres” }",
+        "{ IF ''J'' = ''{ MERGEFIELD enlig }'' ''dine'' ''jeres'' }",
+        "{ IF „J“ = „{ MERGEFIELD enlig }“ „dine“ „jeres“ }",
+    ):
+        ((_, _, field, _),) = find_fields(text)
+        assert field.condition.left == "J"
+        assert field.condition.right.key == "enlig"
+        assert (field.true, field.false) == ("dine", "jeres")
+
+
+def test_quoted_result_with_text_and_field():
+    text = '{ IF { MERGEFIELD enlig } "Hej { MERGEFIELD navn }!" }'
+    ((_, _, field, _),) = find_fields(text)
+    assert field.condition.key == "enlig"
+    prefix, nested, suffix = field.true
+    assert (prefix, nested.key, suffix) == ("Hej ", "navn", "!")
+
+
+def test_field_inside_stray_braces_is_found():
+    text = "{ noget { MERGEFIELD navn } }"
+    assert fields(text) == [(8, 27, "{ MERGEFIELD navn }")]
+
+
+def test_invalid_groups_and_unmatched_braces_are_text():
+    assert fields("{ MERGEFIELD }") == []
+    assert fields("{ MERGEFIELD navn ekstra }") == []
+    assert fields("{ IF }") == []
+    assert fields("Ingen felter { her") == []
+    assert fields("} { MERGEFIELD navn") == []
+    assert fields("Tekst uden klammer") == []
+
+
+def test_match_braces_and_parse():
+    assert match_braces("{a{b}}}{") == {0: 5, 2: 4}
+    groups = parse("x { A } y { B { C } }")
+    assert [(group.name, group.start, group.end) for group in groups] == [
+        ("A", 2, 7),
+        ("B", 10, 21),
+    ]
+
+
+def test_deep_nesting_is_bounded():
+    text = "{" * (MAX_DEPTH * 20) + "}" * (MAX_DEPTH * 20)
+    assert find_fields(text) == []
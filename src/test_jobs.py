@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from components.jobs import CANCELLED, DONE, FAILED, PENDING, JobRunner
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(max_workers=1, max_jobs=3)
+    yield runner
+    runner.shutdown()
+
+
+def wait(job, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while job.status not in (DONE, FAILED, CANCELLED) and time.time() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+
+def blocker(runner):
+    # A job that holds the only worker until the returned event is set
+    release = threading.Event()
+    started = threading.Event()
+
+    def block(job):
+        started.set()
+        release.wait(5)
+
+    job = runner.submit(block, label="blokerer")
+    started.wait(5)
+    return job, release
+
+
+def test_job_records_progress_and_result(runner):
+    def work(job, n):
+        for i in range(n):
+            job.progress("chunk", i + 1, n, f"Afsnit {i + 1}")
+        return n * 2
+
+    job = runner.submit(work, 4, label="kodning")
+    assert wait(job) == DONE
+    assert job.result == 8
+    assert job.label == "kodning"
+    assert [e["done"] for e in job.events] == [1, 2, 3, 4]
+    assert job.latest["message"] == "Afsnit 4"
+    assert job.fraction() == 1.0
+    assert runner.get(job.id) is job
+
+
+def test_failing_job_keeps_the_error(runner):
+    def fail(job):
+        raise ValueError("ingen nøgleliste")
+
+    job = runner.submit(fail)
+    assert wait(job) == FAILED
+    assert job.error == "ValueError: ingen nøgleliste"
+    assert job.result is None
+
+
+def test_cancelled_pending_job_never_runs(runner):
+    first, release = blocker(runner)
+    ran = []
+    queued = runner.submit(lambda job: ran.append(job.id))
+    assert queued.status == PENDING
+    assert runner.cancel(queued.id)
+    release.set()
+    assert wait(first) == DONE
+    assert wait(queued) == CANCELLED
+    assert ran == []
+    assert not runner.cancel(queued.id)
+
+
+def test_running_job_stops_at_its_next_progress_call(runner):
+    started = threading.Event()
+
+    def work(job):
+        started.set()
+        for i in range(500):
+            job.progress("chunk", i, 500)
+            time.sleep(0.01)
+        return "færdig"
+
+    job = runner.submit(work)
+    started.wait(5)
+    assert runner.cancel(job.id)
+    assert wait(job) == CANCELLED
+    assert job.result is None
+    assert len(job.events) < 500
+
+
+def test_oldest_finished_jobs_are_forgotten(runner):
+    jobs = [runner.submit(lambda job, i=i: i) for i in range(5)]
+    for job in jobs:
+        wait(job)
+    runner.submit(lambda job: None)
+    kept = runner.jobs()
+    assert len(kept) == 3
+    assert runner.get(jobs[0].id) is None
+    assert kept[-2] is jobs[-1]
+
+
+def test_finished_jobs_leave_no_futures_behind():
+    runner = JobRunner(max_workers=4, max_jobs=500)
+    try:
+        jobs = [runner.submit(lambda job: None) for _ in range(200)]
+        for job in jobs:
+            assert wait(job) == DONE
+    finally:
+        runner.shutdown()
+    assert runner._futures == {}
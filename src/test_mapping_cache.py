@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from components import mapping_cache
+from components.mapping_cache import load_compiled_mapping
+
+
+def index_file(cache_dir) -> str:
+    (name,) = os.listdir(cache_dir)
+    return os.path.join(cache_dir, name)
+
+
+def test_index_is_built_once(key_list, keys, monkeypatch):
+    assert load_compiled_mapping(key_list).as_dict() == keys
+
+    def read_again(path):
+        raise AssertionError("the key list was parsed again")
+
+    monkeypatch.setattr(mapping_cache, "read_mapping_source", read_again)
+    assert load_compiled_mapping(key_list).as_dict() == keys
+
+
+def test_changed_key_list_rebuilds_the_index(key_list, keys, write_keys):
+    load_compiled_mapping(key_list)
+    changed = dict(keys, **{"Ny titel": "ab-ny"})
+    write_keys(key_list, changed)
+    assert load_compiled_mapping(key_list).as_dict() == changed
+
+
+@pytest.mark.parametrize("keep", [0, 10, mapping_cache._HEADER.size, -3, -40])
+def test_truncated_index_is_rebuilt(key_list, keys, cache_dir, keep):
+    load_compiled_mapping(key_list)
+    path = index_file(cache_dir)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:keep])
+    assert load_compiled_mapping(key_list).as_dict() == keys
+    assert os.path.getsize(path) == len(data)
+
+
+def test_corrupt_section_layout_is_a_miss(key_list, keys, cache_dir):
+    load_compiled_mapping(key_list)
+    path = index_file(cache_dir)
+    with open(path, "rb") as f:
+        header = bytearray(f.read(mapping_cache._HEADER.size))
+    fields = list(mapping_cache._HEADER.unpack(header))
+    # title_offsets one byte longer: no longer a whole number of int32s
+    fields[8] += 1
+    with open(path, "r+b") as f:
+        f.write(mapping_cache._HEADER.pack(*fields))
+    stat = os.stat(key_list)
+    assert mapping_cache._open_index(path, key_list, stat) is None
+    assert load_compiled_mapping(key_list).as_dict() == keys
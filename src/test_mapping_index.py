@@ -0,0 +1,85 @@
+import pytest
+
+from components.mapping_index import MappingIndex, edit_distance, get_mapping_index
+
+MAPPINGS = {
+    "Er enlig": "ab-borger-enlig",
+    "Har børn under 18 år": "ab-borger-har-boern",
+    "Modtager boligstøtte": "ab-boligstoette",
+    "Ubegrænset fuldmagt": "ab-ubegraenset-fuldmagt",
+    "Html enlig": "Html:ab-borger-enlig",
+    "Html børn": "Html:x-borger-har-boern-tekst",
+}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return MappingIndex(MAPPINGS)
+
+
+@pytest.mark.parametrize(
+    "a, b, distance",
+    [("", "", 0), ("enlig", "enlig", 0), ("enlig", "enliig", 1), ("abc", "cba", 2)],
+)
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 5) == distance
+
+
+def test_edit_distance_stops_at_the_limit():
+    assert edit_distance("kort", "en meget længere tekst", 3) == 4
+    assert edit_distance("abcdefgh", "hgfedcba", 2) == 3
+
+
+def test_exact_title_resolves_with_its_companion(index):
+    assert index.resolve("Er enlig") == (
+        "ab-borger-enlig",
+        "Html:ab-borger-enlig",
+        1.0,
+    )
+    # The first Html key containing the key's suffix
+    assert index.resolve("Har børn under 18 år") == (
+        "ab-borger-har-boern",
+        "Html:x-borger-har-boern-tekst",
+        1.0,
+    )
+    assert index.resolve("Ubegrænset fuldmagt") == (
+        "ab-ubegraenset-fuldmagt",
+        "Html:x-fuldmagtsbetingelse",
+        1.0,
+    )
+    assert index.resolve("Modtager boligstøtte") == ("ab-boligstoette", None, 1.0)
+
+
+@pytest.mark.parametrize(
+    "written",
+    [
+        "Er enlig ",
+        "er ENLIG",
+        "Har børn under 18 år.",
+        "Har børn undr 18 år",
+        "Modtager boligstotte",
+    ],
+)
+def test_titles_written_slightly_differently_resolve(index, written):
+    titel, confidence = index.match_title(written)
+    assert titel in MAPPINGS
+    assert 0.85 <= confidence <= 1.0
+    assert index.resolve(written)[::2] == (MAPPINGS[titel], confidence)
+
+
+def test_normalized_match_is_certain(index):
+    assert index.match_title("  er   Enlig ") == ("Er enlig", 1.0)
+
+
+@pytest.mark.parametrize("written", ["Er gift", "Har katte", "", "Modtager"])
+def test_distant_titles_do_not_resolve(index, written):
+    assert index.match_title(written) == (None, 0.0)
+    assert index.resolve(written) == (None, None, 0.0)
+
+
+def test_fuzzy_matching_can_be_turned_off(index):
+    assert index.resolve("er ENLIG", fuzzy=False) == (None, None, 0.0)
+
+
+def test_index_is_shared_per_mapping_content():
+    assert get_mapping_index(MAPPINGS) is get_mapping_index(dict(MAPPINGS))
@@ -0,0 +1,92 @@
+import os
+
+from components.mapping_registry import (
+    MappingRegistry,
+    MappingVersion,
+    pinned_version,
+    use_version,
+)
+
+
+def touch_later(path):
+    # A different mtime even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_first_load(key_list, cache_dir, keys):
+    registry = MappingRegistry(key_list, cache_dir)
+    version = registry.current()
+    assert version.number == 1
+    assert version.mappings == keys
+    assert version.matcher.sub("X", "Kære Borgers navn") == "Kære X"
+    assert registry.current() is version
+
+
+def test_reload_publishes_a_changed_file(key_list, cache_dir, keys, write_keys):
+    registry = MappingRegistry(key_list, cache_dir)
+    first = registry.current()
+    published = []
+    registry.subscribe(published.append)
+
+    assert registry.reload() is False
+    write_keys(key_list, {**keys, "Ny titel": "ab-ny"})
+    touch_later(key_list)
+    assert registry.reload() is True
+    second = registry.current()
+    assert published == [second]
+    assert second.number == 2
+    assert second.mappings["Ny titel"] == "ab-ny"
+    assert second.version != first.version
+    # A version already handed out is never changed
+    assert "Ny titel" not in first.mappings
+
+
+def test_reload_ignores_a_touched_file_with_the_same_content(key_list, cache_dir):
+    registry = MappingRegistry(key_list, cache_dir)
+    first = registry.current()
+    touch_later(key_list)
+    assert registry.reload() is False
+    assert registry.current() is first
+
+
+def test_reload_keeps_the_version_while_the_file_is_missing(
+    key_list, cache_dir, keys, write_keys
+):
+    registry = MappingRegistry(key_list, cache_dir)
+    first = registry.current()
+    os.remove(key_list)
+    assert registry.reload() is False
+    assert registry.current() is first
+    write_keys(key_list, keys)
+    assert registry.reload() is False
+    assert registry.current() is first
+
+
+def test_reload_keeps_the_version_on_an_unparsable_file(key_list, cache_dir):
+    registry = MappingRegistry(key_list, cache_dir)
+    first = registry.current()
+    with open(key_list, "wb") as f:
+        f.write(b"\x00\xff not a key list")
+    touch_later(key_list)
+    assert registry.reload() is False
+    assert registry.current() is first
+
+
+def test_missing_file_on_first_load_gives_an_empty_mapping(
+    tmp_path, cache_dir, keys, write_keys
+):
+    path = str(tmp_path / "missing.csv")
+    registry = MappingRegistry(path, cache_dir)
+    assert len(registry.current()) == 0
+    write_keys(path, keys)
+    assert registry.reload() is True
+    assert registry.current().mappings == keys
+
+
+def test_use_version_pins_for_the_block(key_list):
+    version = MappingVersion(key_list, 1)
+    assert pinned_version() is None
+    with use_version(version):
+        assert pinned_version() is version
+    assert pinned_version() is None
@@ -0,0 +1,72 @@
+import random
+
+from components.matcher import TitleMatcher, compile_matcher, mapping_fingerprint
+
+
+def brute_force(mappings: dict, text: str) -> list:
+    # Leftmost match first, the longest among those, then continue after it
+    found = []
+    pos = 0
+    while pos < len(text):
+        best = None
+        for start in range(pos, len(text)):
+            for titel in mappings:
+                end = start + len(titel)
+                if text.startswith(titel, start) and (best is None or end > best[1]):
+                    best = (start, end, titel, mappings[titel])
+            if best is not None:
+                break
+        if best is None:
+            break
+        found.append(best)
+        pos = best[1]
+    return found
+
+
+def test_matches_brute_force_on_random_text():
+    rng = random.Random(0)
+    for _ in range(200):
+        titles = {
+            "".join(rng.choice("ab ") for _ in range(rng.randint(1, 5))): f"k{i}"
+            for i in range(rng.randint(1, 8))
+        }
+        text = "".join(rng.choice("abc ") for _ in range(rng.randint(0, 40)))
+        matcher = TitleMatcher.from_mapping(titles)
+        assert list(matcher.finditer(text)) == brute_force(titles, text), (
+            titles,
+            text,
+        )
+
+
+def test_longest_title_wins_at_the_same_start():
+    mappings = {"Borgers navn": "navn", "Borgers navn og adresse": "begge"}
+    matcher = TitleMatcher.from_mapping(mappings)
+    text = "Kære Borgers navn og adresse, Borgers navn"
+    assert [m[3] for m in matcher.finditer(text)] == ["begge", "navn"]
+
+
+def test_sub_replaces_every_match():
+    matcher = TitleMatcher.from_mapping({"Er enlig": "enlig", "Samlet beløb": "sum"})
+    text = "Er enlig: ja. Samlet beløb: 100"
+    assert (
+        matcher.sub(lambda titel, nøgle: f"{{ MERGEFIELD {nøgle} }}", text)
+        == "{ MERGEFIELD enlig }: ja. { MERGEFIELD sum }: 100"
+    )
+    assert matcher.sub("X", "ingen titler") == "ingen titler"
+
+
+def test_empty_and_nan_titles_are_skipped():
+    matcher = TitleMatcher.from_mapping({"": "tom", float("nan"): "nan", "a": "k"})
+    assert [m[2] for m in matcher.finditer("a b a")] == ["a", "a"]
+
+
+def test_compile_matcher_is_cached_by_content():
+    mappings = {"Borgers navn": "navn"}
+    assert compile_matcher(mappings) is compile_matcher(dict(mappings))
+    assert mapping_fingerprint(mappings) != mapping_fingerprint({"Borgers navn": "x"})
+
+
+def test_a_known_fingerprint_finds_the_cached_matcher():
+    mappings = {"Borgers adresse": "adresse"}
+    fingerprint = mapping_fingerprint(mappings)
+    assert compile_matcher(mappings, fingerprint) is compile_matcher(dict(mappings))
@@ -20,9 +20,9 @@ try:
 
     # Try to convert the text to actual mergefields
     print("Attempting to convert text to mergefields...")
-    success, debug_info = convert_text_to_mergefields(test_file, test_file)
+    success, report = convert_text_to_mergefields(test_file, test_file, verbosity=2)
     print(f"Success: {success}")
-    print(f"Debug info: {debug_info}")
+    print(f"Report:\n{report}")
 
 except Exception as e:
     print(f"ERROR: {str(e)}")
@@ -0,0 +1,101 @@
+import io
+import zipfile
+
+from docx import Document
+
+from components.paragraph_cache import CachedParagraph, ParagraphCache
+from components.tools import convert_text_to_mergefields_bytes
+
+PARAGRAPHS = [
+    "Kære { MERGEFIELD ab-borger-navn }",
+    "{ MERGEFIELD ab-a } og { MERGEFIELD ab-b }",
+    "Med venlig hilsen",
+]
+
+
+def docx_bytes(*paragraphs) -> bytes:
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def document_xml(data: bytes) -> bytes:
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return z.read("word/document.xml")
+
+
+def test_key_covers_source_converter_and_version():
+    key = ParagraphCache.key(b"<w:p/>", "mergefields", "v1")
+    assert key == ParagraphCache.key(b"<w:p/>", "mergefields", "v1")
+    assert key != ParagraphCache.key(b"<w:p />", "mergefields", "v1")
+    assert key != ParagraphCache.key(b"<w:p/>", "template", "v1")
+    assert key != ParagraphCache.key(b"<w:p/>", "mergefields", "v2")
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ParagraphCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, CachedParagraph(b"<w:p/>"))
+        if key == "b":
+            assert cache.get("a") is not None
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_are_evicted_by_size():
+    cache = ParagraphCache(max_bytes=1000)
+    cache.put("a", CachedParagraph(b"x" * 600))
+    cache.put("b", CachedParagraph(b"x" * 600))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+def test_repeat_conversion_is_served_from_the_cache():
+    cache = ParagraphCache()
+    source = docx_bytes(*PARAGRAPHS)
+    ok, first, converted = convert_text_to_mergefields_bytes(
+        source, verbosity=1, paragraph_cache=cache
+    )
+    assert ok
+    assert first.cached_paragraphs == 0
+    ok, second, again = convert_text_to_mergefields_bytes(
+        source, verbosity=1, paragraph_cache=cache
+    )
+    assert second.cached_paragraphs == len(cache)
+    assert document_xml(again) == document_xml(converted)
+    # The counts and events are replayed from the cache
+    assert second.counts == first.counts == {"mergefield": 3}
+    assert second.events == first.events
+
+
+def test_a_changed_paragraph_misses():
+    cache = ParagraphCache()
+    convert_text_to_mergefields_bytes(docx_bytes(*PARAGRAPHS), paragraph_cache=cache)
+    cached = len(cache)
+    edited = ["Kære { MERGEFIELD ab-borger-adresse }", *PARAGRAPHS[1:]]
+    ok, report, data = convert_text_to_mergefields_bytes(
+        docx_bytes(*edited), paragraph_cache=cache
+    )
+    assert report.cached_paragraphs == cached - 1
+    assert len(cache) == cached + 1
+    assert b" MERGEFIELD ab-borger-adresse " in document_xml(data)
+
+
+def test_cache_can_be_bypassed():
+    source = docx_bytes(*PARAGRAPHS)
+    ok, report, _ = convert_text_to_mergefields_bytes(source, paragraph_cache=False)
+    assert ok
+    assert report.cached_paragraphs == 0
+    assert report.counts == {"mergefield": 3}
+
+
+def test_paragraphs_with_nothing_to_convert_skip_the_cache():
+    cache = ParagraphCache()
+    ok, report, _ = convert_text_to_mergefields_bytes(
+        docx_bytes("Med venlig hilsen", ""), paragraph_cache=cache
+    )
+    assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
@@ -0,0 +1,72 @@
+from components.prepass import prepare_letter
+
+KEYS = {"Borgers navn": "navn", "Borgers adresse": "adresse", "Er enlig": "enlig"}
+
+
+def test_known_titles_become_sentinels():
+    prepared = prepare_letter("Kære Borgers navn\nSvar om Er enlig", KEYS)
+    assert prepared.paragraphs == ["Kære ⟦0⟧", "Svar om ⟦1⟧"]
+    assert prepared.protected == ["{ MERGEFIELD navn }", "{ MERGEFIELD enlig }"]
+    assert prepared.needs_model == []
+
+
+def test_construct_lines_are_sent_without_sentinels():
+    prepared = prepare_letter("Kære Borgers navn\nIf betingelse Er enlig", KEYS)
+    assert prepared.paragraphs == ["Kære ⟦0⟧", "If betingelse Er enlig"]
+    assert prepared.model_text() == "If betingelse Er enlig"
+
+
+def test_rejected_construct_line_falls_back_to_local_coding():
+    prepared = prepare_letter("If betingelse Er enlig", KEYS)
+    # One line sent, two answered, and no sentinel to anchor them
+    assert prepared.merge("a\nb") == "If betingelse { MERGEFIELD enlig }"
+    assert prepared.rejected == [0]
+
+
+def test_candidate_phrases_need_the_model():
+    prepared = prepare_letter("Hej\nBorgers, navn er ændret.\nBorgers navn", KEYS)
+    assert prepared.needs_model == [1]
+
+
+def test_merge_checks_sentinels_line_by_line():
+    text = "Kære Borgers navn og Borgers, adresse\nBorgers, navn"
+    prepared = prepare_letter(text, KEYS)
+    assert prepared.needs_model == [0, 1]
+    first, second = prepared.model_text().split("\n")
+    coded = prepared.merge(f"{first} X\nsentinel dropped ⟦0⟧")
+    assert coded == "Kære { MERGEFIELD navn } og Borgers, adresse X\nBorgers, navn"
+    assert prepared.rejected == [1]
+
+
+def test_merge_aligns_by_sentinels_when_line_counts_differ():
+    text = "A Borgers navn, Borgers, navn\nB\nC Borgers adresse, Borgers, adresse"
+    prepared = prepare_letter(text, KEYS)
+    assert prepared.needs_model == [0, 2]
+    a, c = prepared.model_text().split("\n")
+    # The sentinels tell which paragraph each line belongs to
+    coded = prepared.merge("\n".join([a + " 1", "ekstra linje", c + " 3"]))
+    assert coded.split("\n") == [
+        "A { MERGEFIELD navn }, Borgers, navn 1",
+        "B",
+        "C { MERGEFIELD adresse }, Borgers, adresse 3",
+    ]
+    assert prepared.rejected == []
+
+
+def test_merge_rejects_unanchored_lines_that_do_not_line_up():
+    text = "A Borgers navn, Borgers, navn\nB Borgers, adresse\nC Borgers, navn"
+    prepared = prepare_letter(text, KEYS)
+    a, b, c = prepared.model_text().split("\n")
+    coded = prepared.merge("\n".join([a + " 1", b + " 2"]))
+    assert coded.split("\n") == [
+        "A { MERGEFIELD navn }, Borgers, navn 1",
+        "B Borgers, adresse",
+        "C Borgers, navn",
+    ]
+    assert prepared.rejected == [1, 2]
+
+
+def test_merge_without_an_answer_keeps_the_local_coding():
+    prepared = prepare_letter("Kære Borgers navn", KEYS)
+    assert prepared.needs_model == []
+    assert prepared.merge() == "Kære { MERGEFIELD navn }"
@@ -0,0 +1,47 @@
+from components.report import FIELDS, PARAGRAPHS, SUMMARY, ConversionReport
+
+
+def record(report, n, kind="mergefield"):
+    for i in range(n):
+        report.event(FIELDS, kind, i, f"ab-{i}")
+
+
+def test_events_above_the_verbosity_are_skipped():
+    report = ConversionReport(verbosity=SUMMARY)
+    record(report, 3)
+    report.event(PARAGRAPHS, "paragraph", 0)
+    assert report.events == []
+    assert report.recorded_events == 0
+
+
+def test_first_and_last_events_are_kept():
+    report = ConversionReport(verbosity=FIELDS, max_events=10)
+    record(report, 100)
+    kept = [paragraph for _, _, paragraph, _ in report.events]
+    assert kept == [*range(5), *range(95, 100)]
+    assert (report.recorded_events, report.dropped_events) == (100, 90)
+    assert report.as_dict()["event_counts"] == {"mergefield": 100}
+
+
+def test_events_by_kind_are_counted_beyond_the_kept_ones():
+    report = ConversionReport(verbosity=PARAGRAPHS, max_events=4)
+    record(report, 6)
+    record(report, 2, kind="paragraph")
+    assert report.event_counts == {"mergefield": 6, "paragraph": 2}
+    text = str(report)
+    assert "... 4 more events" in text
+    assert text.index("paragraph 2: mergefield") < text.index("... 4 more events")
+    assert text.endswith("8 events (mergefield: 6, paragraph: 2)")
+
+
+def test_events_since_a_mark():
+    report = ConversionReport(verbosity=FIELDS, max_events=6)
+    record(report, 2)
+    mark = report.recorded_events
+    record(report, 2, kind="if")
+    assert [kind for _, kind, _, _ in report.events_since(mark)] == ["if", "if"]
+    # Once the tail wraps only the events still kept are returned
+    record(report, 10)
+    mark = report.recorded_events - 2
+    assert report.events_since(mark) == report.events[-2:]
+    assert report.events_since(report.recorded_events) == []
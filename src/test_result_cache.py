@@ -0,0 +1,72 @@
+import itertools
+import types
+
+import pytest
+
+from components import result_cache
+from components.result_cache import ResultCache, result_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # A clock that moves one second per reading, so every write is ordered
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(
+        result_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks)))
+    )
+
+
+def test_key_ignores_whitespace_edits():
+    key = result_key("Kod  brevet.\n", "Kære X\r\nHilsen  \n", "fp")
+    assert key == result_key(" Kod brevet.", "Kære X\nHilsen", "fp")
+
+
+def test_key_depends_on_prompt_text_and_mapping():
+    key = result_key("Kod", "Kære X", "fp")
+    assert key != result_key("Kod ikke", "Kære X", "fp")
+    assert key != result_key("Kod", "Kære Y", "fp")
+    assert key != result_key("Kod", "Kære X", "other")
+    # Parts are length-prefixed, so moving text between them changes the key
+    assert result_key("ab", "c", "") != result_key("a", "bc", "")
+
+
+def test_key_depends_on_mode_and_agent():
+    key = result_key("Kod", "Kære X", "fp")
+    assert key != result_key("Kod", "Kære X", "fp", agent="v1|gpt-4o")
+    assert result_key("Kod", "Kære X", "fp", agent="v1|gpt-4o") != result_key(
+        "Kod", "Kære X", "fp", agent="v1|gpt-4.1"
+    )
+    assert result_key("Kod", "Kære X", "fp", mode="x") != result_key(
+        "Kod", "Kære X", "fp", agent="x"
+    )
+
+
+def test_get_and_put(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    assert cache.get("k") is None
+    cache.put("k", "kodet")
+    assert cache.get("k") == "kodet"
+    assert len(cache) == 1
+    # Another handle on the same file sees the entry
+    assert ResultCache(cache.path).get("k") == "kodet"
+    cache.clear()
+    assert cache.get("k") is None
+
+
+def test_expired_entries_are_misses(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), ttl_seconds=5)
+    cache.put("k", "kodet")
+    assert cache.get("k") == "kodet"
+    result_cache.time.time = lambda: 2_000_000.0
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
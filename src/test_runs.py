@@ -0,0 +1,98 @@
+from copy import deepcopy
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from components.runs import BARRIER, ParagraphText
+
+
+def paragraph(*runs):
+    # A paragraph with one run per (text, bold) pair
+    p = Document().add_paragraph()
+    for text, bold in runs:
+        p.add_run(text).bold = bold or None
+    return p
+
+
+def field(key):
+    # Builds a MERGEFIELD-like run with the formatting it is given
+    def build(rPr):
+        r = OxmlElement("w:r")
+        if rPr is not None:
+            r.append(deepcopy(rPr))
+        instr = OxmlElement("w:instrText")
+        instr.text = f" MERGEFIELD {key} "
+        r.append(instr)
+        return [r]
+
+    return build
+
+
+def run_texts(p) -> list:
+    # (text, bold, instruction) of every run after the rewrite
+    result = []
+    for r in p._p.iter(qn("w:r")):
+        instr = "".join(i.text for i in r.iter(qn("w:instrText")))
+        text = "".join(t.text for t in r.iter(qn("w:t")))
+        bold = r.find(f"{qn('w:rPr')}/{qn('w:b')}") is not None
+        result.append((text, bold, instr))
+    return result
+
+
+def test_text_spans_runs():
+    p = paragraph(("Kære Bor", False), ("gers na", True), ("vn!", False))
+    text = ParagraphText(p._p)
+    assert text.text == "Kære Borgers navn!"
+
+
+def test_rewrite_span_over_several_runs_keeps_formatting_around_it():
+    p = paragraph(("Kære Bor", False), ("gers na", True), ("vn!", False))
+    text = ParagraphText(p._p)
+    start = text.text.index("Borgers")
+    assert text.rewrite([(start, start + len("Borgers navn"), field("navn"))]) == 1
+    assert run_texts(p) == [
+        ("Kære ", False, ""),
+        ("", False, " MERGEFIELD navn "),
+        ("!", False, ""),
+    ]
+    assert p.text == "Kære !"
+
+
+def test_rewrite_copies_the_formatting_of_the_starting_run():
+    p = paragraph(("Hej ", False), ("Borgers navn", True), (" og farvel", False))
+    text = ParagraphText(p._p)
+    text.rewrite([(4, 16, field("navn"))])
+    assert run_texts(p)[1] == ("", True, " MERGEFIELD navn ")
+
+
+def test_rewrite_several_spans_in_one_run():
+    p = paragraph(("a X b Y c", False))
+    text = ParagraphText(p._p)
+    assert text.rewrite([(2, 3, field("x")), (6, 7, field("y"))]) == 2
+    assert [(t, i) for t, _, i in run_texts(p)] == [
+        ("a ", ""),
+        ("", " MERGEFIELD x "),
+        (" b ", ""),
+        ("", " MERGEFIELD y "),
+        (" c", ""),
+    ]
+
+
+def test_rewrite_skips_spans_over_non_text_content():
+    p = paragraph(("før ", False), ("efter", False))
+    p.runs[0]._r.append(p.runs[0]._r.makeelement(qn("w:drawing"), {}))
+    text = ParagraphText(p._p)
+    assert text.text == "før " + BARRIER + "efter"
+    assert text.rewrite([(0, len(text.text), field("x"))]) == 0
+    assert p._p.find(".//" + qn("w:drawing")) is not None
+
+
+def test_tabs_and_breaks_are_text():
+    p = Document().add_paragraph()
+    p.add_run("a\tb\nc")
+    text = ParagraphText(p._p)
+    assert text.text == "a\tb\nc"
+    text.rewrite([(2, 3, field("b"))])
+    assert p._p.find(".//" + qn("w:tab")) is not None
+    assert p._p.find(".//" + qn("w:br")) is not None
@@ -0,0 +1,244 @@
+import http.client
+import io
+import json
+import threading
+import time
+
+import pytest
+from docx import Document
+
+from components.server import ConversionService, HTTPError, make_server
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory, keys, write_keys):
+    root = tmp_path_factory.mktemp("server")
+    service = ConversionService(
+        mapping_path=write_keys(root / "keys.csv", keys),
+        workers=1,
+        max_concurrent=2,
+        max_bytes=100_000,
+        timeout=60,
+        cache_dir=str(root / "cache"),
+        stub_llm=True,
+    )
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+@pytest.fixture
+def service(server):
+    return server.service
+
+
+@pytest.fixture
+def connect(server):
+    host, port = server.server_address[:2]
+    return lambda: http.client.HTTPConnection(host, port, timeout=30)
+
+
+@pytest.fixture
+def client(connect):
+    def request(method, path, body=None):
+        conn = connect()
+        try:
+            if isinstance(body, dict):
+                body = json.dumps(body).encode("utf-8")
+            conn.request(method, path, body=body)
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    return request
+
+
+def occupy(service, seconds: float, count: int = 1) -> list:
+    # Busy the pool with requests that sleep, each in its own thread
+    def sleep():
+        try:
+            service.run(time.sleep, seconds)
+        except HTTPError:
+            # Timed out itself; the task keeps its slot all the same
+            pass
+
+    threads = [threading.Thread(target=sleep) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while service.in_flight < count and time.time() < deadline:
+        time.sleep(0.01)
+    return threads
+
+
+def wait_idle(service) -> int:
+    # Slots are released by a callback that may run just after run() returns
+    deadline = time.time() + 5
+    while service.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    return service.in_flight
+
+
+def test_health(client, keys):
+    response, body = client("GET", "/health")
+    assert response.status == 200
+    health = json.loads(body)
+    assert health["status"] == "ok"
+    assert health["titles"] == len(keys)
+    assert health["warm_workers"] == 1
+    assert health["stub_llm"] is True
+
+
+def test_replace_titles(client):
+    response, body = client(
+        "POST",
+        "/replace-titles",
+        {"text": "Kære Borgers navn", "template": "{ MERGEFIELD <NØGLE> }"},
+    )
+    assert response.status == 200
+    result = json.loads(body)
+    assert result["text"] == "Kære { MERGEFIELD ab-borger-navn }"
+    assert result["replaced"] == 1
+    assert result["mapping_version"]
+
+
+def test_convert(client):
+    doc = Document()
+    doc.add_paragraph("Kære { MERGEFIELD ab-borger-navn }")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    response, body = client("POST", "/convert", buffer.getvalue())
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith(
+        "application/vnd.openxmlformats"
+    )
+    report = json.loads(response.getheader("X-Conversion-Report"))
+    assert report["counts"] == {"mergefield": 1}
+    converted = Document(io.BytesIO(body))
+    assert converted.paragraphs[0].text == "Kære "
+
+
+def test_code_with_the_stub_model(client):
+    text = "Kære Borgers navn\nBorgers, adresse er ændret."
+    response, body = client("POST", "/code", {"prompt": "Kod", "text": text})
+    assert response.status == 200
+    result = json.loads(body)
+    assert result["text"] == (
+        "Kære { MERGEFIELD ab-borger-navn }\nBorgers, adresse er ændret."
+    )
+    assert result["mapping_version"]
+
+
+@pytest.mark.parametrize(
+    "path, body, status",
+    [
+        ("/nowhere", b"{}", 404),
+        ("/replace-titles", b"not json", 400),
+        ("/replace-titles", b'{"text": "x"}', 400),
+        ("/code", b'{"prompt": "p", "text": "t", "mode": "other"}', 400),
+        ("/convert", b"", 400),
+        ("/convert", b"not a docx", 422),
+    ],
+)
+def test_bad_requests(client, path, body, status):
+    response, body = client("POST", path, body)
+    assert response.status == status
+    assert json.loads(body)["error"]
+
+
+@pytest.mark.parametrize(
+    "path, body, status",
+    [("/nowhere", b'{"a": 1}', 404), ("/replace-titles", b"not json", 400)],
+)
+def test_error_answer_keeps_the_connection_usable(connect, path, body, status):
+    conn = connect()
+    try:
+        conn.request("POST", path, body=body)
+        response = conn.getresponse()
+        assert response.status == status
+        response.read()
+        # The body was consumed, so the next request on the connection is parsed
+        # from its own start
+        conn.request("GET", "/health")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["status"] == "ok"
+    finally:
+        conn.close()
+
+
+def test_invalid_content_length_closes_the_connection(connect):
+    conn = connect()
+    try:
+        conn.putrequest("POST", "/nowhere")
+        conn.putheader("Content-Length", "-1")
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 400
+        assert response.getheader("Connection") == "close"
+    finally:
+        conn.close()
+
+
+def test_body_too_large_is_refused_unread(service, connect):
+    conn = connect()
+    try:
+        # Only the headers are sent: the server must answer from the length
+        conn.putrequest("POST", "/convert")
+        conn.putheader("Content-Length", str(service.max_bytes + 1))
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 413
+        assert response.getheader("Connection") == "close"
+        assert "exceeds" in json.loads(response.read())["error"]
+    finally:
+        conn.close()
+
+
+def test_busy_service_answers_503(service, client):
+    threads = occupy(service, 1.0, count=service.max_concurrent)
+    response, body = client(
+        "POST", "/replace-titles", {"text": "x", "template": "<NØGLE>"}
+    )
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "1"
+    for thread in threads:
+        thread.join()
+    assert wait_idle(service) == 0
+
+
+def test_timeout_answers_504_and_keeps_the_slot(service, client):
+    # The only worker is busy, so the request waits in the queue until it
+    # times out; the slot stays taken until that task has run
+    threads = occupy(service, 1.5)
+    timeout = service.timeout
+    service.timeout = 0.3
+    try:
+        response, body = client(
+            "POST", "/replace-titles", {"text": "x", "template": "<NØGLE>"}
+        )
+    finally:
+        service.timeout = timeout
+    assert response.status == 504
+    assert service.in_flight >= 1
+    for thread in threads:
+        thread.join()
+    assert wait_idle(service) == 0
+
+
+def test_run_raises_on_timeout(service):
+    timeout = service.timeout
+    service.timeout = 0.1
+    try:
+        with pytest.raises(HTTPError) as raised:
+            service.run(time.sleep, 0.5)
+    finally:
+        service.timeout = timeout
+    assert raised.value.status == 504
+    # The task is still running and holds its slot until it ends
+    assert service.in_flight == 1
+    assert wait_idle(service) == 0
@@ -0,0 +1,139 @@
+import io
+import zipfile
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+from components.stories import Stories, is_story_part, story_paragraphs
+from components.tools import convert_text_to_mergefields_bytes
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+FOOTNOTES_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+)
+FOOTNOTES_REL = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes"
+)
+
+
+def add_footnotes(docx: bytes, text: str) -> bytes:
+    # python-docx cannot create footnotes; add the part to the package directly
+    source = zipfile.ZipFile(io.BytesIO(docx))
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == "[Content_Types].xml":
+                data = data.replace(
+                    b"</Types>",
+                    f'<Override PartName="/word/footnotes.xml" '
+                    f'ContentType="{FOOTNOTES_TYPE}"/></Types>'.encode(),
+                )
+            elif item.filename == "word/_rels/document.xml.rels":
+                data = data.replace(
+                    b"</Relationships>",
+                    f'<Relationship Id="rId99" Type="{FOOTNOTES_REL}" '
+                    f'Target="footnotes.xml"/></Relationships>'.encode(),
+                )
+            target.writestr(item, data)
+        target.writestr(
+            "word/footnotes.xml",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<w:footnotes {W}><w:footnote w:id="1"><w:p><w:r>'
+            f'<w:t xml:space="preserve">{text}</w:t>'
+            f"</w:r></w:p></w:footnote></w:footnotes>",
+        )
+    return out.getvalue()
+
+
+@pytest.fixture
+def package() -> bytes:
+    doc = Document()
+    doc.add_paragraph("Krop { MERGEFIELD krop }")
+    doc.add_table(rows=1, cols=1).cell(0, 0).text = "Celle { MERGEFIELD celle }"
+    section = doc.sections[0]
+    section.header.paragraphs[0].text = "Hoved { MERGEFIELD hoved }"
+    section.footer.paragraphs[0].text = "Fod { MERGEFIELD fod }"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return add_footnotes(buffer.getvalue(), "Note { MERGEFIELD note }")
+
+
+def test_is_story_part():
+    for name in (
+        "/word/document.xml",
+        "word/header1.xml",
+        "/word/footer2.xml",
+        "/word/footnotes.xml",
+        "/word/endnotes.xml",
+    ):
+        assert is_story_part(name)
+    for name in ("/word/styles.xml", "/word/settings.xml", "/word/comments.xml"):
+        assert not is_story_part(name)
+
+
+def test_paragraphs_of_every_story_part_main_document_first(package):
+    stories = Stories(Document(io.BytesIO(package)))
+    names = [name for name, _ in stories.parts]
+    assert names[0] == "/word/document.xml"
+    assert {"/word/header1.xml", "/word/footer1.xml", "/word/footnotes.xml"} <= set(
+        names
+    )
+    texts = {
+        Paragraph(p, None).text: name
+        for name, p in stories.paragraphs()
+        if Paragraph(p, None).text
+    }
+    assert texts == {
+        "Krop { MERGEFIELD krop }": "/word/document.xml",
+        "Celle { MERGEFIELD celle }": "/word/document.xml",
+        "Hoved { MERGEFIELD hoved }": "/word/header1.xml",
+        "Fod { MERGEFIELD fod }": "/word/footer1.xml",
+        "Note { MERGEFIELD note }": "/word/footnotes.xml",
+    }
+
+
+def test_story_paragraphs_finds_nested_paragraphs(package):
+    doc = Document(io.BytesIO(package))
+    cell = doc.tables[0].cell(0, 0)
+    assert story_paragraphs(doc.tables[0]._tbl) == [cell.paragraphs[0]._p]
+    # The body's own paragraphs and the one in the table, in document order
+    assert [p.getparent().tag for p in story_paragraphs(doc.element.body)] == [
+        doc.element.body.tag,
+        cell._tc.tag,
+    ]
+
+
+def test_flush_writes_footnotes_back(package):
+    doc = Document(io.BytesIO(package))
+    stories = Stories(doc)
+    for name, p in stories.paragraphs():
+        if name == "/word/footnotes.xml":
+            for t in p.iter(qn("w:t")):
+                t.text = "Ændret"
+    stories.flush()
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    footnotes = zipfile.ZipFile(buffer).read("word/footnotes.xml")
+    assert "Ændret".encode() in footnotes
+
+
+def test_conversion_covers_header_footer_and_footnotes(package):
+    success, report, output = convert_text_to_mergefields_bytes(
+        package, paragraph_cache=False
+    )
+    assert success, report.error
+    assert report.counts["mergefield"] == 5
+    archive = zipfile.ZipFile(io.BytesIO(output))
+    for name, key in (
+        ("word/document.xml", "krop"),
+        ("word/document.xml", "celle"),
+        ("word/header1.xml", "hoved"),
+        ("word/footer1.xml", "fod"),
+        ("word/footnotes.xml", "note"),
+    ):
+        xml = archive.read(name).decode("utf-8")
+        assert f'<w:instrText xml:space="preserve"> MERGEFIELD {key} ' in xml
+        assert "{ MERGEFIELD" not in xml
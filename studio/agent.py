@@ -1,11 +1,12 @@
 import os
-import pandas as pd
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from langchain_openai import AzureChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph import MessagesState
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from components.mapping_cache import load_compiled_mapping
+
 # Import tool functions from tools.py
 from tools import (
     search_and_replace,
@@ -15,16 +16,9 @@ from tools import (
 
 # --- Minimal Excel mapping loader ---
 def load_excel_mapping(path):
-    try:
-        df = pd.read_excel(path, sheet_name=None)
-        # Try to find the right sheet ("query" or first sheet)
-        sheet = df["query"] if "query" in df else next(iter(df.values()))
-        # Expect columns: "Titel" and "Nøgle"
-        if "Titel" in sheet.columns and "Nøgle" in sheet.columns:
-            return dict(zip(sheet["Titel"], sheet["Nøgle"]))
-    except Exception:
-        pass
-    return {}
+    # Served from the compiled on-disk index; pandas only runs when the file changed
+    compiled = load_compiled_mapping(path)
+    return compiled.as_dict() if compiled else {}
 
 
 # Path to default mapping Excel
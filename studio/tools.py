@@ -3,21 +3,17 @@ Tool functions for document processing and mapping replacements.
 """
 
 import os
-import pandas as pd
+
+# Shared with src/components (added to the path via langgraph.json)
+from components.mapping_cache import load_compiled_mapping
+from components.matcher import compile_matcher
 
 
 # --- Minimal Excel mapping loader ---
 def load_excel_mapping(path):
-    try:
-        df = pd.read_excel(path, sheet_name=None)
-        # Try to find the right sheet ("query" or first sheet)
-        sheet = df["query"] if "query" in df else next(iter(df.values()))
-        # Expect columns: "Titel" and "Nøgle"
-        if "Titel" in sheet.columns and "Nøgle" in sheet.columns:
-            return dict(zip(sheet["Titel"], sheet["Nøgle"]))
-    except Exception:
-        pass
-    return {}
+    # Served from the compiled on-disk index; pandas only runs when the file changed
+    compiled = load_compiled_mapping(path)
+    return compiled.as_dict() if compiled else {}
 
 
 # Path to default mapping Excel (relative to this file)
@@ -49,6 +45,7 @@ def replace_titels_with_nogle(text: str, replacement_template: str) -> str:
     """
     Replace all occurrences of each 'Titel' in the mapping Excel with the replacement_template.
     If '<NØGLE>' is present in the template, it is replaced with the corresponding key (Nøgle).
+    The text is scanned once; where titles overlap, the leftmost and then longest one wins.
 
     Args:
         text (str): The input text.
@@ -57,12 +54,9 @@ def replace_titels_with_nogle(text: str, replacement_template: str) -> str:
     Returns:
         str: The modified text.
     """
-    result = text
-    for titel, nøgle in MAPPINGS_DICT.items():
-        if titel:
-            if "<NØGLE>" in replacement_template:
-                replacement = replacement_template.replace("<NØGLE>", str(nøgle))
-            else:
-                replacement = replacement_template
-            result = result.replace(str(titel), replacement)
-    return result
+    matcher = compile_matcher(MAPPINGS_DICT)
+    if "<NØGLE>" in replacement_template:
+        return matcher.sub(
+            lambda titel, nøgle: replacement_template.replace("<NØGLE>", nøgle), text
+        )
+    return matcher.sub(replacement_template, text)